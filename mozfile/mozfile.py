@@ -69,9 +69,13 @@ def extract_zip(src, dest):
             path = os.path.dirname(filename)
             if not os.path.isdir(path):
                 os.makedirs(path)
+            _src = bundle.open(name)
             _dest = open(filename, 'wb')
-            _dest.write(bundle.read(name))
-            _dest.close()
+            try:
+                shutil.copyfileobj(_src, _dest, 64 * 1024)
+            finally:
+                _dest.close()
+                _src.close()
         mode = bundle.getinfo(name).external_attr >> 16 & 0x1FF
         os.chmod(filename, mode)
     bundle.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Remember which actions have already done their work.
+
+When an action finishes successfully, CheckpointStore records a
+fingerprint of what it depended on (its config values and inputs), and
+the state of the outputs it left behind.  On a later run on the same
+machine, the action can be skipped while both still match.
+"""
+
+import hashlib
+import os
+import threading
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+
+def query_fingerprint(action, config_values, input_states):
+    """Return a hex digest of an action's name, the config values it
+    reads and the states of its inputs.
+    """
+    data = json.dumps([action, config_values, input_states],
+                      sort_keys=True, default=repr)
+    return hashlib.sha1(data).hexdigest()
+
+
+def query_directory_state(path):
+    """Return the relative path, size and mtime of every file under
+    path, ignoring compiled python and egg-info that installing from the
+    directory leaves behind.
+    """
+    state = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.endswith('.egg-info'))
+        for name in sorted(files):
+            if name.endswith(('.pyc', '.pyo')):
+                continue
+            full_path = os.path.join(root, name)
+            st = os.stat(full_path)
+            state.append([os.path.relpath(full_path, path), st.st_size,
+                          st.st_mtime])
+    return state
+
+
+def query_output_state(path):
+    """Return what has to stay the same for an output to count as
+    unchanged: a file's size and mtime, or just that a directory exists
+    (later actions may add to it).  None if it doesn't exist.
+    """
+    if os.path.isdir(path):
+        return 'directory'
+    if os.path.exists(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime]
+    return None
+
+
+# CheckpointStore {{{1
+class CheckpointStore(object):
+    """Action checkpoints, kept in a JSON file at path.
+
+    Each entry maps an action to its fingerprint and the state of its
+    outputs when it last finished successfully.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.checkpoints = {}
+        if os.path.exists(path):
+            try:
+                fh = open(path)
+                try:
+                    self.checkpoints = json.load(fh)
+                finally:
+                    fh.close()
+            except (IOError, ValueError):
+                # A corrupt store just means every action runs again.
+                self.checkpoints = {}
+
+    def is_current(self, action, fingerprint):
+        """Return True if action last finished with this fingerprint,
+        and its outputs are all still there, unchanged.
+        """
+        with self.lock:
+            checkpoint = self.checkpoints.get(action)
+        if not checkpoint or checkpoint['fingerprint'] != fingerprint:
+            return False
+        for path, state in checkpoint['outputs'].items():
+            if state is None or query_output_state(path) != state:
+                return False
+        return True
+
+    def record(self, action, fingerprint, outputs):
+        with self.lock:
+            self.checkpoints[action] = {
+                'fingerprint': fingerprint,
+                'outputs': dict((path, query_output_state(path))
+                                for path in outputs),
+            }
+        self.save()
+
+    def forget(self, action):
+        with self.lock:
+            if action not in self.checkpoints:
+                return
+            del self.checkpoints[action]
+        self.save()
+
+    def save(self):
+        """Write the checkpoints to self.path, atomically."""
+        import tempfile
+        with self.lock:
+            data = json.dumps(self.checkpoints, sort_keys=True, indent=1)
+        store_dir = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=store_dir, prefix='.checkpoints-')
+        fh = os.fdopen(fd, 'w')
+        try:
+            fh.write(data)
+        finally:
+            fh.close()
+        os.rename(tmp_path, self.path)
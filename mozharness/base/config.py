@@ -25,11 +25,12 @@ TODO:
 """
 
 from copy import deepcopy
+import hashlib
+import imp
+import marshal
 from optparse import OptionParser, Option, OptionGroup
 import os
 import sys
-import urllib2
-import socket
 import time
 try:
     import simplejson as json
@@ -65,7 +66,11 @@ class ExtendOption(Option):
 
 
 def make_immutable(item):
-    if isinstance(item, list) or isinstance(item, tuple):
+    if isinstance(item, LockedTuple) or \
+            (isinstance(item, ReadOnlyDict) and item._lock):
+        # Already immutable, so it can be shared rather than copied.
+        result = item
+    elif isinstance(item, list) or isinstance(item, tuple):
         result = LockedTuple(item)
     elif isinstance(item, dict):
         result = ReadOnlyDict(item)
@@ -78,15 +83,30 @@ def make_immutable(item):
 class LockedTuple(tuple):
     def __new__(cls, items):
         return tuple.__new__(cls, (make_immutable(x) for x in items))
+
+    def __copy__(self):
+        return self
+
     def __deepcopy__(self, memo):
         return [deepcopy(elem, memo) for elem in self]
 
 
 # ReadOnlyDict {{{1
 class ReadOnlyDict(dict):
+    """A dict that can be locked against changes.
+
+    Locking makes every value immutable too: lists and tuples become
+    LockedTuples and dicts become locked ReadOnlyDicts.  Values that are
+    already immutable are shared, not copied, so locking a dict built from
+    parts of a locked one only costs as much as the new parts.
+
+    copy.copy() of a locked ReadOnlyDict is the ReadOnlyDict itself, and
+    overlay() derives a locked copy with a few keys changed without copying
+    the rest.  copy.deepcopy() still returns a fully unlocked copy.
+    """
     def __init__(self, dictionary):
         self._lock = False
-        self.update(dictionary.copy())
+        dict.__init__(self, dictionary)
 
     def _check_lock(self):
         assert not self._lock, "ReadOnlyDict is locked!"
@@ -96,6 +116,15 @@ class ReadOnlyDict(dict):
             self[k] = make_immutable(v)
         self._lock = True
 
+    def overlay(self, *args, **kwargs):
+        """Return a locked ReadOnlyDict of self updated with args and
+        kwargs, like dict.update().  Values from self are shared.
+        """
+        result = ReadOnlyDict(self)
+        result.update(*args, **kwargs)
+        result.lock()
+        return result
+
     def __setitem__(self, *args):
         self._check_lock()
         return dict.__setitem__(self, *args)
@@ -120,9 +149,14 @@ class ReadOnlyDict(dict):
         self._check_lock()
         return dict.setdefault(self, *args)
 
-    def update(self, *args):
+    def update(self, *args, **kwargs):
         self._check_lock()
-        dict.update(self, *args)
+        dict.update(self, *args, **kwargs)
+
+    def __copy__(self):
+        if self._lock:
+            return self
+        return ReadOnlyDict(self)
 
     def __deepcopy__(self, memo):
         cls = self.__class__
@@ -135,10 +169,108 @@ class ReadOnlyDict(dict):
             result[k] = deepcopy(v, memo)
         return result
 
+# Compiled config cache {{{1
+# Bump this if what's cached changes.
+CONFIG_CACHE_VERSION = 1
+# Past this many entries, the oldest are removed as new ones are added.
+CONFIG_CACHE_MAX_ENTRIES = 500
+
+
+def query_config_cache_dir():
+    """Return the directory compiled config files are cached in, or None
+    if caching is turned off.
+
+    The cache is off unless $MOZHARNESS_CONFIG_CACHE names a directory.
+    It's read while the config files themselves are, so there's no
+    config option for it.
+    """
+    return os.environ.get('MOZHARNESS_CONFIG_CACHE') or None
+
+
+def _prune_config_cache(cache_dir, max_entries=None):
+    """Remove the oldest entries in cache_dir past max_entries."""
+    if max_entries is None:
+        max_entries = CONFIG_CACHE_MAX_ENTRIES
+    names = [n for n in os.listdir(cache_dir) if not n.startswith('.')]
+    if len(names) <= max_entries:
+        return
+    entries = []
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.isfile(path):
+                entries.append((os.path.getmtime(path), path))
+        except OSError:
+            # Another run just pruned it.
+            pass
+    entries.sort()
+    for mtime, path in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _compile_config(file_path, contents):
+    if file_path.endswith('.py'):
+        return compile(contents, file_path, 'exec')
+    return json.loads(contents)
+
+
+def query_compiled_config(file_path, contents):
+    """Return the code object for a python config file's contents, or the
+    parsed contents of a json one, from the compiled config cache if
+    they're there.
+
+    Entries are marshalled and keyed by the file's path and a hash of its
+    contents, so an edited file is never served stale, and an unchanged
+    one is a hit even if it was just extracted with a new mtime.
+
+    Python configs are cached compiled rather than evaluated: they can
+    look at os.environ or platform, so they still run every time.
+    """
+    cache_dir = query_config_cache_dir()
+    if not cache_dir:
+        return _compile_config(file_path, contents)
+    key = hashlib.sha1('\0'.join([
+        os.path.abspath(file_path), hashlib.sha1(contents).hexdigest(),
+        imp.get_magic(), json.__name__, str(CONFIG_CACHE_VERSION),
+    ])).hexdigest()
+    cache_path = os.path.join(cache_dir, key)
+    try:
+        fh = open(cache_path, 'rb')
+        try:
+            return marshal.load(fh)
+        finally:
+            fh.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        pass
+    compiled = _compile_config(file_path, contents)
+    # The cache is only an optimization; never fail because of it.
+    try:
+        import tempfile
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+        fh = os.fdopen(fd, 'wb')
+        try:
+            marshal.dump(compiled, fh)
+        finally:
+            fh.close()
+        os.rename(tmp_path, cache_path)
+        _prune_config_cache(cache_dir)
+    except (IOError, OSError, ValueError):
+        pass
+    return compiled
+
+
 # parse_config_file {{{1
 def parse_config_file(file_name, quiet=False, search_path=None,
                       config_dict_name="config"):
     """Read a config file and return a dictionary.
+
+    Parsing goes through the compiled config cache; see
+    query_compiled_config().
     """
     file_path = None
     if os.path.exists(file_name):
@@ -153,24 +285,28 @@ def parse_config_file(file_name, quiet=False, search_path=None,
                 break
         else:
             raise IOError("Can't find %s in %s!" % (file_name, search_path))
+    if not file_name.endswith(('.py', '.json')):
+        raise RuntimeError("Unknown config file type %s!" % file_name)
+    fh = open(file_path, 'rb')
+    try:
+        contents = fh.read()
+    finally:
+        fh.close()
+    compiled = query_compiled_config(file_path, contents)
     if file_name.endswith('.py'):
         global_dict = {}
         local_dict = {}
-        execfile(file_path, global_dict, local_dict)
+        exec compiled in global_dict, local_dict
         config = local_dict[config_dict_name]
-    elif file_name.endswith('.json'):
-        fh = open(file_path)
-        config = {}
-        json_config = json.load(fh)
-        config = dict(json_config)
-        fh.close()
     else:
-        raise RuntimeError("Unknown config file type %s!" % file_name)
+        config = dict(compiled)
     # TODO return file_path
     return config
 
 
 def download_config_file(url, file_name):
+    import socket
+    import urllib2
     n = 0
     attempts = 5
     sleeptime = 60
@@ -264,6 +400,27 @@ class BaseConfig(object):
             type="string", default=os.getcwd(),
             help="Specify the absolute path of the parent of the working directory"
         )
+        self.config_parser.add_option(
+            "--deferred-delete", action="store_true",
+            dest="deferred_delete", default=False,
+            help="Delete directories in the background"
+        )
+        self.config_parser.add_option(
+            "--deferred-delete-dir", action="store",
+            dest="deferred_delete_dir",
+            help="Specify the trash directory for --deferred-delete; "
+                 "defaults to .mozharness_trash next to base_work_dir"
+        )
+        self.config_parser.add_option(
+            "--parallel-actions", action="store_true",
+            dest="parallel_actions", default=False,
+            help="Run actions that don't depend on each other at the same time"
+        )
+        self.config_parser.add_option(
+            "--trace", action="store_true", dest="trace", default=False,
+            help="Write a trace of where the run's time went to "
+                 "trace.json in the upload dir"
+        )
         self.config_parser.add_option(
             "-c", "--config-file", "--cfg", action="extend", dest="config_files",
             type="string", help="Specify the config files"
@@ -305,6 +462,11 @@ class BaseConfig(object):
             dest="append_to_log", default=False,
             help="Append to the log"
         )
+        log_option_group.add_option(
+            "--async-log", action="store_true",
+            dest="async_logging", default=False,
+            help="Write the logs from a separate thread"
+        )
         log_option_group.add_option(
             "--multi-log", action="store_const", const="multi",
             dest="log_type", help="Log using MultiFileLogger"
@@ -335,6 +497,17 @@ class BaseConfig(object):
             dest="no_actions", metavar="ACTIONS",
             help="Don't perform action"
         )
+        action_option_group.add_option(
+            "--checkpoint-actions", action="store_true",
+            dest="checkpoint_actions", default=False,
+            help="Skip actions whose inputs and outputs haven't changed "
+                 "since they last succeeded"
+        )
+        action_option_group.add_option(
+            "--force-action", action="extend",
+            dest="force_actions", metavar="ACTIONS",
+            help="Run action even if its checkpoint is current"
+        )
         for action in self.all_actions:
             action_option_group.add_option(
                 "--%s" % action, action="append_const",
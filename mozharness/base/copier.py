@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Generic ways to copy and compress files quickly.
+
+copy_file() clones a file's blocks (a reflink) where the filesystem can,
+or hardlinks it if asked to, and otherwise copies it in large blocks.
+copy_tree() does the same for a whole tree across a pool of threads.
+
+gzip_file() compresses in blocks rather than lines.  With workers > 1,
+blocks are deflated independently on a pool of threads and stitched
+together into a single, standard gzip member, the way pigz does; zlib
+releases the GIL, so this scales with cores.
+"""
+
+import gzip
+import os
+import shutil
+import struct
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BLOCK_SIZE = 1024 * 1024
+# _IOW(0x94, 9, int): clone a whole file on btrfs and xfs.
+FICLONE = 0x40049409
+
+LINK = 'link'
+REFLINK = 'reflink'
+COPY = 'copy'
+
+
+# copy_file {{{1
+def reflink(src, dest):
+    """Make dest share src's blocks, copy-on-write.
+
+    Raises IOError if the platform or filesystem can't.
+    """
+    if fcntl is None or not hasattr(os, 'uname') or os.uname()[0] != 'Linux':
+        raise IOError("reflinks aren't supported here")
+    infile = open(src, 'rb')
+    try:
+        outfile = open(dest, 'wb')
+        try:
+            fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        finally:
+            outfile.close()
+    finally:
+        infile.close()
+
+
+def _samefile(src, dest):
+    """Return True if src and dest are the same file, through a hardlink,
+    a symlink or the same path, like shutil.copyfile() checks.
+    """
+    if not hasattr(os.path, 'samefile'):
+        # Windows
+        return (os.path.normcase(os.path.abspath(src)) ==
+                os.path.normcase(os.path.abspath(dest)))
+    try:
+        return os.path.samefile(src, dest)
+    except OSError:
+        return False
+
+
+def copy_file(src, dest, link=False, block_size=BLOCK_SIZE):
+    """Copy the contents of src to dest.
+
+    With `link', dest is hardlinked to src when they're on the same
+    filesystem, so only use it for copies that won't be modified in
+    place.  Otherwise dest is reflinked to src where that's supported,
+    and copied block by block where it isn't.
+
+    Returns LINK, REFLINK or COPY, depending on how it was done.  Raises
+    shutil.Error if src and dest are the same file.
+    """
+    # Checked before removing dest, which would delete src.
+    if os.path.exists(dest) and _samefile(src, dest):
+        raise shutil.Error("`%s` and `%s` are the same file" % (src, dest))
+    # dest may itself be a hardlink; writing through it would change
+    # the other copies.
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if link and hasattr(os, 'link') and not os.path.islink(src):
+        try:
+            os.link(src, dest)
+            return LINK
+        except OSError:
+            pass
+    try:
+        reflink(src, dest)
+        return REFLINK
+    except (IOError, OSError):
+        pass
+    infile = open(src, 'rb')
+    try:
+        outfile = open(dest, 'wb')
+        try:
+            shutil.copyfileobj(infile, outfile, block_size)
+        finally:
+            outfile.close()
+    finally:
+        infile.close()
+    return COPY
+
+
+# copy_tree {{{1
+def copy_tree(src, dest, link=False, workers=1):
+    """Copy the tree at src to dest, which mustn't exist, like
+    shutil.copytree(src, dest).
+
+    Directories are created up front; files are then copied with
+    copy_file() across `workers' threads, largest first, keeping their
+    permissions and times.
+
+    Returns a dict counting the files copied each way.  Raises
+    shutil.Error listing every file that couldn't be copied.
+    """
+    from multiprocessing.pool import ThreadPool
+    dirs = []
+    files = []
+    for root, dirnames, filenames in os.walk(src, followlinks=True):
+        rel = os.path.relpath(root, src)
+        dest_root = os.path.normpath(os.path.join(dest, rel))
+        os.makedirs(dest_root)
+        dirs.append((root, dest_root))
+        for name in filenames:
+            path = os.path.join(root, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            files.append((size, path, os.path.join(dest_root, name)))
+    files.sort(reverse=True)
+
+    def _copy((size, path, dest_path)):
+        try:
+            how = copy_file(path, dest_path, link=link)
+            if how != LINK:
+                shutil.copystat(path, dest_path)
+            return how, None
+        except (IOError, OSError, shutil.Error), e:
+            return None, (path, dest_path, str(e))
+
+    if workers > 1 and len(files) > 1:
+        pool = ThreadPool(min(workers, len(files)))
+        try:
+            results = pool.map(_copy, files, 16)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_copy(f) for f in files]
+    counts = {}
+    errors = []
+    for how, error in results:
+        if error:
+            errors.append(error)
+        else:
+            counts[how] = counts.get(how, 0) + 1
+    # Directory times have to be set after their contents are written.
+    for path, dest_path in reversed(dirs):
+        try:
+            shutil.copystat(path, dest_path)
+        except OSError, e:
+            errors.append((path, dest_path, str(e)))
+    if errors:
+        raise shutil.Error(errors)
+    return counts
+
+
+# gzip_file {{{1
+def _deflate_block((data, level, last)):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    flush_mode = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    return compressor.compress(data) + compressor.flush(flush_mode)
+
+
+def gzip_file(src, dest, level=6, workers=1, block_size=BLOCK_SIZE):
+    """Compress src into the gzip file dest, reading block_size bytes at
+    a time.
+
+    With workers > 1, each block is deflated on its own on a pool of
+    threads, ending in a sync flush so the blocks can be concatenated
+    into one deflate stream.  The result is a single gzip member any
+    gunzip can read, a fraction of a percent larger than one written by
+    GzipFile.
+    """
+    from multiprocessing.pool import ThreadPool
+    infile = open(src, 'rb')
+    try:
+        if workers <= 1:
+            outfile = gzip.GzipFile(dest, 'wb', level)
+            try:
+                shutil.copyfileobj(infile, outfile, block_size)
+            finally:
+                outfile.close()
+            return
+        outfile = open(dest, 'wb')
+        pool = ThreadPool(workers)
+        try:
+            # ID, CM=deflate, no flags, mtime, XFL, OS=unknown
+            outfile.write(struct.pack('<BBBBIBB', 0x1f, 0x8b, 8, 0,
+                                      int(time.time()), 0, 255))
+            crc = 0
+            size = 0
+            block = infile.read(block_size)
+            while True:
+                # Read a window of blocks at a time, so memory use is
+                # bounded by the number of workers, not the file size.
+                blocks = [block]
+                while len(blocks) < workers * 2:
+                    block = infile.read(block_size)
+                    if not block:
+                        break
+                    blocks.append(block)
+                else:
+                    block = infile.read(block_size)
+                last = not block
+                for data in blocks:
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                jobs = [(data, level, last and i == len(blocks) - 1)
+                        for i, data in enumerate(blocks)]
+                for compressed in pool.map(_deflate_block, jobs):
+                    outfile.write(compressed)
+                if last:
+                    break
+            outfile.write(struct.pack('<II', crc & 0xffffffff,
+                                      size & 0xffffffff))
+        finally:
+            pool.close()
+            pool.join()
+            outfile.close()
+    finally:
+        infile.close()
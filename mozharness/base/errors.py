@@ -28,6 +28,14 @@ from mozharness.base.log import DEBUG, WARNING, ERROR, CRITICAL, FATAL
 class VCSException(Exception):
     pass
 
+
+class HgCommandServerException(VCSException):
+    pass
+
+
+class ExtractException(Exception):
+    pass
+
 # ErrorLists {{{1
 BaseErrorList = [{
     'substr': r'''command not found''',
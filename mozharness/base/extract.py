@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Generic ways to extract archives in-process.
+
+extract_zip() extracts a zip file on disk across a pool of threads;
+zlib and file I/O release the GIL, so this scales with cores.
+
+extract_zip_stream() reads a zip file front to back from a non-seekable
+file object (e.g. a urllib2 response), so members can be written out
+while the rest of the archive is still downloading.
+"""
+
+import fnmatch
+import os
+import shutil
+import stat
+import struct
+import threading
+import time
+import zlib
+
+from mozharness.base.errors import ExtractException
+
+LOCAL_FILE_HEADER = struct.Struct('<4sHHHHHIIIHH')
+CENTRAL_DIR_HEADER = struct.Struct('<4sHHHHHHIIIHHHHHII')
+LOCAL_FILE_SIG = 'PK\x03\x04'
+CENTRAL_DIR_SIG = 'PK\x01\x02'
+DATA_DESCRIPTOR_SIG = 'PK\x07\x08'
+END_SIGS = ('PK\x05\x06', 'PK\x06\x06', 'PK\x06\x07')
+
+ZIP_STORED, ZIP_DEFLATED = 0, 8
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+ZIP64_EXTRA_ID = 0x0001
+UNIX_HOST = 3
+
+BLOCK_SIZE = 64 * 1024
+
+
+def match_zip_member(name, include=None, exclude=None):
+    """Return True if zip member `name' matches one of the unzip-style
+    `include' patterns (or include is empty) and none of `exclude'.
+    """
+    if include and not any(fnmatch.fnmatch(name, p) for p in include):
+        return False
+    if exclude and any(fnmatch.fnmatch(name, p) for p in exclude):
+        return False
+    return True
+
+
+def query_zip_member_path(dest_dir, name):
+    """Return the path to extract `name' to under dest_dir, refusing
+    absolute paths and paths that escape dest_dir.
+    """
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if name.startswith('/') or '..' in parts:
+        raise ExtractException("Refusing to extract %s outside of %s!" %
+                               (name, dest_dir))
+    return os.path.join(dest_dir, *parts)
+
+
+def _apply_zip_member_mode(path, create_system, external_attr):
+    """Apply the unix permissions stored in a zip member to the extracted
+    file at path, turning it into a symlink if that's what it was.
+    """
+    mode = external_attr >> 16
+    if create_system != UNIX_HOST:
+        return
+    if stat.S_ISLNK(mode) and hasattr(os, 'symlink'):
+        fh = open(path)
+        target = fh.read()
+        fh.close()
+        os.remove(path)
+        os.symlink(target, path)
+    elif stat.S_IMODE(mode):
+        os.chmod(path, stat.S_IMODE(mode))
+
+
+def _dos_time_to_epoch(dos_date, dos_time):
+    try:
+        return time.mktime((
+            ((dos_date >> 9) & 0x7f) + 1980, (dos_date >> 5) & 0xf,
+            dos_date & 0x1f, (dos_time >> 11) & 0x1f, (dos_time >> 5) & 0x3f,
+            (dos_time & 0x1f) * 2, 0, 0, -1))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _extract_zip_member(bundle, info, dest_dir):
+    """Extract one file member of bundle, copying it in bounded blocks.
+
+    Returns a (name, size, seconds) tuple.
+    """
+    start = time.time()
+    path = query_zip_member_path(dest_dir, info.filename)
+    if os.path.lexists(path):
+        os.remove(path)
+    src = bundle.open(info)
+    try:
+        dest = open(path, 'wb')
+        try:
+            shutil.copyfileobj(src, dest, BLOCK_SIZE)
+        finally:
+            dest.close()
+    finally:
+        src.close()
+    _apply_zip_member_mode(path, info.create_system, info.external_attr)
+    if not os.path.islink(path):
+        try:
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            os.utime(path, (mtime, mtime))
+        except (ValueError, OverflowError):
+            pass
+    return (info.filename, info.file_size, time.time() - start)
+
+
+def extract_zip(zip_path, dest_dir, include=None, exclude=None, workers=1):
+    """Extract the zip file at zip_path into dest_dir.
+
+    Only members matching the unzip-style `include' patterns (and none of
+    `exclude') are extracted.  Files are spread across `workers' threads,
+    largest first, each thread reading through its own ZipFile handle.
+    Unix permissions, symlinks and mtimes are preserved.
+
+    Returns a list of (name, size, seconds) tuples, one per extracted file.
+    """
+    from multiprocessing.pool import ThreadPool
+    import zipfile
+    bundle = zipfile.ZipFile(zip_path)
+    try:
+        infos = [i for i in bundle.infolist()
+                 if match_zip_member(i.filename, include, exclude)]
+    finally:
+        bundle.close()
+
+    # Create all the directories up front so the workers don't race.
+    dirs = set()
+    files = []
+    for info in infos:
+        path = query_zip_member_path(dest_dir, info.filename)
+        if info.filename.endswith('/'):
+            dirs.add(path)
+        else:
+            dirs.add(os.path.dirname(path))
+            files.append(info)
+    for path in sorted(dirs):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    files.sort(key=lambda i: i.file_size, reverse=True)
+
+    local = threading.local()
+    bundles = []
+
+    def _extract(info):
+        if not hasattr(local, 'bundle'):
+            local.bundle = zipfile.ZipFile(zip_path)
+            bundles.append(local.bundle)
+        return _extract_zip_member(local.bundle, info, dest_dir)
+
+    try:
+        if workers > 1 and len(files) > 1:
+            pool = ThreadPool(min(workers, len(files)))
+            try:
+                timings = list(pool.imap_unordered(_extract, files, 16))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            timings = [_extract(info) for info in files]
+    finally:
+        for b in bundles:
+            b.close()
+    return timings
+
+
+class _StreamReader(object):
+    """Buffered reader over a file object that allows pushing data back.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.buf = ''
+        self.bytes_read = 0
+
+    def read(self, n):
+        if self.buf:
+            data, self.buf = self.buf[:n], self.buf[n:]
+        else:
+            data = self.fileobj.read(n)
+            self.bytes_read += len(data)
+        return data
+
+    def read_exact(self, n):
+        chunks = []
+        while n > 0:
+            data = self.read(n)
+            if not data:
+                raise ExtractException("Unexpected end of zip stream!")
+            chunks.append(data)
+            n -= len(data)
+        return ''.join(chunks)
+
+    def unread(self, data):
+        self.buf = data + self.buf
+
+
+def _parse_zip64_extra(extra, usize, csize):
+    """Replace 0xffffffff sizes with their values from the zip64 extra
+    field.  Returns (usize, csize, is_zip64).
+    """
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, length = struct.unpack('<HH', extra[pos:pos + 4])
+        if header_id == ZIP64_EXTRA_ID:
+            data = extra[pos + 4:pos + 4 + length]
+            if usize == 0xffffffff and len(data) >= 8:
+                usize = struct.unpack('<Q', data[:8])[0]
+                data = data[8:]
+            if csize == 0xffffffff and len(data) >= 8:
+                csize = struct.unpack('<Q', data[:8])[0]
+            return usize, csize, True
+        pos += 4 + length
+    return usize, csize, False
+
+
+def _copy_member(reader, method, csize, has_descriptor, out):
+    """Copy one member's data from reader to out (a file or None to
+    discard), returning its crc32.
+    """
+    crc = 0
+    if method == ZIP_STORED:
+        if has_descriptor:
+            raise ExtractException("Can't stream stored members with data descriptors!")
+        remaining = csize
+        while remaining:
+            data = reader.read_exact(min(BLOCK_SIZE, remaining))
+            remaining -= len(data)
+            crc = zlib.crc32(data, crc)
+            if out:
+                out.write(data)
+    elif method == ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-15)
+        remaining = None if has_descriptor else csize
+        while remaining is None or remaining:
+            size = BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining)
+            data = reader.read_exact(size) if remaining else reader.read(size)
+            if not data:
+                raise ExtractException("Unexpected end of zip stream!")
+            if remaining is not None:
+                remaining -= len(data)
+            data = decompressor.decompress(data)
+            crc = zlib.crc32(data, crc)
+            if out and data:
+                out.write(data)
+            if decompressor.unused_data:
+                reader.unread(decompressor.unused_data)
+                break
+        data = decompressor.flush()
+        crc = zlib.crc32(data, crc)
+        if out and data:
+            out.write(data)
+    else:
+        raise ExtractException("Unsupported zip compression method %d!" % method)
+    return crc & 0xffffffff
+
+
+def extract_zip_stream(fileobj, dest_dir, include=None, exclude=None):
+    """Extract the zip file being read from fileobj into dest_dir.
+
+    Members are written as soon as they're read; only members matching
+    the unzip-style `include' patterns (and none of `exclude') are
+    written.  Unix permissions from the central directory are applied
+    once it arrives at the end of the stream.
+
+    Returns the list of extracted member names.
+
+    Raises ExtractException for corrupt archives and for the few layouts
+    that can't be read sequentially (encrypted members, stored members
+    with data descriptors); callers can fall back to downloading the
+    whole file and extracting it from disk.
+    """
+    reader = _StreamReader(fileobj)
+    extracted = {}
+    while True:
+        sig = reader.read_exact(4)
+        if sig == LOCAL_FILE_SIG:
+            header = LOCAL_FILE_HEADER.unpack(sig + reader.read_exact(LOCAL_FILE_HEADER.size - 4))
+            (_, _, flags, method, dos_time, dos_date, crc, csize, usize,
+             name_len, extra_len) = header
+            name = reader.read_exact(name_len)
+            extra = reader.read_exact(extra_len)
+            if flags & FLAG_ENCRYPTED:
+                raise ExtractException("Can't extract encrypted member %s!" % name)
+            if flags & FLAG_UTF8:
+                name = name.decode('utf-8')
+            usize, csize, is_zip64 = _parse_zip64_extra(extra, usize, csize)
+            has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+            wanted = match_zip_member(name, include, exclude)
+            out = None
+            path = None
+            if wanted:
+                path = query_zip_member_path(dest_dir, name)
+                if name.endswith('/'):
+                    if not os.path.isdir(path):
+                        os.makedirs(path)
+                else:
+                    parent = os.path.dirname(path)
+                    if not os.path.isdir(parent):
+                        os.makedirs(parent)
+                    if os.path.lexists(path):
+                        os.remove(path)
+                    out = open(path, 'wb')
+            try:
+                got_crc = _copy_member(reader, method, csize, has_descriptor, out)
+            finally:
+                if out:
+                    out.close()
+            if has_descriptor:
+                data = reader.read_exact(4)
+                if data == DATA_DESCRIPTOR_SIG:
+                    data = reader.read_exact(4)
+                crc = struct.unpack('<I', data)[0]
+                reader.read_exact(16 if is_zip64 else 8)
+            if got_crc != crc:
+                raise ExtractException("Bad CRC for %s in zip stream!" % name)
+            if wanted:
+                mtime = _dos_time_to_epoch(dos_date, dos_time)
+                if mtime is not None:
+                    os.utime(path, (mtime, mtime))
+                extracted[name] = path
+        elif sig == CENTRAL_DIR_SIG:
+            header = CENTRAL_DIR_HEADER.unpack(sig + reader.read_exact(CENTRAL_DIR_HEADER.size - 4))
+            made_by, flags = header[1], header[3]
+            name_len, extra_len, comment_len = header[10:13]
+            external_attr = header[15]
+            name = reader.read_exact(name_len)
+            reader.read_exact(extra_len + comment_len)
+            if flags & FLAG_UTF8:
+                name = name.decode('utf-8')
+            if name in extracted:
+                _apply_zip_member_mode(extracted[name], made_by >> 8,
+                                       external_attr)
+        elif sig in END_SIGS:
+            # Drain the end records so the download completes.
+            while reader.read(BLOCK_SIZE):
+                pass
+            break
+        else:
+            raise ExtractException("Bad zip signature %r at byte %d!" %
+                                   (sig, reader.bytes_read))
+    return extracted.keys()
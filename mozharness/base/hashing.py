@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Generic ways to hash files.
+
+HashService hashes files in fixed-size blocks, many files at once across
+a pool of threads (hashlib releases the GIL), and remembers every digest
+keyed by the file's path, size, mtime and inode.  Asking again for a file
+that hasn't changed, in this run or a later one sharing the cache file,
+doesn't read it at all.
+"""
+
+import hashlib
+import os
+import threading
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path, hash_type='sha512', block_size=BLOCK_SIZE):
+    """Return the hex digest of the file at path, reading it block_size
+    bytes at a time.
+    """
+    m = hashlib.new(hash_type)
+    fh = open(path, 'rb')
+    try:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+            m.update(block)
+    finally:
+        fh.close()
+    return m.hexdigest()
+
+
+def _query_stat_key(st):
+    return [st.st_size, st.st_mtime, st.st_ino]
+
+
+# HashService {{{1
+class HashService(object):
+    """Hash files, remembering the results.
+
+    If cache_file is set, digests are loaded from and saved to it, so
+    they carry over between steps and runs.  A digest is only reused if
+    the file's size, mtime and inode all still match.
+    """
+    def __init__(self, cache_file=None, workers=1):
+        self.cache_file = cache_file
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.digests = {}
+        if cache_file and os.path.exists(cache_file):
+            try:
+                fh = open(cache_file)
+                try:
+                    self.digests = json.load(fh)
+                finally:
+                    fh.close()
+            except (IOError, ValueError):
+                # A corrupt cache is just an empty one.
+                self.digests = {}
+
+    def _key(self, path, hash_type):
+        return '%s:%s' % (hash_type, os.path.abspath(path))
+
+    def _lookup(self, path, hash_type):
+        st = os.stat(path)
+        with self.lock:
+            entry = self.digests.get(self._key(path, hash_type))
+        if entry and entry['stat'] == _query_stat_key(st):
+            return entry['digest'], st
+        return None, st
+
+    def _hash(self, (path, hash_type)):
+        digest, st = self._lookup(path, hash_type)
+        if digest:
+            return digest, False
+        digest = hash_file(path, hash_type)
+        # If the file changed while we were reading it, don't remember
+        # a digest for contents that no longer exist.
+        if _query_stat_key(os.stat(path)) == _query_stat_key(st):
+            with self.lock:
+                self.digests[self._key(path, hash_type)] = {
+                    'stat': _query_stat_key(st), 'digest': digest,
+                }
+        return digest, True
+
+    def query_hashes(self, paths, hash_type='sha512'):
+        """Return a dict mapping each of paths to its hex digest.
+
+        Files that aren't cached are hashed across self.workers threads,
+        largest first.  Raises IOError or OSError if a file can't be read.
+        """
+        from multiprocessing.pool import ThreadPool
+        paths = sorted(set(paths), key=lambda p: os.path.getsize(p),
+                       reverse=True)
+        jobs = [(path, hash_type) for path in paths]
+        if self.workers > 1 and len(jobs) > 1:
+            pool = ThreadPool(min(self.workers, len(jobs)))
+            try:
+                results = pool.map(self._hash, jobs, 1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self._hash(job) for job in jobs]
+        if any(hashed for digest, hashed in results):
+            self.save()
+        return dict(zip(paths, [digest for digest, hashed in results]))
+
+    def query_hash(self, path, hash_type='sha512'):
+        return self.query_hashes([path], hash_type=hash_type)[path]
+
+    def save(self):
+        """Write the digests to cache_file, atomically, dropping entries
+        for files that no longer exist.
+        """
+        import tempfile
+        if not self.cache_file:
+            return
+        with self.lock:
+            digests = dict(self.digests)
+        for key in digests.keys():
+            if not os.path.exists(key.split(':', 1)[1]):
+                del digests[key]
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.hashes-')
+        fh = os.fdopen(fd, 'w')
+        try:
+            json.dump(digests, fh)
+        finally:
+            fh.close()
+        os.rename(tmp_path, self.cache_file)
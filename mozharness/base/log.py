@@ -14,7 +14,13 @@ TODO:
 from datetime import datetime
 import logging
 import os
+import Queue
+import re
+import sre_constants
+import sre_parse
 import sys
+import threading
+import time
 import traceback
 
 # Define our own FATAL_LEVEL
@@ -120,6 +126,130 @@ class LogMixin(object):
         pass
 
 
+# ErrorListMatcher {{{1
+def _query_required_literal(regex):
+    """Return the longest run of literal characters that every match of
+    regex must contain, or None.
+    """
+    if regex.flags & re.IGNORECASE:
+        return None
+    best = run = u''
+    for op, av in sre_parse.parse(regex.pattern, regex.flags):
+        if op == sre_constants.LITERAL and av < 128:
+            run += unichr(av)
+            continue
+        if len(run) > len(best):
+            best = run
+        run = u''
+    if len(run) > len(best):
+        best = run
+    return best or None
+
+
+class ErrorListMatcher(object):
+    """Find the first entry of an error_list that matches a line.
+
+    Most lines match nothing.  query_candidates() scans a whole batch of
+    lines at once, with one str.find() pass per entry's substring (or the
+    longest literal its regex requires), and returns the indexes of the
+    few lines that might match.  Only those need to go through match(),
+    which walks the list in order so the first matching entry still wins.
+
+    Use query_error_list_matcher() to share matchers between parsers.
+    """
+    def __init__(self, error_list):
+        self.error_list = error_list
+        self.literals = []
+        self.other_regexes = []
+        self.can_prefilter = True
+        for error_check in error_list:
+            if 'substr' in error_check:
+                substr = error_check['substr']
+                if isinstance(substr, str):
+                    try:
+                        substr.decode('ascii')
+                    except UnicodeError:
+                        # Can't be compared with unicode lines.
+                        self.can_prefilter = False
+                self.literals.append(substr)
+            elif 'regex' in error_check:
+                regex = error_check['regex']
+                literal = _query_required_literal(regex)
+                if literal:
+                    self.literals.append(literal)
+                else:
+                    self.other_regexes.append(regex)
+            else:
+                # Walk every line so the warning still gets logged.
+                self.can_prefilter = False
+
+    def match(self, line, warn=None):
+        """Return the first error_check in the error_list that matches
+        line, or None.  warn(message) is called for malformed entries.
+        """
+        for error_check in self.error_list:
+            if 'substr' in error_check:
+                if error_check['substr'] in line:
+                    return error_check
+            elif 'regex' in error_check:
+                if error_check['regex'].search(line):
+                    return error_check
+            elif warn:
+                warn("error_list: 'substr' and 'regex' not in %s" %
+                     error_check)
+        return None
+
+    def query_candidates(self, lines):
+        """Return the set of indexes of lines that might match an entry,
+        or None if every line has to be checked.
+        """
+        if not self.can_prefilter:
+            return None
+        text = '\n'.join(lines)
+        positions = []
+        for literal in self.literals:
+            pos = text.find(literal)
+            while pos != -1:
+                positions.append(pos)
+                pos = text.find(literal, pos + 1)
+        candidates = set()
+        line_index = last_pos = 0
+        for pos in sorted(positions):
+            line_index += text.count('\n', last_pos, pos)
+            last_pos = pos
+            candidates.add(line_index)
+        if self.other_regexes:
+            for index, line in enumerate(lines):
+                if index not in candidates:
+                    for regex in self.other_regexes:
+                        if regex.search(line):
+                            candidates.add(index)
+                            break
+        return candidates
+
+
+_error_list_matchers = {}
+MAX_CACHED_MATCHERS = 100
+
+
+def query_error_list_matcher(error_list):
+    """Return a cached ErrorListMatcher for error_list.
+
+    The cache is keyed on the identity of the list's entries rather than
+    of the list itself, so lists built by concatenating the same entries
+    (e.g. BaseErrorList + [...]) in several places share a matcher.
+    """
+    key = tuple(id(error_check) for error_check in error_list)
+    cached = _error_list_matchers.get(key)
+    if cached is not None:
+        return cached
+    if len(_error_list_matchers) >= MAX_CACHED_MATCHERS:
+        _error_list_matchers.clear()
+    matcher = ErrorListMatcher(list(error_list))
+    _error_list_matchers[key] = matcher
+    return matcher
+
+
 # OutputParser {{{1
 class OutputParser(LogMixin):
     """ Helper object to parse command output.
@@ -140,6 +270,10 @@ otherwise store a list of dictionaries in self.context_buffer that is
 buffered up to self.num_pre_context_lines (set to the largest
 pre-context-line setting in error_list.)
 """
+    _error_list_matcher = None
+    _matched_error_list = None
+    _unmatched_line = None
+
     def __init__(self, config=None, log_obj=None, error_list=None, log_output=True):
         self.config = config
         self.log_obj = log_obj
@@ -154,36 +288,38 @@ pre-context-line setting in error_list.)
         self.num_post_context_lines = 0
         self.worst_log_level = INFO
 
+    def _query_error_list_matcher(self):
+        # self.error_list may be replaced or extended after __init__.
+        if self._error_list_matcher is None or \
+                self._matched_error_list is not self.error_list or \
+                len(self._error_list_matcher.error_list) != len(self.error_list):
+            self._error_list_matcher = query_error_list_matcher(self.error_list)
+            self._matched_error_list = self.error_list
+        return self._error_list_matcher
+
     def parse_single_line(self, line):
-        for error_check in self.error_list:
-            # TODO buffer for context_lines.
-            match = False
-            if 'substr' in error_check:
-                if error_check['substr'] in line:
-                    match = True
-            elif 'regex' in error_check:
-                if error_check['regex'].search(line):
-                    match = True
-            else:
-                self.warning("error_list: 'substr' and 'regex' not in %s" %
-                             error_check)
-            if match:
-                log_level = error_check.get('level', INFO)
-                if self.log_output:
-                    message = ' %s' % line
-                    if error_check.get('explanation'):
-                        message += '\n %s' % error_check['explanation']
-                    if error_check.get('summary'):
-                        self.add_summary(message, level=log_level)
-                    else:
-                        self.log(message, level=log_level)
-                if log_level in (ERROR, CRITICAL, FATAL):
-                    self.num_errors += 1
-                if log_level == WARNING:
-                    self.num_warnings += 1
-                self.worst_log_level = self.worst_level(log_level,
-                                                        self.worst_log_level)
-                break
+        # TODO buffer for context_lines.
+        if line is self._unmatched_line:
+            # add_lines() already knows this line matches nothing.
+            error_check = None
+        else:
+            error_check = self._query_error_list_matcher().match(line, warn=self.warning)
+        if error_check is not None:
+            log_level = error_check.get('level', INFO)
+            if self.log_output:
+                message = ' %s' % line
+                if error_check.get('explanation'):
+                    message += '\n %s' % error_check['explanation']
+                if error_check.get('summary'):
+                    self.add_summary(message, level=log_level)
+                else:
+                    self.log(message, level=log_level)
+            if log_level in (ERROR, CRITICAL, FATAL):
+                self.num_errors += 1
+            if log_level == WARNING:
+                self.num_warnings += 1
+            self.worst_log_level = self.worst_level(log_level,
+                                                    self.worst_log_level)
         else:
             if self.log_output:
                 self.info(' %s' % line)
@@ -191,11 +327,155 @@ pre-context-line setting in error_list.)
     def add_lines(self, output):
         if isinstance(output, basestring):
             output = [output]
+        lines = []
         for line in output:
             if not line or line.isspace():
                 continue
-            line = line.decode("utf-8", 'replace').rstrip()
-            self.parse_single_line(line)
+            lines.append(line.decode("utf-8", 'replace').rstrip())
+        candidates = self._query_error_list_matcher().query_candidates(lines)
+        try:
+            for index, line in enumerate(lines):
+                if candidates is not None and index not in candidates:
+                    self._unmatched_line = line
+                self.parse_single_line(line)
+                self._unmatched_line = None
+        finally:
+            self._unmatched_line = None
+
+
+# LogFormatter {{{1
+class LogFormatter(logging.Formatter):
+    """A logging.Formatter that remembers the last timestamp it formatted;
+    with a date format of one-second resolution, consecutive records
+    within the same second share it instead of calling strftime() again.
+    """
+    def __init__(self, fmt=None, datefmt=None):
+        logging.Formatter.__init__(self, fmt, datefmt)
+        self.last_time = (None, None)
+
+    def formatTime(self, record, datefmt=None):
+        if not datefmt:
+            return logging.Formatter.formatTime(self, record, datefmt)
+        second = int(record.created)
+        if self.last_time[0] != second:
+            self.last_time = (second, logging.Formatter.formatTime(self, record, datefmt))
+        return self.last_time[1]
+
+
+# AsyncLogHandler {{{1
+class _LogTarget(object):
+    """A stream, or a file that's (re)opened on demand, written to by
+    AsyncLogHandler.
+    """
+    def __init__(self, level, formatter, path=None, stream=None):
+        self.level = level
+        self.formatter = formatter
+        self.path = path
+        self.stream = stream
+
+    def write(self, data):
+        if self.stream is None:
+            self.stream = open(self.path, 'ab')
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        if self.path and self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class AsyncLogHandler(logging.Handler):
+    """A logging.Handler that only queues records.
+
+    A writer thread takes them off the queue in batches, formats each
+    record once per formatter, and does a single write per target per
+    batch, so slow disks don't hold up the caller.  flush() blocks until everything queued so far is written;
+    logging.shutdown() (run at exit) flushes and closes it.
+    """
+    max_batch_size = 1000
+    # After the first record of a batch arrives, give the caller this long
+    # to queue more, rather than waking up and writing once per record.
+    batch_interval = 0.05
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.queue = Queue.Queue()
+        self.targets = []
+        self.thread = None
+
+    def add_target(self, level, formatter, path=None, stream=None):
+        self.targets.append(_LogTarget(level, formatter, path=path, stream=stream))
+
+    def emit(self, record):
+        if self.thread is None:
+            if not self.targets:
+                return
+            self.thread = threading.Thread(target=self._run,
+                                           name='AsyncLogHandler')
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(record)
+
+    def _drain(self, records):
+        try:
+            while len(records) < self.max_batch_size:
+                records.append(self.queue.get_nowait())
+        except Queue.Empty:
+            pass
+
+    def _run(self):
+        while True:
+            records = [self.queue.get()]
+            self._drain(records)
+            if len(records) < self.max_batch_size and None not in records:
+                time.sleep(self.batch_interval)
+                self._drain(records)
+            try:
+                self._write([r for r in records if r is not None])
+            finally:
+                for r in records:
+                    self.queue.task_done()
+            if None in records:
+                return
+
+    def _write(self, records):
+        buffers = [[] for target in self.targets]
+        for record in records:
+            formatted = {}
+            for target, buf in zip(self.targets, buffers):
+                if record.levelno < target.level:
+                    continue
+                line = formatted.get(target.formatter)
+                if line is None:
+                    try:
+                        line = target.formatter.format(record) + '\n'
+                        if isinstance(line, unicode):
+                            line = line.encode('utf-8')
+                    except Exception:
+                        self.handleError(record)
+                        line = ''
+                    formatted[target.formatter] = line
+                buf.append(line)
+        for target, buf in zip(self.targets, buffers):
+            if buf:
+                try:
+                    target.write(''.join(buf))
+                except (IOError, OSError):
+                    self.handleError(records[0])
+
+    def flush(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+        for target in self.targets:
+            target.close()
+        logging.Handler.close(self)
 
 
 # BaseLogger {{{1
@@ -225,6 +505,7 @@ class BaseLogger(object):
         log_to_raw=False,
         logger_name='',
         append_to_log=False,
+        async_logging=False,
     ):
         self.log_format = log_format
         self.log_date_format = log_date_format
@@ -234,6 +515,10 @@ class BaseLogger(object):
         self.log_name = log_name
         self.log_dir = log_dir
         self.append_to_log = append_to_log
+        # Write log files from a separate thread; see AsyncLogHandler.
+        self.async_logging = async_logging
+        self.async_handler = None
+        self.formatters = {}
 
         # Not sure what I'm going to use this for; useless unless we
         # can have multiple logging objects that don't trample each other
@@ -241,9 +526,17 @@ class BaseLogger(object):
 
         self.all_handlers = []
         self.log_files = {}
+        # Per-thread line prefixes; see set_thread_prefix().
+        self.thread_state = threading.local()
 
         self.create_log_dir()
 
+    def set_thread_prefix(self, prefix):
+        """Start every line logged from the calling thread with prefix,
+        e.g. the name of the action it's running.  None turns it off.
+        """
+        self.thread_state.prefix = prefix
+
     def create_log_dir(self):
         if os.path.exists(self.log_dir):
             if not os.path.isdir(self.log_dir):
@@ -269,7 +562,12 @@ class BaseLogger(object):
             log_format = self.log_format
         if not date_format:
             date_format = self.log_date_format
-        return logging.Formatter(log_format, date_format)
+        # Share formatters, so AsyncLogHandler formats each record once
+        # per format rather than once per file.
+        if (log_format, date_format) not in self.formatters:
+            self.formatters[(log_format, date_format)] = \
+                LogFormatter(log_format, date_format)
+        return self.formatters[(log_format, date_format)]
 
     def new_logger(self, logger_name):
         """Create a new logger.
@@ -278,6 +576,10 @@ class BaseLogger(object):
         self.logger = logging.getLogger(logger_name)
         self.logger.setLevel(self.get_logger_level())
         self._clear_handlers()
+        if self.async_logging:
+            self.async_handler = AsyncLogHandler()
+            self.logger.addHandler(self.async_handler)
+            self.all_handlers.append(self.async_handler)
         if self.log_to_console:
             self.add_console_handler()
         if self.log_to_raw:
@@ -294,7 +596,10 @@ class BaseLogger(object):
         if 'all_handlers' in attrs and 'logger' in attrs:
             for handler in self.all_handlers:
                 self.logger.removeHandler(handler)
+                if handler is self.async_handler:
+                    handler.close()
             self.all_handlers = []
+            self.async_handler = None
 
     def __del__(self):
         logging.shutdown()
@@ -302,6 +607,13 @@ class BaseLogger(object):
 
     def add_console_handler(self, log_level=None, log_format=None,
                             date_format=None):
+        if self.async_handler:
+            self.async_handler.add_target(
+                self.get_logger_level(log_level),
+                self.get_log_formatter(log_format=log_format,
+                                       date_format=date_format),
+                stream=sys.stderr)
+            return
         console_handler = logging.StreamHandler()
         console_handler.setLevel(self.get_logger_level(log_level))
         console_handler.setFormatter(self.get_log_formatter(log_format=log_format,
@@ -313,6 +625,13 @@ class BaseLogger(object):
                          date_format=None):
         if not self.append_to_log and os.path.exists(log_path):
             os.remove(log_path)
+        if self.async_handler:
+            self.async_handler.add_target(
+                self.get_logger_level(log_level),
+                self.get_log_formatter(log_format=log_format,
+                                       date_format=date_format),
+                path=log_path)
+            return
         file_handler = logging.FileHandler(log_path)
         file_handler.setLevel(self.get_logger_level(log_level))
         file_handler.setFormatter(self.get_log_formatter(log_format=log_format,
@@ -330,15 +649,30 @@ class BaseLogger(object):
         """
         if level == IGNORE:
             return
-        for line in message.splitlines():
-            self.logger.log(self.get_logger_level(level), line)
+        logger_level = self.get_logger_level(level)
+        if self.logger.isEnabledFor(logger_level):
+            prefix = getattr(self.thread_state, 'prefix', None) or ''
+            for line in message.splitlines():
+                # Skip Logger.log()'s stack walk for the caller's file and
+                # line; our formats don't use them.
+                self.logger.handle(self.logger.makeRecord(
+                    self.logger.name, logger_level, "(unknown file)", 0,
+                    prefix + line, None, None))
         if level == FATAL:
             if callable(post_fatal_callback):
                 self.logger.log(FATAL_LEVEL, "Running post_fatal callback...")
                 post_fatal_callback(message=message, exit_code=exit_code)
             self.logger.log(FATAL_LEVEL, 'Exiting %d' % exit_code)
+            self.flush()
             raise SystemExit(exit_code)
 
+    def flush(self):
+        """Make sure everything logged so far is written out, e.g. before
+        reading or copying the log files.
+        """
+        for handler in self.all_handlers:
+            handler.flush()
+
 
 # SimpleFileLogger {{{1
 class SimpleFileLogger(BaseLogger):
@@ -388,6 +722,30 @@ class MultiFileLogger(BaseLogger):
                                       log_level=level)
 
 
+# BufferedLogger {{{1
+class BufferedLogger(object):
+    """Hold log messages in memory until they're replayed into another
+    log object, so output from commands running in parallel can be
+    logged as contiguous blocks.
+
+    Fatal messages are held like any other; the fatal exit happens when
+    they're replayed.
+    """
+    def __init__(self):
+        self.messages = []
+
+    def log_message(self, message, level=INFO, exit_code=-1, post_fatal_callback=None):
+        if level == IGNORE:
+            return
+        self.messages.append((message, level, exit_code))
+
+    def replay(self, log_mixin):
+        """Log the held messages through log_mixin.log(), then forget them."""
+        messages, self.messages = self.messages, []
+        for message, level, exit_code in messages:
+            log_mixin.log(message, level=level, exit_code=exit_code)
+
+
 # __main__ {{{1
 if __name__ == '__main__':
     pass
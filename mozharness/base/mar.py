@@ -13,11 +13,11 @@ import os
 import sys
 import tempfile
 import ConfigParser
-import copy
 
 # load modules from parent dir
 sys.path.insert(1, os.path.dirname(sys.path[0]))
 
+from mozharness.base.config import make_immutable
 from mozharness.base.log import LogMixin
 from mozharness.base.script import ScriptMixin
 
@@ -33,6 +33,7 @@ CONFIG = {
 
 def tools_environment(base_dir, binaries, env):
     """returns the env setting required to run mar and/or mbsdiff"""
+    env = dict(env)
     # bad code here - FIXIT
     for binary in binaries:
         binary_name = binary.replace(".exe", "").upper()
@@ -188,4 +189,4 @@ class MarScripts(object):
         self.ini_file = ini_file
         self.mar_binaries = mar_binaries
         # what happens in mar.py stays in mar.py
-        self.env = copy.deepcopy(env)
+        self.env = make_immutable(env)
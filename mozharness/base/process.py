@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Generic helpers for reading subprocess output.
+
+pump_output() reads a process' stdout in large chunks as soon as it's
+available, splits it into lines in bulk and hands them to a callback in
+batches, killing the process if it goes quiet for too long or runs past
+its deadline.  There are no polling sleeps: on posix it blocks in
+poll()/select() until there's output or a timeout expires; on Windows,
+where pipes can't be selected on, a reader thread feeds a queue.
+"""
+
+import collections
+import os
+import Queue
+import select
+import signal
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+# Lines longer than this are handed over in pieces rather than buffered
+# forever, e.g. progress bars that only ever emit '\r'.
+MAX_LINE_LENGTH = 1024 * 1024
+
+# How much of a stream OutputBuffer keeps in memory by default.
+MAX_BUFFER_SIZE = 16 * 1024 * 1024
+
+OUTPUT_TIMEOUT = 'output_timeout'
+MAX_TIME = 'max_time'
+
+
+# Readers {{{1
+class _PollReader(object):
+    """Read chunks from pipes, blocking in poll() or select()."""
+    def __init__(self, fileobjs, chunk_size=CHUNK_SIZE):
+        self.fds = dict((f.fileno(), i) for i, f in enumerate(fileobjs))
+        self.chunk_size = chunk_size
+        self.poller = None
+        if hasattr(select, 'poll'):
+            self.poller = select.poll()
+            for fd in self.fds:
+                self.poller.register(fd, select.POLLIN | select.POLLPRI |
+                                     select.POLLHUP | select.POLLERR)
+
+    def _wait(self, timeout):
+        while True:
+            try:
+                if self.poller:
+                    if timeout is not None:
+                        # poll() wants whole milliseconds; round up so we
+                        # don't spin until the deadline.
+                        timeout = int(timeout * 1000) + 1
+                    return [fd for (fd, event) in self.poller.poll(timeout)]
+                return select.select(self.fds.keys(), [], [], timeout)[0]
+            except (select.error, IOError, OSError), e:
+                # Retry if we were interrupted by a signal.
+                if e.args[0] != 4:
+                    raise
+
+    def is_open(self):
+        return bool(self.fds)
+
+    def read(self, timeout=None):
+        """Return (index, chunk) for the next pipe with output, where
+        chunk is '' at that pipe's EOF, or None if nothing arrived within
+        timeout seconds.
+        """
+        ready = self._wait(timeout)
+        if not ready:
+            return None
+        fd = ready[0]
+        data = os.read(fd, self.chunk_size)
+        index = self.fds[fd]
+        if not data:
+            del self.fds[fd]
+            if self.poller:
+                self.poller.unregister(fd)
+        return index, data
+
+
+class _ThreadReader(object):
+    """Read chunks from pipes in background threads."""
+    def __init__(self, fileobjs, chunk_size=CHUNK_SIZE):
+        self.queue = Queue.Queue()
+        self.open_count = len(fileobjs)
+        for index, fileobj in enumerate(fileobjs):
+            thread = threading.Thread(target=self._read,
+                                      args=(index, fileobj.fileno(),
+                                            chunk_size))
+            thread.daemon = True
+            thread.start()
+
+    def _read(self, index, fd, chunk_size):
+        while True:
+            try:
+                data = os.read(fd, chunk_size)
+            except (IOError, OSError):
+                data = ''
+            self.queue.put((index, data))
+            if not data:
+                break
+
+    def is_open(self):
+        return self.open_count > 0
+
+    def read(self, timeout=None):
+        try:
+            index, data = self.queue.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+        if not data:
+            self.open_count -= 1
+        return index, data
+
+
+# LineSplitter {{{1
+class LineSplitter(object):
+    """Split chunks of output into lines, calling callback with a list of
+    every complete line in each chunk.
+    """
+    def __init__(self, callback, max_line_length=MAX_LINE_LENGTH):
+        self.callback = callback
+        self.max_line_length = max_line_length
+        self.partial = ''
+
+    def feed(self, data):
+        if self.partial:
+            data = self.partial + data
+        lines = data.split('\n')
+        self.partial = lines.pop()
+        if len(self.partial) > self.max_line_length:
+            lines.append(self.partial)
+            self.partial = ''
+        if lines:
+            self.callback(lines)
+
+    def flush(self):
+        if self.partial:
+            partial, self.partial = self.partial, ''
+            self.callback([partial])
+
+
+# OutputBuffer {{{1
+class OutputBuffer(object):
+    """Collect a stream's output in memory, up to max_size bytes.
+
+    Past max_size the output is spilled to spill_file_name if that's set
+    (max_size=0 writes straight to it); otherwise anything past max_size
+    is dropped.  With head and/or tail set, only the first `head' and the
+    last `tail' lines are kept in memory, though with max_size=0 the
+    spill file still gets everything.
+    """
+    def __init__(self, max_size=MAX_BUFFER_SIZE, spill_file_name=None,
+                 head=None, tail=None):
+        self.max_size = max_size
+        self.spill_file_name = spill_file_name
+        self.spill_file = None
+        self.chunks = []
+        self.size = 0
+        self.dropped_bytes = 0
+        self.dropped_lines = 0
+        self.splitter = None
+        if head is not None or tail is not None:
+            self.head = head or 0
+            self.head_lines = []
+            self.tail_lines = collections.deque(maxlen=tail or 0)
+            self.splitter = LineSplitter(self._add_lines)
+        if spill_file_name and max_size == 0:
+            self.spill_file = open(spill_file_name, 'wb')
+
+    def _add_lines(self, lines):
+        for line in lines:
+            if len(self.head_lines) < self.head:
+                self.head_lines.append(line)
+                continue
+            if len(self.tail_lines) == self.tail_lines.maxlen:
+                self.dropped_lines += 1
+            if self.tail_lines.maxlen:
+                self.tail_lines.append(line)
+
+    def write(self, data):
+        if self.splitter:
+            self.splitter.feed(data)
+            if self.spill_file:
+                self.spill_file.write(data)
+        elif self.spill_file:
+            self.spill_file.write(data)
+        elif self.max_size is not None and self.size + len(data) > self.max_size:
+            if self.spill_file_name:
+                self.spill_file = open(self.spill_file_name, 'wb')
+                self.spill_file.writelines(self.chunks)
+                self.spill_file.write(data)
+                self.chunks = []
+                self.size = 0
+            else:
+                keep = self.max_size - self.size
+                self.dropped_bytes += len(data) - keep
+                if keep:
+                    self.chunks.append(data[:keep])
+                    self.size += keep
+        else:
+            self.chunks.append(data)
+            self.size += len(data)
+
+    def is_spilled(self):
+        return self.spill_file is not None
+
+    def close(self):
+        if self.splitter:
+            self.splitter.flush()
+        if self.spill_file and not self.spill_file.closed:
+            self.spill_file.close()
+
+    def getvalue(self):
+        """Return everything that was kept in memory, or spilled without
+        head or tail set."""
+        self.close()
+        if self.splitter:
+            lines = self.head_lines + list(self.tail_lines)
+            if not lines:
+                return ''
+            return '\n'.join(lines) + '\n'
+        if self.spill_file:
+            fh = open(self.spill_file_name, 'rb')
+            try:
+                return fh.read()
+            finally:
+                fh.close()
+        return ''.join(self.chunks)
+
+
+# Helper functions {{{1
+def kill_process(proc):
+    """Kill proc and, if it leads its own process group, its children."""
+    try:
+        if hasattr(os, 'killpg') and os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        # It already exited.
+        pass
+
+
+def pump_streams(proc, fileobjs, callbacks, output_timeout=None,
+                 max_time=None, chunk_size=CHUNK_SIZE, before_wait=None):
+    """Read each of proc's pipes in fileobjs until EOF, calling the
+    matching callback with every chunk read from it, then wait for proc
+    to exit.  before_wait, if set, is called in between, while proc's
+    /proc entry is still there.
+
+    If proc produces no output for output_timeout seconds, or is still
+    running after max_time seconds, it's killed.  Start proc in its own
+    process group (preexec_fn=os.setpgrp) to kill its children as well.
+
+    Returns None, or OUTPUT_TIMEOUT or MAX_TIME if proc was killed.
+    """
+    if os.name == 'nt':
+        reader = _ThreadReader(fileobjs, chunk_size)
+    else:
+        reader = _PollReader(fileobjs, chunk_size)
+    start = last_output = time.time()
+    timed_out = None
+    while reader.is_open():
+        timeout = None
+        now = time.time()
+        if output_timeout:
+            timeout = last_output + output_timeout - now
+            timed_out = OUTPUT_TIMEOUT
+        if max_time and (timeout is None or start + max_time - now < timeout):
+            timeout = start + max_time - now
+            timed_out = MAX_TIME
+        if timeout is not None and timeout <= 0:
+            kill_process(proc)
+            break
+        result = reader.read(timeout)
+        if result is None:
+            continue
+        index, data = result
+        if data:
+            last_output = time.time()
+            callbacks[index](data)
+    else:
+        timed_out = None
+    if before_wait:
+        before_wait()
+    proc.wait()
+    return timed_out
+
+
+def pump_output(proc, callback, output_timeout=None, max_time=None,
+                chunk_size=CHUNK_SIZE, before_wait=None):
+    """Read proc.stdout until EOF, calling callback with batches of lines,
+    then wait for proc to exit.  See pump_streams() for the timeouts and
+    before_wait.
+
+    Returns None, or OUTPUT_TIMEOUT or MAX_TIME if proc was killed.
+    """
+    splitter = LineSplitter(callback)
+    try:
+        return pump_streams(proc, [proc.stdout], [splitter.feed],
+                            output_timeout=output_timeout,
+                            max_time=max_time, chunk_size=chunk_size,
+                            before_wait=before_wait)
+    finally:
+        splitter.flush()
@@ -15,6 +15,7 @@ from mozharness.base.script import (
     PostScriptAction,
     PostScriptRun,
     PreScriptAction,
+    PreScriptRun,
 )
 from mozharness.base.errors import VirtualenvErrorList
 from mozharness.base.log import WARNING, FATAL
@@ -87,6 +88,36 @@ class VirtualenvMixin(object):
         self._virtualenv_modules.append((name, url, method, requirements,
                                          optional, two_pass, editable))
 
+    def query_action_checkpoint(self, action):
+        """create-virtualenv only has to run again if the modules or
+        requirements files it installs, or the config it reads, change,
+        or the virtualenv's python goes away.
+        """
+        if action != 'create-virtualenv':
+            return super(VirtualenvMixin, self).query_action_checkpoint(action)
+        c = self.config
+        config_keys = ['virtualenv', 'virtualenv_options', 'virtualenv_path',
+                       'virtualenv_modules', 'virtualenv_requirements',
+                       'virtualenv_python_dll', 'pypi_url', 'find_links',
+                       'pip_index', 'distribute_url', 'pip_url']
+        inputs = list(c.get('virtualenv_requirements', []))
+        for module in c.get('virtualenv_modules', []):
+            if isinstance(module, dict):
+                if module.get('url'):
+                    inputs.append(module['url'])
+            else:
+                config_keys.append('%s_url' % module)
+                inputs.append(c.get('%s_url' % module, module))
+        for module, url, method, requirements, optional, two_pass, editable in \
+                self._virtualenv_modules:
+            inputs.append(url or module)
+            inputs.extend(requirements or ())
+        return {
+            'config': config_keys,
+            'inputs': [i for i in inputs if i],
+            'outputs': [self.query_python_path()],
+        }
+
     def query_virtualenv_path(self):
         c = self.config
         dirs = self.query_abs_dirs()
@@ -414,25 +445,48 @@ class ResourceMonitoringMixin(object):
     When this class is in the inheritance chain, resource usage stats of the
     executing script will be recorded.
 
-    This class requires the VirtualenvMixin in order to install a package used
-    for recording resource usage.
+    Where there's a /proc, a ResourceSampler records the whole run, from
+    the start, every self.config['resource_sample_interval'] seconds
+    (default 0.5).  Usage is logged per action and per command run
+    through run_command() and friends, and written with the samples to
+    self.config['resource_usage_file'], or resource-usage.json in the
+    upload dir.
 
-    While we would like to record resource usage for the entirety of a script,
-    since we require an external package, we can only record resource usage
-    after that package is installed (as part of creating the virtualenv).
-    That's just the way things have to be.
+    Elsewhere, this falls back to mozsystemmonitor, which needs psutil from
+    the virtualenv, so it can only record resource usage after
+    create-virtualenv.
     """
     def __init__(self, *args, **kwargs):
         super(ResourceMonitoringMixin, self).__init__(*args, **kwargs)
 
+        from mozharness.base.resources import ResourceSampler
+        self._resource_monitor = None
+        if ResourceSampler.is_supported():
+            return
         self.register_virtualenv_module('psutil==0.7.1', method='pip',
                                         optional=True)
         self.register_virtualenv_module('mozsystemmonitor==0.0.0',
                                         method='pip', optional=True)
-        self._resource_monitor = None
+
+    @PreScriptRun
+    def _start_resource_sampling(self):
+        from mozharness.base.resources import ResourceSampler
+        if not ResourceSampler.is_supported():
+            return
+        try:
+            self.resource_sampler = ResourceSampler(
+                interval=self.config.get('resource_sample_interval', 0.5))
+            self.resource_sampler.start()
+        except Exception:
+            self.resource_sampler = None
+            self.warning("Unable to start resource sampler: %s" %
+                         traceback.format_exc())
 
     @PostScriptAction('create-virtualenv')
     def _start_resource_monitoring(self, action, success=None):
+        from mozharness.base.resources import ResourceSampler
+        if ResourceSampler.is_supported():
+            return
         self.activate_virtualenv()
 
         # Resource Monitor requires Python 2.7, however it's currently optional.
@@ -453,22 +507,31 @@ class ResourceMonitoringMixin(object):
 
     @PreScriptAction
     def _resource_record_pre_action(self, action):
+        if self.resource_sampler:
+            self.resource_sampler.begin_phase(action)
         # Resource monitor isn't available until after create-virtualenv.
-        if not self._resource_monitor:
-            return
-
-        self._resource_monitor.begin_phase(action)
+        elif self._resource_monitor:
+            self._resource_monitor.begin_phase(action)
 
     @PostScriptAction
     def _resource_record_post_action(self, action, success=None):
+        if self.resource_sampler:
+            self.resource_sampler.finish_phase(action)
         # Resource monitor isn't available until after create-virtualenv.
-        if not self._resource_monitor:
-            return
-
-        self._resource_monitor.finish_phase(action)
+        elif self._resource_monitor:
+            self._resource_monitor.finish_phase(action)
 
     @PostScriptRun
     def _resource_record_post_run(self):
+        if self.resource_sampler:
+            try:
+                self.resource_sampler.stop()
+                self._log_sampled_resource_usage()
+                self._write_resource_usage()
+            except Exception:
+                self.warning("Exception when reporting resource usage: %s" %
+                             traceback.format_exc())
+            return
         if not self._resource_monitor:
             return
 
@@ -481,6 +544,47 @@ class ResourceMonitoringMixin(object):
             self.warning("Exception when reporting resource usage: %s" %
                          traceback.format_exc())
 
+    def _write_resource_usage(self):
+        path = self.config.get('resource_usage_file')
+        if not path:
+            upload_dir = self.query_abs_dirs()['abs_upload_dir']
+            self.mkdir_p(upload_dir)
+            path = os.path.join(upload_dir, 'resource-usage.json')
+        self.resource_sampler.write(path)
+        self.info("Wrote resource usage samples to %s" % path)
+
+    def _log_sampled_resource_usage(self):
+        def size(value):
+            if value is None:
+                return "Can't collect data"
+            return '%.1fMB' % (value / 1048576.0)
+
+        def log_usage(prefix, usage):
+            message = '%s - Wall time: %.0fs; ' % (prefix, usage['duration'])
+            # System-wide; command trees only have their own cpu time.
+            if 'cpu_percent' in usage:
+                if usage['cpu_percent'] is None:
+                    message += "CPU: Can't collect data; "
+                else:
+                    message += 'CPU: %s%%; ' % round(usage['cpu_percent'])
+            message += 'CPU time: %.1fs; Max RSS: %s; Read bytes: %d; ' \
+                'Write bytes: %d; Network received: %s; Network sent: %s' % (
+                    usage['cpu_time'], size(usage['max_rss']),
+                    usage['read_bytes'], usage['write_bytes'],
+                    size(usage['net_rx']), size(usage['net_tx']))
+            self.info(message)
+
+        rs = self.resource_sampler
+        log_usage('Total resource usage', rs.total)
+        for phase in rs.phases:
+            log_usage(phase['name'], phase)
+        # The commands that used the most cpu.
+        processes = sorted(rs.processes, key=lambda p: p['cpu_time'],
+                           reverse=True)
+        for process in processes[:self.config.get('resource_top_processes', 10)]:
+            log_usage('%s (pid %d)' % (process['name'], process['pid']),
+                      process)
+
     def _log_resource_usage(self):
         rm = self._resource_monitor
 
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Sample the resource usage of a run from /proc, without psutil.
+
+ResourceSampler reads /proc from a background thread every interval
+seconds, and records:
+
+  * a time series of system cpu and memory, and the script's process
+    tree's rss, disk i/o and the system's network traffic;
+  * per phase (action) totals, taken exactly at its start and end;
+  * per process tree totals, for each command passed to track().
+
+Cpu time and i/o of a process include its reaped children, so summing
+over the live processes of a tree gives the tree's usage so far.
+Network traffic can't be told apart per process; phases and trees get
+the system's traffic while they ran.
+"""
+
+import os
+import threading
+import time
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+PROC_DIR = '/proc'
+COLUMNS = ('time', 'cpu_percent', 'mem_used', 'rss', 'read_bytes',
+           'write_bytes', 'net_rx', 'net_tx')
+
+
+def _read(path):
+    fh = open(path)
+    try:
+        return fh.read()
+    finally:
+        fh.close()
+
+
+# /proc readers {{{1
+def read_cpu_ticks(proc_dir=PROC_DIR):
+    """Return (busy, total) cpu ticks of the whole system."""
+    line = _read(os.path.join(proc_dir, 'stat')).split('\n', 1)[0]
+    fields = [int(f) for f in line.split()[1:]]
+    # idle and iowait
+    idle = sum(fields[3:5])
+    total = sum(fields[:8])
+    return total - idle, total
+
+
+def read_mem_used(proc_dir=PROC_DIR):
+    """Return the bytes of memory in use, not counting caches."""
+    info = {}
+    for line in _read(os.path.join(proc_dir, 'meminfo')).splitlines():
+        name, value = line.split(':', 1)
+        info[name] = int(value.split()[0]) * 1024
+    if 'MemAvailable' in info:
+        available = info['MemAvailable']
+    else:
+        available = sum(info.get(k, 0) for k in ('MemFree', 'Buffers', 'Cached'))
+    return info['MemTotal'] - available
+
+
+def read_net_bytes(proc_dir=PROC_DIR):
+    """Return (received, sent) bytes on every interface but loopback."""
+    rx = tx = 0
+    try:
+        data = _read(os.path.join(proc_dir, 'net', 'dev'))
+    except (IOError, OSError):
+        return rx, tx
+    for line in data.splitlines()[2:]:
+        name, data = line.split(':', 1)
+        if name.strip() == 'lo':
+            continue
+        fields = data.split()
+        rx += int(fields[0])
+        tx += int(fields[8])
+    return rx, tx
+
+
+def read_process_table(proc_dir=PROC_DIR):
+    """Return a dict mapping each pid to (ppid, cpu ticks including
+    reaped children, rss pages, start time).
+    """
+    table = {}
+    for name in os.listdir(proc_dir):
+        if not name.isdigit():
+            continue
+        try:
+            data = _read(os.path.join(proc_dir, name, 'stat'))
+        except (IOError, OSError):
+            # It exited.
+            continue
+        # The command name can contain spaces and parentheses.
+        fields = data[data.rindex(')') + 2:].split()
+        table[int(name)] = (int(fields[1]),
+                            sum(int(f) for f in fields[11:15]),
+                            int(fields[21]), int(fields[19]))
+    return table
+
+
+def read_process_io(pid, proc_dir=PROC_DIR):
+    """Return (read, written) bytes of storage i/o by pid and its reaped
+    children, or (0, 0) if that can't be read.
+    """
+    counters = {}
+    try:
+        for line in _read(os.path.join(proc_dir, str(pid), 'io')).splitlines():
+            name, value = line.split(':', 1)
+            counters[name] = int(value)
+    except (IOError, OSError, ValueError):
+        return 0, 0
+    return counters.get('read_bytes', 0), counters.get('write_bytes', 0)
+
+
+def query_descendants(table, root):
+    """Return root and all its descendants that are in table."""
+    children = {}
+    for pid, info in table.items():
+        children.setdefault(info[0], []).append(pid)
+    tree = []
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        if pid in table:
+            tree.append(pid)
+            pending.extend(children.get(pid, []))
+    return tree
+
+
+# ResourceSampler {{{1
+class ResourceSampler(object):
+    """Sample this process's resource usage in a background thread.
+
+    Call start() and stop() around the run, begin_phase() and
+    finish_phase() around each action, and track() and untrack() around
+    each command, with sample_tree() just before it's reaped.  The results are in total, phases and processes, and
+    write() saves them together with the time series.
+    """
+    def __init__(self, interval=0.5, proc_dir=PROC_DIR):
+        self.interval = interval
+        self.proc_dir = proc_dir
+        self.pid = os.getpid()
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.lock = threading.Lock()
+        self.samples = dict((c, []) for c in COLUMNS)
+        self.start_time = None
+        self.total = None
+        self.phases = []
+        self.processes = []
+        self._phase_starts = {}
+        self._trees = {}
+        self._last_cpu_ticks = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def is_supported(proc_dir=PROC_DIR):
+        return os.path.exists(os.path.join(proc_dir, 'stat')) and \
+            os.path.exists(os.path.join(proc_dir, str(os.getpid()), 'stat'))
+
+    def start(self):
+        self.start_time = time.time()
+        self._start_snapshot = self._snapshot()
+        self.sample()
+        self._thread = threading.Thread(target=self._sample_loop,
+                                        name='resource-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.sample()
+        self.total = self._summarize(self._start_snapshot, self._snapshot())
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                # Missing a sample is better than breaking the run.
+                pass
+
+    def _snapshot(self):
+        """Counters at this moment, for phases: cpu time and i/o of this
+        process and its reaped children, and system cpu and network.
+        """
+        times = os.times()
+        return {
+            'time': time.time(),
+            'cpu_time': sum(times[:4]),
+            'io': read_process_io(self.pid, self.proc_dir),
+            'net': read_net_bytes(self.proc_dir),
+            'cpu_ticks': read_cpu_ticks(self.proc_dir),
+        }
+
+    def _summarize(self, start, end):
+        busy = end['cpu_ticks'][0] - start['cpu_ticks'][0]
+        total = end['cpu_ticks'][1] - start['cpu_ticks'][1]
+        first = start['time'] - self.start_time
+        last = end['time'] - self.start_time
+        with self.lock:
+            rss = [r for t, r in zip(self.samples['time'], self.samples['rss'])
+                   if first <= t <= last]
+        return {
+            'start': start['time'],
+            'duration': end['time'] - start['time'],
+            'cpu_percent': 100.0 * busy / total if total else None,
+            'cpu_time': end['cpu_time'] - start['cpu_time'],
+            'max_rss': max(rss) if rss else None,
+            'read_bytes': end['io'][0] - start['io'][0],
+            'write_bytes': end['io'][1] - start['io'][1],
+            'net_rx': end['net'][0] - start['net'][0],
+            'net_tx': end['net'][1] - start['net'][1],
+        }
+
+    def begin_phase(self, name):
+        self._phase_starts[name] = self._snapshot()
+
+    def finish_phase(self, name):
+        start = self._phase_starts.pop(name, None)
+        if start is None:
+            return
+        phase = self._summarize(start, self._snapshot())
+        phase['name'] = name
+        self.phases.append(phase)
+
+    def track(self, pid, name):
+        """Report the usage of pid's process tree separately, as name."""
+        table = read_process_table(self.proc_dir)
+        tree = {
+            'name': name, 'pid': pid, 'start': time.time(),
+            'start_ticks': table.get(pid, (0, 0, 0, None))[3],
+            'net': read_net_bytes(self.proc_dir),
+            'cpu_time': 0, 'max_rss': None, 'read_bytes': 0, 'write_bytes': 0,
+            'samples': 0,
+        }
+        with self.lock:
+            self._trees[pid] = tree
+
+    def sample_tree(self, pid):
+        """Sample pid's tree now.  Call it once pid is done but before
+        it's reaped, so that commands shorter than interval are counted
+        too.
+        """
+        with self.lock:
+            tree = self._trees.get(pid)
+        if tree is None:
+            return
+        table = read_process_table(self.proc_dir)
+        io = dict((p, read_process_io(p, self.proc_dir))
+                  for p in query_descendants(table, pid))
+        self._update_tree(tree, table, io)
+
+    def untrack(self, pid):
+        """Stop watching pid's tree; call once it has exited.  Its usage
+        is as of the last sample, and it's left out of processes if it
+        was never sampled.
+        """
+        with self.lock:
+            tree = self._trees.pop(pid, None)
+        if tree is None or not tree['samples']:
+            return
+        net = read_net_bytes(self.proc_dir)
+        tree['duration'] = time.time() - tree['start']
+        tree['net_rx'] = net[0] - tree['net'][0]
+        tree['net_tx'] = net[1] - tree['net'][1]
+        del tree['net'], tree['start_ticks'], tree['samples']
+        self.processes.append(tree)
+
+    def _update_tree(self, tree, table, io):
+        pid = tree['pid']
+        if pid not in table or table[pid][3] != tree['start_ticks']:
+            return
+        members = query_descendants(table, pid)
+        tree['cpu_time'] = max(tree['cpu_time'], float(
+            sum(table[p][1] for p in members)) / self.clock_ticks)
+        # A process that has exited but isn't reaped yet has no rss.
+        rss = self.page_size * sum(table[p][2] for p in members)
+        if rss:
+            tree['max_rss'] = max(tree['max_rss'] or 0, rss)
+        tree['read_bytes'] = max(tree['read_bytes'],
+                                 sum(io[p][0] for p in members if p in io))
+        tree['write_bytes'] = max(tree['write_bytes'],
+                                  sum(io[p][1] for p in members if p in io))
+        tree['samples'] += 1
+
+    def sample(self):
+        now = time.time()
+        table = read_process_table(self.proc_dir)
+        script_tree = query_descendants(table, self.pid)
+        io = {}
+        for pid in script_tree:
+            io[pid] = read_process_io(pid, self.proc_dir)
+        with self.lock:
+            trees = self._trees.values()
+        for tree in trees:
+            self._update_tree(tree, table, io)
+        cpu_ticks = read_cpu_ticks(self.proc_dir)
+        cpu_percent = None
+        if self._last_cpu_ticks and cpu_ticks[1] > self._last_cpu_ticks[1]:
+            cpu_percent = round(100.0 * (cpu_ticks[0] - self._last_cpu_ticks[0]) /
+                                (cpu_ticks[1] - self._last_cpu_ticks[1]), 1)
+        self._last_cpu_ticks = cpu_ticks
+        net = read_net_bytes(self.proc_dir)
+        row = {
+            'time': round(now - self.start_time, 2),
+            'cpu_percent': cpu_percent,
+            'mem_used': read_mem_used(self.proc_dir),
+            'rss': self.page_size * sum(table[p][2] for p in script_tree),
+            'read_bytes': sum(r for r, w in io.values()),
+            'write_bytes': sum(w for r, w in io.values()),
+            'net_rx': net[0],
+            'net_tx': net[1],
+        }
+        with self.lock:
+            for column in COLUMNS:
+                self.samples[column].append(row[column])
+
+    def write(self, path):
+        """Save everything as compact JSON, with the time series as one
+        list per column.
+        """
+        with self.lock:
+            data = {
+                'version': 1,
+                'interval': self.interval,
+                'start_time': self.start_time,
+                'columns': COLUMNS,
+                'samples': [self.samples[c] for c in COLUMNS],
+                'total': self.total,
+                'phases': self.phases,
+                'processes': self.processes,
+            }
+        fh = open(path, 'w')
+        try:
+            json.dump(data, fh, separators=(',', ':'))
+        finally:
+            fh.close()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Retry policies for ScriptMixin.retry().
+
+A RetryPolicy decides whether a failure is worth retrying at all and how
+long to sleep before each retry, within an overall time budget.  A
+CircuitBreaker remembers which hosts keep failing, so later calls in the
+same run give up straight away instead of spending their whole backoff
+on a host that's down.
+"""
+
+import threading
+import time
+
+RETRY = 'retry'
+GIVE_UP = 'give up'
+
+# 4xx responses won't go away by asking again, except for these.
+RETRYABLE_HTTP_CODES = (408, 429)
+
+
+# Classifiers {{{1
+def classify_network_error(exception=None, status=None):
+    """Give up on client errors like 404, retry everything else."""
+    import urllib2
+    if isinstance(exception, urllib2.HTTPError):
+        if exception.code >= 500 or exception.code in RETRYABLE_HTTP_CODES:
+            return RETRY
+        return GIVE_UP
+    return RETRY
+
+
+def classify_mapper_error(exception=None, status=None):
+    """Like classify_network_error(), but retry 404s: the mapper answers
+    404 for revisions vcs-sync hasn't mapped yet, so waiting is the point.
+    """
+    import urllib2
+    if isinstance(exception, urllib2.HTTPError) and exception.code == 404:
+        return RETRY
+    return classify_network_error(exception=exception, status=status)
+
+
+# RetryPolicy {{{1
+class RetryPolicy(object):
+    """Sleep `sleeptime' seconds before the first retry, then back off up
+    to `max_sleeptime'.
+
+    Without jitter the sleep doubles every retry, which is what retry()
+    has always done.  With jitter it uses decorrelated jitter, picking
+    each sleep at random between sleeptime and three times the previous
+    sleep, so a short blip costs a second or two and retries from many
+    jobs don't arrive in lockstep.
+
+    If `max_elapsed' is set, retry() gives up rather than sleep past that
+    many seconds after the first attempt.
+
+    `classifier', if set, is called with the caught exception (or None)
+    and the bad status (or None), and returns RETRY or GIVE_UP.
+    """
+    def __init__(self, sleeptime=60, max_sleeptime=5 * 60, jitter=False,
+                 max_elapsed=None, classifier=None):
+        self.sleeptime = sleeptime
+        self.max_sleeptime = max_sleeptime
+        self.jitter = jitter
+        self.max_elapsed = max_elapsed
+        self.classifier = classifier
+
+    def classify(self, exception=None, status=None):
+        if self.classifier:
+            return self.classifier(exception=exception, status=status)
+        return RETRY
+
+    def query_sleeptimes(self):
+        """Yield the number of seconds to sleep before each retry."""
+        import random
+        sleeptime = self.sleeptime
+        if self.jitter and sleeptime > 0:
+            while True:
+                sleeptime = min(self.max_sleeptime,
+                                random.uniform(self.sleeptime, sleeptime * 3))
+                yield sleeptime
+        while True:
+            yield sleeptime
+            sleeptime = min(sleeptime * 2, self.max_sleeptime)
+
+
+# Policies for the retries in mozharness itself, by name; see
+# ScriptMixin.query_retry_policy().
+DEFAULT_RETRY_POLICIES = {
+    'download': {
+        'sleeptime': 1, 'max_sleeptime': 5 * 60, 'jitter': True,
+        'max_elapsed': 30 * 60, 'classifier': classify_network_error,
+    },
+    'vcs': {
+        'sleeptime': 1, 'max_sleeptime': 5 * 60, 'jitter': True,
+        'max_elapsed': 60 * 60,
+    },
+    'tooltool': {
+        'sleeptime': 1, 'max_sleeptime': 5 * 60, 'jitter': True,
+        'max_elapsed': 30 * 60,
+    },
+    'clobberer': {
+        'sleeptime': 1, 'max_sleeptime': 60, 'jitter': True,
+        'max_elapsed': 10 * 60,
+    },
+    'mapper': {
+        'sleeptime': 1, 'max_sleeptime': 30, 'jitter': True,
+        'max_elapsed': 15 * 60, 'classifier': classify_mapper_error,
+    },
+}
+
+
+# CircuitBreaker {{{1
+class CircuitBreaker(object):
+    """Track consecutive failures per key (usually a host name).
+
+    After `failure_threshold' failures in a row the circuit opens and
+    allow() returns False.  Once `reset_timeout' seconds have passed, a
+    single trial attempt is let through per reset_timeout; a success
+    closes the circuit again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=5 * 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        with self.lock:
+            opened = self.opened.get(key)
+            if opened is None:
+                return True
+            now = time.time()
+            if now - opened < self.reset_timeout:
+                return False
+            self.opened[key] = now
+            return True
+
+    def is_open(self, key):
+        return key in self.opened
+
+    def record_success(self, key):
+        with self.lock:
+            self.failures.pop(key, None)
+            self.opened.pop(key, None)
+
+    def record_failure(self, key):
+        with self.lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if self.failures[key] >= self.failure_threshold:
+                self.opened[key] = time.time()
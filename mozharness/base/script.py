@@ -12,19 +12,17 @@ mozharness.
 
 import codecs
 from contextlib import contextmanager
-import gzip
-import inspect
 import os
-import platform
 import pprint
+import Queue
 import re
 import shutil
-import socket
 import subprocess
 import sys
+import threading
 import time
 import traceback
-import urllib2
+import types
 import urlparse
 if os.name == 'nt':
     try:
@@ -40,10 +38,15 @@ try:
 except ImportError:
     import json
 
-from mozprocess import ProcessHandler
 from mozharness.base.config import BaseConfig
+from mozharness.base.errors import ExtractException, ZipErrorList
 from mozharness.base.log import SimpleFileLogger, MultiFileLogger, \
-    LogMixin, OutputParser, DEBUG, INFO, ERROR, FATAL
+    LogMixin, OutputParser, BufferedLogger, DEBUG, INFO, ERROR, FATAL
+from mozharness.base.process import pump_output, pump_streams, \
+    OutputBuffer, MAX_BUFFER_SIZE, OUTPUT_TIMEOUT, MAX_TIME
+from mozharness.base.retry import RetryPolicy, CircuitBreaker, \
+    DEFAULT_RETRY_POLICIES, GIVE_UP
+from mozharness.base.trash import DeferredDeleter, query_default_trash_dir
 
 
 # ScriptMixin {{{1
@@ -59,6 +62,12 @@ class ScriptMixin(object):
 
     env = None
     script_obj = None
+    download_cache = None
+    circuit_breaker = None
+    deferred_deleter = None
+    hash_service = None
+    tracer = None
+    resource_sampler = None
 
     # Simple filesystem commands {{{2
     def mkdir_p(self, path, error_level=ERROR):
@@ -77,9 +86,13 @@ class ScriptMixin(object):
             self.debug("mkdir_p: %s Already exists." % path)
 
     def rmtree(self, path, log_level=INFO, error_level=ERROR,
-               exit_code=-1):
+               exit_code=-1, defer=None):
         """
         Returns None for success, not None for failure
+
+        If `defer' (default self.config['deferred_delete']) is set,
+        directories on the trash directory's volume are renamed into it
+        and deleted in the background; see query_deferred_deleter().
         """
         self.log("rmtree: %s" % path, level=log_level)
         error_message = "Unable to remove %s!" % path
@@ -94,6 +107,14 @@ class ScriptMixin(object):
                 args=(path, ),
                 log_level=log_level,
             )
+        if defer is None:
+            defer = self.config.get('deferred_delete')
+        if defer and os.path.isdir(path):
+            dest = self.query_deferred_deleter().delete(path)
+            if dest:
+                self.log("Moved %s to %s to delete in the background." %
+                         (path, dest), level=log_level)
+                return None
         if os.path.exists(path):
             if os.path.isdir(path):
                 return self.retry(
@@ -116,7 +137,38 @@ class ScriptMixin(object):
         else:
             self.debug("%s doesn't exist." % path)
 
+    def query_deferred_deleter(self):
+        """Return the DeferredDeleter shared by this run's rmtree()s.
+
+        Its trash directory is self.config['deferred_delete_dir'], or
+        .mozharness_trash next to base_work_dir.  Creating it queues
+        deletion of anything a previous run left there.
+        """
+        if self.script_obj and self.script_obj is not self:
+            return self.script_obj.query_deferred_deleter()
+        if not self.deferred_deleter:
+            trash_dir = self.config.get('deferred_delete_dir')
+            if not trash_dir:
+                trash_dir = query_default_trash_dir(
+                    self.config.get('base_work_dir', os.getcwd()))
+            self.deferred_deleter = DeferredDeleter(trash_dir)
+            try:
+                self.deferred_deleter.prepare()
+            except OSError, e:
+                self.warning("Can't clean up the trash in %s: %s" %
+                             (trash_dir, str(e)))
+        return self.deferred_deleter
+
+    def wait_for_deferred_deletes(self):
+        """Wait for rmtree()'s background deletes to finish."""
+        if not self.deferred_deleter:
+            return
+        self.info("Waiting for background deletes to finish.")
+        for path, e in self.deferred_deleter.join():
+            self.warning("Can't delete %s: %s" % (path, str(e)))
+
     def _is_windows(self):
+        import platform
         system = platform.system()
         if system in ("Windows", "Microsoft"):
             return True
@@ -178,24 +230,28 @@ class ScriptMixin(object):
 
     def _download_file(self, url, file_name):
         """ Helper script for download_file()
+
+            The download goes to file_name.part first.  If that exists from
+            an earlier attempt, it is resumed with an HTTP Range request
+            rather than restarted from byte zero.
+
+            If self.config['download_connections'] is greater than 1, and
+            the server supports ranges, files larger than
+            self.config['download_parallel_min_size'] are fetched over that
+            many connections at once.
             """
+        import socket
+        import urllib2
+        part_file_name = '%s.part' % file_name
         try:
-            f_length = None
-            f = urllib2.urlopen(url, timeout=30)
-            if f.info().get('content-length') is not None:
-                f_length = int(f.info()['content-length'])
-                got_length = 0
-            local_file = open(file_name, 'wb')
-            while True:
-                block = f.read(1024 ** 2)
-                if not block:
-                    if f_length is not None and got_length != f_length:
-                        raise urllib2.URLError("Download incomplete; content-length was %d, but only received %d" % (f_length, got_length))
-                    break
-                local_file.write(block)
-                if f_length is not None:
-                    got_length += len(block)
-            local_file.close()
+            connections = self.config.get('download_connections', 1)
+            if not (connections > 1 and
+                    self._download_file_parallel(url, part_file_name,
+                                                 connections)):
+                self._download_file_resume(url, part_file_name)
+            if os.path.exists(file_name):
+                os.remove(file_name)
+            os.rename(part_file_name, file_name)
             return file_name
         except urllib2.HTTPError, e:
             self.warning("Server returned status %s %s for %s" % (str(e.code), str(e), url))
@@ -220,28 +276,367 @@ class ScriptMixin(object):
             self.warning("Socket error when accessing %s: %s" % (url, str(e)))
             raise
 
+    def _open_url_range(self, url, start, end=None):
+        """ Open url for reading from byte `start' (to byte `end',
+            inclusive, if set).
+
+            Returns a (response, resumed) tuple; resumed is False if the
+            server ignored the Range header and is sending the whole file.
+            """
+        import urllib2
+        request = urllib2.Request(url)
+        if start or end is not None:
+            request.add_header('Range', 'bytes=%d-%s' %
+                               (start, '' if end is None else end))
+        f = urllib2.urlopen(request, timeout=30)
+        if not start and end is None:
+            return f, False
+        content_range = f.info().get('content-range', '')
+        match = re.match(r'bytes (\d+)-(\d+)/', content_range)
+        if getattr(f, 'code', None) == 206 and match and \
+                int(match.group(1)) == start and \
+                (end is None or int(match.group(2)) == end):
+            return f, True
+        return f, False
+
+    def _read_url_to_file(self, f, local_file, expected_length):
+        """ Copy the response f into local_file in 1MB blocks, verifying
+            expected_length if set.  Returns the number of bytes written.
+            """
+        import urllib2
+        got_length = 0
+        while True:
+            block = f.read(1024 ** 2)
+            if not block:
+                break
+            local_file.write(block)
+            got_length += len(block)
+        if expected_length is not None and got_length != expected_length:
+            raise urllib2.URLError("Download incomplete; content-length was %d, but only received %d" % (expected_length, got_length))
+        return got_length
+
+    def _download_file_resume(self, url, part_file_name):
+        """ Download url to part_file_name over one connection, resuming
+            from the end of part_file_name if it exists.
+            """
+        import urllib2
+        offset = 0
+        if os.path.exists(part_file_name):
+            offset = os.path.getsize(part_file_name)
+        try:
+            f, resumed = self._open_url_range(url, offset)
+        except urllib2.HTTPError, e:
+            if not offset or e.code != 416:
+                raise
+            # Range Not Satisfiable; the partial file is bogus.
+            self.info("Can't resume %s at byte %d; restarting." % (url, offset))
+            offset = 0
+            f, resumed = self._open_url_range(url, offset)
+        if resumed:
+            self.info("Resuming download of %s at byte %d." % (url, offset))
+            open_mode = 'ab'
+        else:
+            open_mode = 'wb'
+        f_length = None
+        if f.info().get('content-length') is not None:
+            f_length = int(f.info()['content-length'])
+        local_file = open(part_file_name, open_mode)
+        try:
+            self._read_url_to_file(f, local_file, f_length)
+        finally:
+            local_file.close()
+            f.close()
+
+    def _download_range(self, url, file_name, start, end, attempts=3):
+        """ Download bytes start-end of url into the same offset of
+            file_name, resuming within the range on network errors.
+            """
+        import socket
+        import urllib2
+        local_file = open(file_name, 'r+b')
+        try:
+            n = 0
+            while True:
+                n += 1
+                try:
+                    f, resumed = self._open_url_range(url, start, end)
+                except urllib2.HTTPError:
+                    raise
+                except (urllib2.URLError, socket.timeout, socket.error), e:
+                    if n >= attempts:
+                        raise
+                    self.info("Retrying range %d-%d of %s: %s" % (start, end, url, str(e)))
+                    continue
+                if not resumed:
+                    f.close()
+                    raise urllib2.URLError("Server ignored range %d-%d of %s" % (start, end, url))
+                local_file.seek(start)
+                try:
+                    self._read_url_to_file(f, local_file, end - start + 1)
+                    return
+                except (urllib2.URLError, socket.timeout, socket.error), e:
+                    # Keep whatever made it to disk.
+                    start = local_file.tell()
+                    if n >= attempts:
+                        raise
+                    self.info("Retrying range %d-%d of %s: %s" % (start, end, url, str(e)))
+                finally:
+                    f.close()
+        finally:
+            local_file.close()
+
+    def _download_file_parallel(self, url, part_file_name, connections):
+        """ Download url to part_file_name as `connections' ranges at once.
+
+            Returns False, without downloading anything, if the server
+            doesn't support ranges or the file is smaller than
+            self.config['download_parallel_min_size'] (default 64MB).
+            """
+        from multiprocessing.pool import ThreadPool
+        import urllib2
+        info = self._query_url_info(url)
+        if not info or info.get('accept-ranges') != 'bytes' or \
+                not info.get('content-length'):
+            return False
+        length = int(info['content-length'])
+        if length < self.config.get('download_parallel_min_size', 64 * 1024 ** 2):
+            return False
+        chunk_size = -(-length // connections)
+        ranges = [(start, min(start + chunk_size, length) - 1)
+                  for start in range(0, length, chunk_size)]
+        self.info("Downloading %s in %d ranges of up to %d bytes." %
+                  (url, len(ranges), chunk_size))
+        local_file = open(part_file_name, 'wb')
+        local_file.truncate(length)
+        local_file.close()
+        pool = ThreadPool(len(ranges))
+        try:
+            pool.map(lambda r: self._download_range(url, part_file_name, *r),
+                     ranges)
+        finally:
+            pool.close()
+            pool.join()
+        got_length = os.path.getsize(part_file_name)
+        if got_length != length:
+            raise urllib2.URLError("Download incomplete; content-length was %d, but have %d" % (length, got_length))
+        return True
+
     def _retry_download_file(self, url, file_name, error_level):
         """ Helper method to retry _download_file().
 
             Split out so we can alter the retry logic in
             mozharness.mozilla.testing.gaia_test.
             """
+        import socket
+        import urllib2
+        # Only resume partial downloads from this set of attempts.
+        self.rmtree('%s.part' % file_name, log_level=DEBUG)
         return self.retry(
             self._download_file,
             args=(url, file_name),
             failure_status=None,
             retry_exceptions=(urllib2.HTTPError, urllib2.URLError,
                               socket.timeout, socket.error),
+            policy=self.query_retry_policy('download'),
+            circuit_key=urlparse.urlparse(url).netloc,
             error_message="Can't download from %s to %s!" % (url, file_name),
             error_level=error_level,
         )
 
+    def query_download_cache(self):
+        """Return the DownloadCache for this run, or None if
+        self.config['download_cache_dir'] isn't set.
+
+        download_cache_max_size is the cache size limit in bytes,
+        defaulting to 10GB.
+        """
+        if self.download_cache:
+            return self.download_cache
+        cache_dir = self.config.get('download_cache_dir')
+        if not cache_dir:
+            return None
+        from mozharness.base.transfer import DownloadCache
+        try:
+            self.download_cache = DownloadCache(
+                cache_dir,
+                max_size=self.config.get('download_cache_max_size',
+                                         10 * 1024 ** 3),
+            )
+        except OSError, e:
+            self.warning("Can't use download cache %s: %s" % (cache_dir, str(e)))
+            return None
+        return self.download_cache
+
+    def _query_url_info(self, url):
+        """ HEAD url and return the response headers.
+
+            Returns None if the server can't be reached.
+            """
+        import socket
+        import urllib2
+        request = urllib2.Request(url)
+        request.get_method = lambda: 'HEAD'
+        try:
+            f = urllib2.urlopen(request, timeout=30)
+            info = f.info()
+            f.close()
+        except (urllib2.URLError, socket.timeout, socket.error,
+                ValueError), e:
+            self.debug("Unable to query headers for %s: %s" % (url, str(e)))
+            return None
+        return info
+
+    def _query_url_validators(self, url):
+        """ Return a dict of the ETag and Last-Modified headers for url,
+            for validating cached downloads, or None.
+            """
+        info = self._query_url_info(url)
+        if info is None:
+            return None
+        validators = {}
+        if info.get('etag'):
+            validators['etag'] = info['etag']
+        if info.get('last-modified'):
+            validators['last_modified'] = info['last-modified']
+        return validators
+
+    def query_hash_service(self):
+        """Return the HashService shared by this run.
+
+        Digests are remembered for the rest of the run, and across runs
+        in self.config['hash_cache_file'] if that's set.  Files are hashed
+        across self.config['hash_workers'] threads, defaulting to the
+        number of cpus.
+        """
+        if self.script_obj and self.script_obj is not self:
+            return self.script_obj.query_hash_service()
+        if not self.hash_service:
+            import multiprocessing
+            from mozharness.base.hashing import HashService
+            self.hash_service = HashService(
+                cache_file=self.config.get('hash_cache_file'),
+                workers=self.config.get('hash_workers',
+                                        multiprocessing.cpu_count()),
+            )
+        return self.hash_service
+
+    def query_file_hashes(self, paths, hash_type='sha512'):
+        """Return a dict mapping each of paths to its hex digest, hashing
+        them in parallel; see query_hash_service().
+        """
+        return self.query_hash_service().query_hashes(paths, hash_type=hash_type)
+
+    def query_file_hash(self, path, hash_type='sha512'):
+        return self.query_file_hashes([path], hash_type=hash_type)[path]
+
+    # Tracing {{{2
+    def query_tracer(self):
+        """Return the Tracer for this run, or None if
+        self.config['trace'] isn't set.
+        """
+        if self.script_obj and self.script_obj is not self:
+            return self.script_obj.query_tracer()
+        if not self.tracer and self.config.get('trace'):
+            from mozharness.base.trace import Tracer
+            self.tracer = Tracer(
+                process_name=os.path.basename(sys.argv[0]) or None)
+        return self.tracer
+
+    def trace_span(self, name, cat, **args):
+        """Start timing a span of the run, for the trace written at the
+        end of BaseScript.run().  Use it in a with statement, or call
+        finish() on it.  Does nothing if tracing is off.
+        """
+        tracer = self.query_tracer()
+        if not tracer:
+            from mozharness.base.trace import NULL_SPAN
+            return NULL_SPAN
+        return tracer.span(name, cat, **args)
+
+    def trace_command(self, command, **args):
+        """trace_span() for running command."""
+        from mozharness.base.trace import query_command_name
+        return self.trace_span(query_command_name(command), 'command',
+                               argv=command, **args)
+
+    # Resource sampling {{{2
+    def track_process(self, pid, command):
+        """Have the resource sampler, if one is running (see
+        ResourceMonitoringMixin), report pid's process tree separately.
+        Call untrack_process() once it has exited.
+        """
+        if self.script_obj and self.script_obj is not self:
+            return self.script_obj.track_process(pid, command)
+        if self.resource_sampler:
+            from mozharness.base.trace import query_command_name
+            self.resource_sampler.track(pid, query_command_name(command))
+
+    def sample_process(self, pid):
+        """Have the resource sampler take a last look at pid's process
+        tree once its output is done, before it's reaped.
+        """
+        if self.script_obj and self.script_obj is not self:
+            return self.script_obj.sample_process(pid)
+        if self.resource_sampler:
+            self.resource_sampler.sample_tree(pid)
+
+    def untrack_process(self, pid):
+        if self.script_obj and self.script_obj is not self:
+            return self.script_obj.untrack_process(pid)
+        if self.resource_sampler:
+            self.resource_sampler.untrack(pid)
+
+    def _cached_download_file(self, cache, url, file_name, error_level,
+                              expected_sha512=None):
+        """ download_file() through the download cache.
+
+            A cached entry is used if it matches expected_sha512, or if the
+            server's ETag/Last-Modified still matches the cached one.
+            Otherwise download into the cache and copy out from there.
+            """
+        hardlink = self.config.get('download_cache_hardlink', True)
+        entry = cache.lookup(url)
+        validators = None
+        if not (entry and expected_sha512):
+            validators = self._query_url_validators(url)
+        if entry and cache.is_valid(entry, validators=validators,
+                                    sha512=expected_sha512):
+            self.info("Using cached copy of %s from %s" %
+                      (url, cache.query_data_path(url)))
+            if cache.copy_out(url, file_name, hardlink=hardlink):
+                cache.touch(url)
+                return file_name
+            self.info("Cached copy of %s went away; downloading." % url)
+        tmp_file_name = cache.query_tmp_path()
+        status = self._retry_download_file(url, tmp_file_name, error_level)
+        if status != tmp_file_name:
+            cache.remove(url)
+            self.rmtree(tmp_file_name, log_level=DEBUG)
+            return status
+        sha512 = self.query_file_hash(tmp_file_name)
+        if expected_sha512 and sha512 != expected_sha512:
+            self.rmtree(tmp_file_name, log_level=DEBUG)
+            self.log("sha512 of %s is %s, expected %s!" %
+                     (url, sha512, expected_sha512), level=error_level)
+            return None
+        cache.add(url, tmp_file_name, validators=validators, sha512=sha512)
+        if not cache.copy_out(url, file_name, hardlink=hardlink):
+            self.log("Can't copy %s out of the download cache!" % url,
+                     level=error_level)
+            return None
+        return file_name
+
     # http://www.techniqal.com/blog/2008/07/31/python-file-read-write-with-urllib2/
     # TODO thinking about creating a transfer object.
     def download_file(self, url, file_name=None, parent_dir=None,
                       create_parent_dir=True, error_level=ERROR,
-                      exit_code=3):
+                      exit_code=3, expected_sha512=None):
         """ Python wget.
+
+            If self.config['download_cache_dir'] is set, downloads go
+            through a local DownloadCache; see query_download_cache().
+            If expected_sha512 is set, a cached copy with that sha512 is
+            used without asking the server.
         """
         if not file_name:
             try:
@@ -255,9 +650,28 @@ class ScriptMixin(object):
             if create_parent_dir:
                 self.mkdir_p(parent_dir, error_level=error_level)
         self.info("Downloading %s to %s" % (url, file_name))
-        status = self._retry_download_file(url, file_name, error_level)
-        if status == file_name:
-            self.info("Downloaded %d bytes." % os.path.getsize(file_name))
+        cache = self.query_download_cache()
+        with self.trace_span('download', 'download', url=url,
+                             file_name=file_name) as span:
+            if cache:
+                status = self._cached_download_file(
+                    cache, url, file_name, error_level,
+                    expected_sha512=expected_sha512,
+                )
+            else:
+                status = self._retry_download_file(url, file_name, error_level)
+                if status == file_name and expected_sha512:
+                    sha512 = self.query_file_hash(file_name)
+                    if sha512 != expected_sha512:
+                        span.set(sha512_mismatch=True)
+                        self.log("sha512 of %s is %s, expected %s!" %
+                                 (file_name, sha512, expected_sha512),
+                                 level=error_level, exit_code=exit_code)
+                        return None
+            if status == file_name:
+                size = os.path.getsize(file_name)
+                span.set(bytes=size)
+                self.info("Downloaded %d bytes." % size)
         return status
 
     def move(self, src, dest, log_level=INFO, error_level=ERROR,
@@ -281,23 +695,27 @@ class ScriptMixin(object):
         os.chmod(path, mode)
 
     def copyfile(self, src, dest, log_level=INFO, error_level=ERROR, copystat=False, compress=False):
+        """Copy src to dest, gzipping it if `compress' is set.
+
+        Copies are reflinked where the filesystem supports it.  Compression
+        is spread across self.config['compress_workers'] threads (default
+        1) for files bigger than one block.
+        """
+        from mozharness.base.copier import copy_file, gzip_file
         if compress:
             self.log("Compressing %s to %s" % (src, dest), level=log_level)
             try:
-                infile = open(src, "rb")
-                outfile = gzip.open(dest, "wb")
-                outfile.writelines(infile)
-                outfile.close()
-                infile.close()
-            except IOError, e:
+                gzip_file(src, dest,
+                          workers=self.config.get('compress_workers', 1))
+            except (IOError, OSError), e:
                 self.log("Can't compress %s to %s: %s!" % (src, dest, str(e)),
                          level=error_level)
                 return -1
         else:
             self.log("Copying %s to %s" % (src, dest), level=log_level)
             try:
-                shutil.copyfile(src, dest)
-            except (IOError, shutil.Error), e:
+                copy_file(src, dest)
+            except (IOError, OSError, shutil.Error), e:
                 self.log("Can't copy %s to %s: %s!" % (src, dest, str(e)),
                          level=error_level)
                 return -1
@@ -311,7 +729,7 @@ class ScriptMixin(object):
                 return -1
 
     def copytree(self, src, dest, overwrite='no_overwrite', log_level=INFO,
-                 error_level=ERROR):
+                 error_level=ERROR, link=False):
         """an implementation of shutil.copytree however it allows for
         dest to exist and implements different overwrite levels.
         overwrite uses:
@@ -319,13 +737,22 @@ class ScriptMixin(object):
         'overwrite_if_exists' will only overwrite destination paths that have
                    the same path names relative to the root of the src and
                    destination tree
-        'clobber' will replace the whole destination tree(clobber) if it exists"""
+        'clobber' will replace the whole destination tree(clobber) if it exists
+
+        Files are copied across self.config['copy_workers'] threads
+        (default 4), reflinked where the filesystem supports it.  With
+        `link', they're hardlinked when src and dest share a filesystem;
+        only use that when neither tree will be modified in place."""
 
         self.info('copying tree: %s to %s' % (src, dest))
         try:
             if overwrite == 'clobber' or not os.path.exists(dest):
                 self.rmtree(dest)
-                shutil.copytree(src, dest)
+                from mozharness.base.copier import copy_tree
+                counts = copy_tree(src, dest, link=link,
+                                   workers=self.config.get('copy_workers', 4))
+                self.debug('copied tree: %s' % ', '.join(
+                    '%d by %s' % (n, how) for how, n in sorted(counts.items())))
             elif overwrite == 'no_overwrite' or overwrite == 'overwrite_if_exists':
                 files = os.listdir(src)
                 for f in files:
@@ -335,13 +762,13 @@ class ScriptMixin(object):
                         if os.path.isdir(abs_src_f):
                             self.mkdir_p(abs_dest_f)
                             self.copytree(abs_src_f, abs_dest_f,
-                                          overwrite='clobber')
+                                          overwrite='clobber', link=link)
                         else:
-                            shutil.copy2(abs_src_f, abs_dest_f)
+                            self._copy_file_and_stat(abs_src_f, abs_dest_f, link)
                     elif overwrite == 'no_overwrite':  # destination path exists
                         if os.path.isdir(abs_src_f) and os.path.isdir(abs_dest_f):
                             self.copytree(abs_src_f, abs_dest_f,
-                                          overwrite='no_overwrite')
+                                          overwrite='no_overwrite', link=link)
                         else:
                             self.debug('ignoring path: %s as destination: \
                                     %s exists' % (abs_src_f, abs_dest_f))
@@ -353,16 +780,21 @@ class ScriptMixin(object):
                         if os.path.isdir(abs_src_f):
                             self.mkdir_p(abs_dest_f)
                             self.copytree(abs_src_f, abs_dest_f,
-                                          overwrite='overwrite_if_exists')
+                                          overwrite='overwrite_if_exists', link=link)
                         else:
-                            shutil.copy2(abs_src_f, abs_dest_f)
+                            self._copy_file_and_stat(abs_src_f, abs_dest_f, link)
             else:
                 self.fatal("%s is not a valid argument for param overwrite" % (overwrite))
-        except (IOError, shutil.Error):
+        except (IOError, OSError, shutil.Error):
             self.exception("There was an error while copying %s to %s!" % (src, dest),
                            level=error_level)
             return -1
 
+    def _copy_file_and_stat(self, src, dest, link=False):
+        from mozharness.base.copier import copy_file, LINK
+        if copy_file(src, dest, link=link) != LINK:
+            shutil.copystat(src, dest)
+
     def write_to_file(self, file_path, contents, verbose=True,
                       open_mode='w', create_parent_dir=False,
                       error_level=ERROR):
@@ -463,20 +895,57 @@ class ScriptMixin(object):
         return None
 
     # More complex commands {{{2
-    def retry(self, action, attempts=None, sleeptime=60, max_sleeptime=5 * 60,
+    def query_retry_policy(self, name, **kwargs):
+        """Return a RetryPolicy for the named kind of retry, e.g. 'download'.
+
+        Settings come from DEFAULT_RETRY_POLICIES[name], overridden by
+        self.config['retry_policies'][name], overridden by kwargs.
+        """
+        settings = dict(DEFAULT_RETRY_POLICIES.get(name, {}))
+        settings.update(self.config.get('retry_policies', {}).get(name, {}))
+        settings.update(kwargs)
+        return RetryPolicy(**settings)
+
+    def query_circuit_breaker(self):
+        """Return the CircuitBreaker shared by every retry() in this run.
+
+        circuit_breaker_threshold is how many failures in a row open the
+        circuit for a host (default 5); circuit_breaker_reset is how many
+        seconds to wait before trying it again (default 300).
+        """
+        if not self.circuit_breaker:
+            self.circuit_breaker = CircuitBreaker(
+                failure_threshold=self.config.get('circuit_breaker_threshold', 5),
+                reset_timeout=self.config.get('circuit_breaker_reset', 5 * 60),
+            )
+        return self.circuit_breaker
+
+    def retry(self, action, attempts=0, sleeptime=60, max_sleeptime=5 * 60,
               retry_exceptions=(Exception, ), good_statuses=None, cleanup=None,
               error_level=ERROR, error_message="%(action)s failed after %(attempts)d tries!",
-              failure_status=-1, log_level=INFO, args=(), kwargs={}):
+              failure_status=-1, log_level=INFO, args=(), kwargs={},
+              policy=None, circuit_key=None):
         """ Generic retry command.
             Ported from tools util.retry.
 
             Call `action' a maximum of `attempts' times until it succeeds,
-            defaulting to self.config.get('global_retries', 5).
+            defaulting to self.config.get('global_retries', 5).  With
+            attempts=None, only the max_elapsed of `policy' limits how
+            often it's called.
 
             `sleeptime' is the number of seconds to wait between attempts,
             defaulting to 60 and doubling each retry attempt, to a maximum of
             `max_sleeptime'.
 
+            `policy' is a RetryPolicy that replaces `sleeptime' and
+            `max_sleeptime'; see query_retry_policy().  It can add jitter,
+            an overall time budget, and give up early on failures that
+            won't go away by retrying.
+
+            `circuit_key', usually the host being talked to, shares a
+            CircuitBreaker across calls: after enough failures in a row
+            for that key, retry() gives up without calling `action'.
+
             `retry_exceptions' is a tuple of Exceptions that should be caught.
             If exceptions other than those listed in `retry_exceptions' are
             raised from `action', they will be raised immediately.
@@ -496,14 +965,29 @@ class ScriptMixin(object):
             self.fatal("retry() called with an uncallable method %s!" % action)
         if cleanup and not callable(cleanup):
             self.fatal("retry() called with an uncallable cleanup method %s!" % cleanup)
-        if not attempts:
+        if attempts is None:
+            if policy is None or policy.max_elapsed is None:
+                self.fatal("retry() called without attempts or a policy max_elapsed!")
+        elif not attempts:
             attempts = self.config.get("global_retries", 5)
-        if max_sleeptime < sleeptime:
-            self.debug("max_sleeptime %d less than sleeptime %d" % (
-                       max_sleeptime, sleeptime))
+        if policy is None:
+            if max_sleeptime < sleeptime:
+                self.debug("max_sleeptime %d less than sleeptime %d" % (
+                           max_sleeptime, sleeptime))
+            policy = RetryPolicy(sleeptime=sleeptime, max_sleeptime=max_sleeptime)
+        breaker = None
+        if circuit_key:
+            breaker = self.query_circuit_breaker()
+            if not breaker.allow(circuit_key):
+                self.log("retry: Not calling %s; %s has failed too often recently." %
+                         (action, circuit_key), level=error_level)
+                return failure_status
+        sleeptimes = policy.query_sleeptimes()
+        start = time.time()
         n = 0
-        while n <= attempts:
+        while attempts is None or n < attempts:
             retry = False
+            exception = status = None
             n += 1
             try:
                 self.log("retry: Calling %s with args: %s, kwargs: %s, attempt #%d" %
@@ -513,23 +997,39 @@ class ScriptMixin(object):
                     retry = True
             except retry_exceptions, e:
                 retry = True
+                exception = e
                 error_message = "%s\nCaught exception: %s" % (error_message, str(e))
 
             if not retry:
+                if breaker:
+                    breaker.record_success(circuit_key)
                 return status
-            else:
-                if cleanup:
-                    cleanup()
-                if n == attempts:
-                    self.log(error_message % {'action': action, 'attempts': n}, level=error_level)
-                    return failure_status
-                if sleeptime > 0:
-                    self.log("retry: Failed, sleeping %d seconds before retrying" %
-                             sleeptime, level=log_level)
-                    time.sleep(sleeptime)
-                    sleeptime = sleeptime * 2
-                    if sleeptime > max_sleeptime:
-                        sleeptime = max_sleeptime
+            if cleanup:
+                cleanup()
+            if policy.classify(exception=exception, status=status) == GIVE_UP:
+                self.log("retry: Not retrying; this failure won't go away.",
+                         level=log_level)
+                break
+            if breaker:
+                breaker.record_failure(circuit_key)
+                if not breaker.allow(circuit_key):
+                    self.log("retry: Not retrying; %s has failed too often recently." %
+                             circuit_key, level=log_level)
+                    break
+            if n == attempts:
+                break
+            sleeptime = sleeptimes.next()
+            if policy.max_elapsed is not None and \
+                    time.time() - start + sleeptime > policy.max_elapsed:
+                self.log("retry: Not retrying; we'd be past %d seconds." %
+                         policy.max_elapsed, level=log_level)
+                break
+            if sleeptime > 0:
+                self.log("retry: Failed, sleeping %.1f seconds before retrying" %
+                         sleeptime, level=log_level)
+                time.sleep(sleeptime)
+        self.log(error_message % {'action': action, 'attempts': n}, level=error_level)
+        return failure_status
 
     def query_env(self, partial_env=None, replace_dict=None,
                   purge_env=(),
@@ -614,11 +1114,13 @@ class ScriptMixin(object):
                     halt_on_failure=False, success_codes=None,
                     env=None, partial_env=None, return_type='status',
                     throw_exception=False, output_parser=None,
-                    output_timeout=None, fatal_exit_code=2, **kwargs):
+                    output_timeout=None, max_time=None, fatal_exit_code=2,
+                    **kwargs):
         """Run a command, with logging and error parsing.
 
         output_timeout is the number of seconds without output before the process
-        is killed.
+        is killed.  max_time is the number of seconds the process may run in
+        total before it's killed.
 
         TODO: context_lines
         TODO: error_level_override?
@@ -664,47 +1166,42 @@ class ScriptMixin(object):
         else:
             parser = output_parser
 
+        span = self.trace_command(command, cwd=cwd)
         try:
+            preexec_fn = None
+            if (output_timeout or max_time) and hasattr(os, 'setpgrp'):
+                # Run in a new process group, so a timeout kills the
+                # command's children too.
+                preexec_fn = os.setpgrp
+            p = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE,
+                                 cwd=cwd, stderr=subprocess.STDOUT, env=env,
+                                 preexec_fn=preexec_fn)
             if output_timeout:
-                def processOutput(line):
-                    parser.add_lines(line)
-
-                def onTimeout():
-                    self.info("Automation Error: mozprocess timed out after %s seconds running %s" % (str(output_timeout), str(command)))
-
-                p = ProcessHandler(command,
-                                   env=env,
-                                   cwd=cwd,
-                                   storeOutput=False,
-                                   onTimeout=(onTimeout,),
-                                   processOutputLine=[processOutput])
                 self.info("Calling %s with output_timeout %d" % (command, output_timeout))
-                p.run(outputTimeout=output_timeout)
-                p.wait()
-                if p.timedOut:
-                    self.error('timed out after %s seconds of no output' % output_timeout)
-                returncode = int(p.proc.returncode)
-            else:
-                p = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE,
-                                     cwd=cwd, stderr=subprocess.STDOUT, env=env)
-                loop = True
-                while loop:
-                    if p.poll() is not None:
-                        """Avoid losing the final lines of the log?"""
-                        loop = False
-                    while True:
-                        line = p.stdout.readline()
-                        if not line:
-                            break
-                        parser.add_lines(line)
-                returncode = p.returncode
+            self.track_process(p.pid, command)
+            try:
+                timed_out = pump_output(
+                    p, span.count_output(parser.add_lines),
+                    output_timeout=output_timeout, max_time=max_time,
+                    before_wait=lambda: self.sample_process(p.pid))
+            finally:
+                self.untrack_process(p.pid)
+            if timed_out == OUTPUT_TIMEOUT:
+                self.info("Automation Error: timed out after %s seconds of no output running %s" % (str(output_timeout), str(command)))
+                self.error('timed out after %s seconds of no output' % output_timeout)
+            elif timed_out == MAX_TIME:
+                self.info("Automation Error: timed out after %s seconds running %s" % (str(max_time), str(command)))
+                self.error('timed out after %s seconds' % max_time)
+            returncode = p.returncode
         except OSError, e:
+            span.finish(error=str(e))
             level = ERROR
             if halt_on_failure:
                 level = FATAL
             self.log('caught OS error %s: %s while running %s' % (e.errno,
                      e.strerror, command), level=level)
             return -1
+        span.finish(exit_code=returncode, timed_out=timed_out)
 
         return_level = INFO
         if returncode not in success_codes:
@@ -730,13 +1227,184 @@ class ScriptMixin(object):
             return parser.num_errors
         return returncode
 
+    def _run_parallel_job(self, job):
+        """Run one run_commands_parallel() job, with its parser logging
+        to a BufferedLogger.  Called from a worker thread.
+        """
+        command = job['command']
+        shell = True
+        if isinstance(command, list) or isinstance(command, tuple):
+            shell = False
+        preexec_fn = None
+        if (job['output_timeout'] or job['max_time']) and hasattr(os, 'setpgrp'):
+            preexec_fn = os.setpgrp
+        start = time.time()
+        span = self.trace_span(job['name'], 'command', argv=command,
+                               cwd=job['cwd'])
+        try:
+            p = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE,
+                                 cwd=job['cwd'], stderr=subprocess.STDOUT,
+                                 env=job['env'], preexec_fn=preexec_fn)
+            self.track_process(p.pid, command)
+            try:
+                job['timed_out'] = pump_output(
+                    p, span.count_output(job['parser'].add_lines),
+                    output_timeout=job['output_timeout'],
+                    max_time=job['max_time'],
+                    before_wait=lambda: self.sample_process(p.pid))
+            finally:
+                self.untrack_process(p.pid)
+            job['return_code'] = p.returncode
+        except OSError, e:
+            job['parser'].error('caught OS error %s: %s while running %s' %
+                                (e.errno, e.strerror, command))
+            job['return_code'] = -1
+        span.finish(exit_code=job['return_code'])
+        job['elapsed'] = time.time() - start
+        return job
+
+    def _log_parallel_job(self, job):
+        """Log a finished run_commands_parallel() job's output as one block."""
+        parser = job['parser']
+        self.info("##### %s output begins" % job['name'])
+        parser.log_obj.replay(self)
+        parser.log_obj = job['log_obj']
+        if job['timed_out'] == OUTPUT_TIMEOUT:
+            self.error('timed out after %s seconds of no output' % job['output_timeout'])
+        elif job['timed_out'] == MAX_TIME:
+            self.error('timed out after %s seconds' % job['max_time'])
+        return_level = INFO
+        if job['return_code'] not in job['success_codes']:
+            return_level = ERROR
+        self.log("##### %s output ends; return code %d after %.2fs" %
+                 (job['name'], job['return_code'], job['elapsed']),
+                 level=return_level)
+
+    def run_commands_parallel(self, commands, max_workers=None,
+                              error_list=None, success_codes=None,
+                              halt_on_failure=False, fatal_exit_code=2,
+                              output_timeout=None, max_time=None,
+                              keepalive_interval=300):
+        """Run commands concurrently, at most max_workers at a time
+        (default: self.config['parallel_workers'], or one per cpu).
+
+        Each item of commands is either a command, as passed to
+        run_command(), or a dict with a 'command' key and optionally
+        'name', 'cwd', 'env', 'partial_env', 'error_list', 'output_parser',
+        'success_codes', 'output_timeout' and 'max_time' keys, which
+        override the arguments given here.
+
+        Each command's output goes through its own OutputParser and is
+        held in memory until the command exits, then logged as one block.
+        While commands are running, a line is logged every
+        keepalive_interval seconds, so buildbot doesn't kill us for lack
+        of output.
+
+        Returns a list of dicts, in the same order as commands, with
+        'name', 'command', 'return_code', 'num_errors', 'parser', 'elapsed'
+        and 'timed_out' keys.
+        """
+        import multiprocessing
+        from multiprocessing.pool import ThreadPool
+        if success_codes is None:
+            success_codes = [0]
+        if not max_workers:
+            max_workers = self.config.get('parallel_workers')
+        if not max_workers:
+            try:
+                max_workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                max_workers = 1
+        jobs = []
+        to_run = []
+        for command in commands:
+            if not isinstance(command, dict):
+                command = {'command': command}
+            job = {
+                'command': command['command'],
+                'name': command.get('name'),
+                'cwd': command.get('cwd'),
+                'env': command.get('env'),
+                'success_codes': command.get('success_codes', success_codes),
+                'output_timeout': command.get('output_timeout', output_timeout),
+                'max_time': command.get('max_time', max_time),
+                'return_code': -1,
+                'timed_out': None,
+                'elapsed': 0,
+            }
+            if not job['name']:
+                if isinstance(job['command'], basestring):
+                    job['name'] = job['command']
+                else:
+                    job['name'] = subprocess.list2cmdline(job['command'])
+            if job['env'] is None and command.get('partial_env'):
+                job['env'] = self.query_env(partial_env=command['partial_env'])
+            parser = command.get('output_parser')
+            if parser is None:
+                parser = OutputParser(config=self.config, log_obj=self.log_obj,
+                                      error_list=command.get('error_list', error_list))
+            job['parser'] = parser
+            job['log_obj'] = parser.log_obj
+            parser.log_obj = BufferedLogger()
+            jobs.append(job)
+            if job['cwd'] is not None and not os.path.isdir(job['cwd']):
+                parser.log_obj = job['log_obj']
+                self.error("Can't run command %s in non-existent directory '%s'!" %
+                           (job['command'], job['cwd']))
+                continue
+            to_run.append(job)
+
+        if to_run:
+            workers = min(max_workers, len(to_run))
+            self.info("Running %d commands with %d workers." % (len(to_run), workers))
+            for job in to_run:
+                self.info("Queueing %s" % job['name'])
+            pool = ThreadPool(workers)
+            try:
+                results = pool.imap_unordered(self._run_parallel_job, to_run)
+                remaining = len(to_run)
+                while remaining:
+                    try:
+                        job = results.next(keepalive_interval)
+                    except multiprocessing.TimeoutError:
+                        self.info("Still waiting on %d commands." % remaining)
+                        continue
+                    remaining -= 1
+                    self._log_parallel_job(job)
+            finally:
+                pool.close()
+            pool.join()
+
+        status = []
+        failed = []
+        for job in jobs:
+            status.append({
+                'name': job['name'],
+                'command': job['command'],
+                'return_code': job['return_code'],
+                'num_errors': job['parser'].num_errors,
+                'parser': job['parser'],
+                'elapsed': job['elapsed'],
+                'timed_out': job['timed_out'],
+            })
+            if job['return_code'] not in job['success_codes'] or \
+                    job['parser'].num_errors:
+                failed.append(job['name'])
+        if failed and halt_on_failure:
+            self.return_code = fatal_exit_code
+            self.fatal("Halting on failure while running %s" % ', '.join(failed),
+                       exit_code=fatal_exit_code)
+        return status
+
     def get_output_from_command(self, command, cwd=None,
                                 halt_on_failure=False, env=None,
                                 silent=False, log_level=INFO,
                                 tmpfile_base_path='tmpfile',
                                 return_type='output', save_tmpfiles=False,
                                 throw_exception=False, fatal_exit_code=2,
-                                ignore_errors=False, success_codes=None):
+                                ignore_errors=False, success_codes=None,
+                                head_lines=None, tail_lines=None,
+                                max_output_size=MAX_BUFFER_SIZE):
         """Similar to run_command, but where run_command is an
         os.system(command) analog, get_output_from_command is a `command`
         analog.
@@ -744,11 +1412,17 @@ class ScriptMixin(object):
         Less error checking by design, though if we figure out how to
         do it without borking the output, great.
 
+        stdout and stderr are read concurrently through pipes into memory.
+        Past max_output_size bytes a stream is spilled to
+        tmpfile_base_path + '_stdout' or '_stderr'.  head_lines and
+        tail_lines only keep the first and/or last N lines of stdout for
+        logging and returning.  With save_tmpfiles or a return_type other
+        than 'output', both streams are written to those files in full,
+        and the latter returns their names.
+
         TODO: binary mode? silent is kinda like that.
         TODO: since p.wait() can take a long time, optionally log something
         every N seconds?
-        TODO: optionally only keep the first or last (N) line(s) of output?
-        TODO: optionally only return the tmp_stdout_filename?
 
         ignore_errors=True is for the case where a command might produce standard
         error output, but you don't particularly care; setting to True will
@@ -767,49 +1441,49 @@ class ScriptMixin(object):
             self.info("Getting output from command: %s" % command)
         if isinstance(command, list):
             self.info("Copy/paste: %s" % subprocess.list2cmdline(command))
-        # This could potentially return something?
-        tmp_stdout = None
-        tmp_stderr = None
         tmp_stdout_filename = '%s_stdout' % tmpfile_base_path
         tmp_stderr_filename = '%s_stderr' % tmpfile_base_path
         if success_codes is None:
             success_codes = [0]
 
-        # TODO probably some more elegant solution than 2 similar passes
+        if save_tmpfiles or return_type != 'output':
+            max_output_size = 0
         try:
-            tmp_stdout = open(tmp_stdout_filename, 'w')
+            stdout_buffer = OutputBuffer(max_size=max_output_size,
+                                         spill_file_name=tmp_stdout_filename,
+                                         head=head_lines, tail=tail_lines)
+            stderr_buffer = OutputBuffer(max_size=max_output_size,
+                                         spill_file_name=tmp_stderr_filename)
         except IOError:
             level = ERROR
             if halt_on_failure:
                 level = FATAL
-            self.log("Can't open %s for writing!" % tmp_stdout_filename +
-                     self.exception(), level=level)
-            return None
-        try:
-            tmp_stderr = open(tmp_stderr_filename, 'w')
-        except IOError:
-            level = ERROR
-            if halt_on_failure:
-                level = FATAL
-            self.log("Can't open %s for writing!" % tmp_stderr_filename +
+            self.log("Can't open %s for writing!" % tmpfile_base_path +
                      self.exception(), level=level)
             return None
         shell = True
         if isinstance(command, list):
             shell = False
-        p = subprocess.Popen(command, shell=shell, stdout=tmp_stdout,
-                             cwd=cwd, stderr=tmp_stderr, env=env)
-        #XXX: changed from self.debug to self.log due to this error:
-        #     TypeError: debug() takes exactly 1 argument (2 given)
-        self.log("Temporary files: %s and %s" % (tmp_stdout_filename, tmp_stderr_filename), level=DEBUG)
-        p.wait()
-        tmp_stdout.close()
-        tmp_stderr.close()
+        span = self.trace_command(command, cwd=cwd)
+        p = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE,
+                             cwd=cwd, stderr=subprocess.PIPE, env=env)
+        self.track_process(p.pid, command)
+        try:
+            pump_streams(p, [p.stdout, p.stderr],
+                         [span.count_output(stdout_buffer.write),
+                          span.count_output(stderr_buffer.write)],
+                         before_wait=lambda: self.sample_process(p.pid))
+        finally:
+            self.untrack_process(p.pid)
+        span.finish(exit_code=p.returncode)
+        for output_buffer in (stdout_buffer, stderr_buffer):
+            output_buffer.close()
+            if output_buffer.is_spilled():
+                self.log("Output spilled to %s" % output_buffer.spill_file_name,
+                         level=DEBUG)
         return_level = DEBUG
-        output = None
-        if os.path.exists(tmp_stdout_filename) and os.path.getsize(tmp_stdout_filename):
-            output = self.read_from_file(tmp_stdout_filename,
-                                         verbose=False)
+        output = stdout_buffer.getvalue() or None
+        if output is not None:
             if not silent:
                 self.log("Output received:", level=log_level)
                 output_lines = output.rstrip().splitlines()
@@ -819,12 +1493,16 @@ class ScriptMixin(object):
                     line = line.decode("utf-8")
                     self.log(' %s' % line, level=log_level)
                 output = '\n'.join(output_lines)
-        if os.path.exists(tmp_stderr_filename) and os.path.getsize(tmp_stderr_filename):
+            if stdout_buffer.dropped_lines:
+                self.log("Skipped %d lines of output." % stdout_buffer.dropped_lines,
+                         level=log_level)
+            if stdout_buffer.dropped_bytes:
+                self.warning("Dropped %d bytes of output." % stdout_buffer.dropped_bytes)
+        errors = stderr_buffer.getvalue()
+        if errors:
             if not ignore_errors:
                 return_level = ERROR
             self.log("Errors received:", level=return_level)
-            errors = self.read_from_file(tmp_stderr_filename,
-                                         verbose=False)
             for line in errors.rstrip().splitlines():
                 if not line or line.isspace():
                     continue
@@ -833,9 +1511,10 @@ class ScriptMixin(object):
         elif p.returncode not in success_codes and not ignore_errors:
             return_level = ERROR
         # Clean up.
-        if not save_tmpfiles:
-            self.rmtree(tmp_stderr_filename, log_level=DEBUG)
-            self.rmtree(tmp_stdout_filename, log_level=DEBUG)
+        if not save_tmpfiles and return_type == 'output':
+            for output_buffer in (stdout_buffer, stderr_buffer):
+                if output_buffer.is_spilled():
+                    self.rmtree(output_buffer.spill_file_name, log_level=DEBUG)
         if p.returncode and throw_exception:
             raise subprocess.CalledProcessError(p.returncode, command)
         self.log("Return code: %d" % p.returncode, level=return_level)
@@ -865,10 +1544,69 @@ class ScriptMixin(object):
 
         os.utime(file_name, times)
 
+    def extract_zip(self, zip_path, extract_to, include=None, exclude=None,
+                    halt_on_failure=False, fatal_exit_code=3):
+        """Extract zip_path into extract_to in-process, across
+        self.config['extract_workers'] threads (default: one per cpu).
+
+        `include' and `exclude' are lists of unzip-style patterns, e.g.
+        ['bin/*', 'certs/*']; existing files are overwritten, like
+        `unzip -o'.  Falls back to the unzip binary for compression methods
+        zipfile doesn't support.
+
+        Returns 0 on success, not 0 on failure.
+        """
+        import multiprocessing
+        import zipfile
+        from mozharness.base.extract import extract_zip
+        workers = self.config.get('extract_workers')
+        if not workers:
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 1
+        self.info("Extracting %s to %s with %d workers" % (zip_path, extract_to, workers))
+        if include:
+            self.info("Only extracting %s" % ', '.join(include))
+        level = ERROR
+        if halt_on_failure:
+            level = FATAL
+        start = time.time()
+        try:
+            self.mkdir_p(extract_to)
+            timings = extract_zip(zip_path, extract_to, include=include,
+                                  exclude=exclude, workers=workers)
+        except NotImplementedError, e:
+            self.info("Can't extract %s in-process (%s); using unzip." % (zip_path, str(e)))
+            command = self.query_exe('unzip', return_type='list')
+            command.extend(['-q', '-o', zip_path] + list(include or []))
+            if exclude:
+                command.append('-x')
+                command.extend(exclude)
+            # unzip return code 11 is 'no matching files were found'
+            return self.run_command(command, cwd=extract_to,
+                                    error_list=ZipErrorList,
+                                    halt_on_failure=halt_on_failure,
+                                    success_codes=[0, 11],
+                                    fatal_exit_code=fatal_exit_code)
+        except (IOError, OSError, zipfile.BadZipfile,
+                zipfile.LargeZipFile, ExtractException), e:
+            self.log("Can't extract %s to %s: %s" % (zip_path, extract_to, str(e)),
+                     level=level, exit_code=fatal_exit_code)
+            return -1
+        elapsed = time.time() - start
+        self.info("Extracted %d files (%d bytes) in %.2fs." %
+                  (len(timings), sum(t[1] for t in timings), elapsed))
+        for name, size, seconds in sorted(timings, key=lambda t: t[2],
+                                          reverse=True)[:10]:
+            self.debug(" %.3fs %s (%d bytes)" % (seconds, name, size))
+        return 0
+
     def unpack(self, filename, extract_to):
         '''
         This method allows us to extract a file regardless of its extension
         '''
+        import zipfile
         # XXX: Make sure that filename has a extension of one of our supported file formats
         m = re.search('\.tar\.(bz2|gz)$', filename)
         if m:
@@ -878,6 +1616,8 @@ class ScriptMixin(object):
                 tar_cmd = "zxfv"
             command.extend([tar_cmd, filename, "-C", extract_to])
             self.run_command(command, halt_on_failure=True)
+        elif zipfile.is_zipfile(filename):
+            self.extract_zip(filename, extract_to, halt_on_failure=True)
         else:
             # XXX implement
             pass
@@ -964,6 +1704,18 @@ def PostScriptAction(action=None):
 
 # BaseScript {{{1
 class BaseScript(ScriptMixin, LogMixin, object):
+    # Actions that only need some of the actions before them to have
+    # finished, mapped to those actions.  Any other action waits for
+    # every action before it.  Only used with self.config['parallel_actions'];
+    # see run_actions_concurrently().
+    action_dependencies = {}
+    # Actions that can be skipped while nothing they depend on has
+    # changed, mapped to dicts of 'config' keys, 'inputs' and 'outputs';
+    # see query_action_checkpoint().  Only used with
+    # self.config['checkpoint_actions'].
+    action_checkpoints = {}
+    checkpoint_store = None
+
     def __init__(self, config_options=None, ConfigClass=BaseConfig,
                  default_log_level="info", **kwargs):
         super(BaseScript, self).__init__()
@@ -981,7 +1733,7 @@ class BaseScript(ScriptMixin, LogMixin, object):
             item = getattr(self, k)
 
             # We only decorate methods, so ignore other types.
-            if not inspect.ismethod(item):
+            if not isinstance(item, types.MethodType):
                 continue
 
             if hasattr(item, '_pre_run_listener'):
@@ -1110,13 +1862,15 @@ class BaseScript(ScriptMixin, LogMixin, object):
         """This is here for run().
         """
         if hasattr(self, method_name) and callable(getattr(self, method_name)):
-            return getattr(self, method_name)()
+            with self.trace_span(method_name, 'method'):
+                return getattr(self, method_name)()
         elif error_if_missing:
             self.error("No such method %s!" % method_name)
 
     def copy_logs_to_upload_dir(self):
         """Copies logs to the upload directory"""
         self.info("Copying logs to upload dir...")
+        self.log_obj.flush()
         log_files = ['localconfig.json']
         for log_name in self.log_obj.log_files.keys():
             log_files.append(self.log_obj.log_files[log_name])
@@ -1135,6 +1889,7 @@ class BaseScript(ScriptMixin, LogMixin, object):
 
         method_name = action.replace("-", "_")
         self.action_message("Running %s step." % action)
+        span = self.trace_span(action, 'action')
 
         # An exception during a pre action listener should abort execution.
         for fn, target in self._listeners['pre_action']:
@@ -1144,7 +1899,8 @@ class BaseScript(ScriptMixin, LogMixin, object):
             try:
                 self.info("Running pre-action listener: %s" % fn)
                 method = getattr(self, fn)
-                method(action)
+                with self.trace_span(fn, 'listener', action=action):
+                    method(action)
             except Exception:
                 self.error("Exception during pre-action for %s: %s" % (
                     action, traceback.format_exc()))
@@ -1167,10 +1923,25 @@ class BaseScript(ScriptMixin, LogMixin, object):
         # We always run post action listeners, even if the main routine failed.
         success = False
         try:
-            self.info("Running main action method: %s" % method_name)
-            self._possibly_run_method("preflight_%s" % method_name)
-            self._possibly_run_method(method_name, error_if_missing=True)
-            self._possibly_run_method("postflight_%s" % method_name)
+            # After the pre-action listeners, which may add inputs.
+            checkpoint = self._query_checkpoint_fingerprint(action)
+            if checkpoint and checkpoint['current']:
+                self.info("%s hasn't changed since it last succeeded; "
+                          "skipping.  Use --force-action %s to run it "
+                          "anyway." % (action, action))
+                span.set(checkpoint='current')
+            else:
+                if checkpoint:
+                    # It may leave its outputs half done.
+                    self.query_checkpoint_store().forget(action)
+                self.info("Running main action method: %s" % method_name)
+                self._possibly_run_method("preflight_%s" % method_name)
+                self._possibly_run_method(method_name, error_if_missing=True)
+                self._possibly_run_method("postflight_%s" % method_name)
+                if checkpoint and self.return_code == 0:
+                    self.query_checkpoint_store().record(
+                        action, checkpoint['fingerprint'],
+                        checkpoint['outputs'])
             success = True
         finally:
             post_success = True
@@ -1181,18 +1952,203 @@ class BaseScript(ScriptMixin, LogMixin, object):
                 try:
                     self.info("Running post-action listener: %s" % fn)
                     method = getattr(self, fn)
-                    method(action, success=success and self.return_code == 0)
+                    with self.trace_span(fn, 'listener', action=action):
+                        method(action, success=success and self.return_code == 0)
                 except Exception:
                     post_success = False
                     self.error("Exception during post-action for %s: %s" % (
                         action, traceback.format_exc()))
 
+            span.finish(success=success and post_success)
             if not post_success:
                 self.fatal("Aborting due to failure in post-action listener.")
 
+    def query_checkpoint_store(self):
+        """Return the CheckpointStore for this work dir, kept in
+        self.config['checkpoint_file'] or abs_work_dir/checkpoints.json.
+        Clobbering the work dir forgets every checkpoint.
+        """
+        if not self.checkpoint_store:
+            path = self.config.get('checkpoint_file')
+            if not path:
+                path = os.path.join(self.query_abs_dirs()['abs_work_dir'],
+                                    'checkpoints.json')
+            from mozharness.base.checkpoint import CheckpointStore
+            self.checkpoint_store = CheckpointStore(path)
+        return self.checkpoint_store
+
+    def query_action_checkpoint(self, action):
+        """Return what decides whether `action' needs to run again, as a
+        dict of:
+
+          config   config keys it reads
+          inputs   files, directories or urls it reads; relative paths
+                   are relative to abs_work_dir
+          outputs  files or directories it leaves behind
+
+        or None if it always has to run.  Defaults to
+        self.action_checkpoints[action], with %(abs_*_dir)s in inputs
+        and outputs filled in.  Mixins override this to add inputs
+        they only know at run time.
+        """
+        if action not in self.action_checkpoints:
+            return None
+        spec = self.action_checkpoints[action]
+        dirs = self.query_abs_dirs()
+        return {
+            'config': list(spec.get('config', [])),
+            'inputs': [path % dirs for path in spec.get('inputs', [])],
+            'outputs': [path % dirs for path in spec.get('outputs', [])],
+        }
+
+    def query_action_fingerprint(self, action, checkpoint):
+        """Return the fingerprint of `action' from its config values and
+        the current state of its inputs: each file's sha1, and the size
+        and mtime of everything in each directory.  Urls and inputs that
+        don't exist only count by name.
+        """
+        from mozharness.base.checkpoint import query_fingerprint, \
+            query_directory_state
+        work_dir = self.query_abs_dirs()['abs_work_dir']
+        config_values = dict((key, self.config.get(key))
+                             for key in checkpoint['config'])
+        input_states = {}
+        files = {}
+        for name in checkpoint['inputs']:
+            path = os.path.join(work_dir, name)
+            if urlparse.urlsplit(name)[0] in ('http', 'https', 'ftp'):
+                input_states[name] = None
+            elif os.path.isfile(path):
+                files[name] = path
+            elif os.path.isdir(path):
+                input_states[name] = query_directory_state(path)
+            else:
+                input_states[name] = None
+        hashes = self.query_file_hashes(files.values(), hash_type='sha1')
+        for name, path in files.items():
+            input_states[name] = hashes[path]
+        return query_fingerprint(action, config_values, input_states)
+
+    def _query_checkpoint_fingerprint(self, action):
+        if not self.config.get('checkpoint_actions'):
+            return None
+        checkpoint = self.query_action_checkpoint(action)
+        if not checkpoint:
+            return None
+        fingerprint = self.query_action_fingerprint(action, checkpoint)
+        current = (action not in (self.config.get('force_actions') or []) and
+                   self.query_checkpoint_store().is_current(action, fingerprint))
+        return {'fingerprint': fingerprint, 'outputs': checkpoint['outputs'],
+                'current': current}
+
+    def query_action_dependencies(self, action):
+        """Return the actions that have to finish before `action' starts.
+
+        That's every action before it in all_actions, unless
+        self.action_dependencies lists fewer.  Listed actions that this
+        script doesn't have are ignored.
+        """
+        earlier = self.all_actions[:self.all_actions.index(action)]
+        if action not in self.action_dependencies:
+            return list(earlier)
+        dependencies = []
+        for dependency in self.action_dependencies[action]:
+            if dependency in earlier:
+                dependencies.append(dependency)
+            elif dependency in self.all_actions:
+                self.fatal("Action %s can't depend on %s, which comes after it!"
+                           % (action, dependency))
+        return dependencies
+
+    def _run_action_thread(self, action, finished):
+        set_thread_prefix = getattr(self.log_obj, 'set_thread_prefix', None)
+        if set_thread_prefix:
+            set_thread_prefix('[%s] ' % action)
+        exc_info = None
+        try:
+            self.run_action(action)
+        except BaseException:
+            # Including the SystemExit from fatal().
+            exc_info = sys.exc_info()
+        finally:
+            if set_thread_prefix:
+                set_thread_prefix(None)
+            finished.put((action, exc_info))
+
+    def run_actions_concurrently(self):
+        """Run all_actions like run() does, but start each action as soon
+        as the ones it depends on have finished (see
+        query_action_dependencies()), on up to
+        self.config['parallel_action_workers'] threads (default 4).
+
+        Each action's log lines start with its name.  Pre- and post-action
+        listeners run in the action's thread, right before and after it;
+        listeners for every action may run concurrently.  Concurrent
+        actions mustn't rely on the current directory.
+
+        If an action fails or halts, no more are started; once the running
+        ones have finished, its exception (or SystemExit) is raised again.
+        """
+        workers = max(1, self.config.get('parallel_action_workers', 4))
+        dependencies = dict((action, set(self.query_action_dependencies(action)))
+                            for action in self.all_actions)
+        pending = list(self.all_actions)
+        running = set()
+        done = set()
+        finished = Queue.Queue()
+        failure = None
+        while running or (pending and not failure):
+            started = True
+            while started and not failure:
+                started = False
+                for action in pending:
+                    if len(running) >= workers:
+                        break
+                    if not dependencies[action] <= done:
+                        continue
+                    pending.remove(action)
+                    started = True
+                    if action not in self.actions:
+                        # Just logs that it's skipped.
+                        self.run_action(action)
+                        done.add(action)
+                    else:
+                        running.add(action)
+                        thread = threading.Thread(
+                            target=self._run_action_thread,
+                            args=(action, finished), name=action)
+                        thread.daemon = True
+                        thread.start()
+                    break
+            if not running:
+                continue
+            try:
+                # With a timeout, so KeyboardInterrupt still gets through.
+                action, exc_info = finished.get(True, 1)
+            except Queue.Empty:
+                continue
+            running.remove(action)
+            done.add(action)
+            if exc_info and not failure:
+                failure = exc_info
+        if failure:
+            raise failure[0], failure[1], failure[2]
+
     def run(self):
-        """Default run method.
-        This is the "do everything" method, based on actions and all_actions.
+        """Default run method; see _run().
+
+        If self.config['trace'] is set, a trace of the run is written to
+        the upload dir at the end, even if the run halted; see
+        write_trace().
+        """
+        try:
+            with self.trace_span('run', 'script'):
+                return self._run()
+        finally:
+            self.write_trace()
+
+    def _run(self):
+        """The "do everything" method, based on actions and all_actions.
 
         First run self.dump_config() if it exists.
         Second, go through the list of all_actions.
@@ -1209,7 +2165,8 @@ class BaseScript(ScriptMixin, LogMixin, object):
             try:
                 self.info("Running pre-run listener: %s" % fn)
                 method = getattr(self, fn)
-                method()
+                with self.trace_span(fn, 'listener'):
+                    method()
             except Exception:
                 self.error("Exception during pre-run listener: %s" %
                            traceback.format_exc())
@@ -1225,9 +2182,14 @@ class BaseScript(ScriptMixin, LogMixin, object):
                 self.fatal("Aborting due to failure in pre-run listener.")
 
         self.dump_config()
+        if self.config.get('deferred_delete'):
+            self.query_deferred_deleter()
         try:
-            for action in self.all_actions:
-                self.run_action(action)
+            if self.config.get('parallel_actions'):
+                self.run_actions_concurrently()
+            else:
+                for action in self.all_actions:
+                    self.run_action(action)
         except Exception:
             self.fatal("Uncaught exception: %s" % traceback.format_exc())
         finally:
@@ -1236,7 +2198,8 @@ class BaseScript(ScriptMixin, LogMixin, object):
                 try:
                     self.info("Running post-run listener: %s" % fn)
                     method = getattr(self, fn)
-                    method()
+                    with self.trace_span(fn, 'listener'):
+                        method()
                 except Exception:
                     post_success = False
                     self.error("Exception during post-run listener: %s" %
@@ -1244,11 +2207,33 @@ class BaseScript(ScriptMixin, LogMixin, object):
 
             if not post_success:
                 self.fatal("Aborting due to failure in post-run listener.")
+        self.wait_for_deferred_deletes()
         if self.config.get("copy_logs_post_run", True):
             self.copy_logs_to_upload_dir()
 
         return self.return_code
 
+    def write_trace(self):
+        """Write the run's trace, if tracing is on, as trace event JSON
+        to self.config['trace_file'] (default: trace.json in the upload
+        dir).  Open it in chrome://tracing or https://ui.perfetto.dev .
+        """
+        tracer = self.query_tracer()
+        if not tracer:
+            return
+        trace_file = self.config.get('trace_file')
+        if not trace_file:
+            trace_file = os.path.join(self.query_abs_dirs()['abs_upload_dir'],
+                                      'trace.json')
+        self.mkdir_p(os.path.dirname(os.path.abspath(trace_file)))
+        try:
+            tracer.write(trace_file)
+        except (IOError, OSError), e:
+            self.warning("Can't write trace to %s: %s" % (trace_file, str(e)))
+            return
+        self.info("Wrote a trace of %d spans to %s" %
+                  (len(tracer.events), trace_file))
+
     def run_and_exit(self):
         """Runs the script and exits the current interpreter."""
         sys.exit(self.run())
@@ -1312,6 +2297,7 @@ class BaseScript(ScriptMixin, LogMixin, object):
             "log_format": '%(asctime)s %(levelname)8s - %(message)s',
             "log_to_console": True,
             "append_to_log": False,
+            "async_logging": False,
         }
         log_type = self.config.get("log_type", "multi")
         if log_type == "multi":
@@ -8,7 +8,6 @@
 """
 
 import getpass
-import hashlib
 import os
 import re
 import subprocess
@@ -41,14 +40,9 @@ class BaseSigningMixin(object):
         self.info(" %s" % str(length))
         return length
 
-    # TODO this should be parallelized with the to-be-written BaseHelper!
     def query_sha512sum(self, file_path):
         self.info("Determining sha512sum for %s" % file_path)
-        m = hashlib.sha512()
-        contents = self.read_from_file(file_path, verbose=False,
-                                       open_mode='rb')
-        m.update(contents)
-        sha512 = m.hexdigest()
+        sha512 = self.query_file_hash(file_path, hash_type='sha512')
         self.info(" %s" % sha512)
         return sha512
 
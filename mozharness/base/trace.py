@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Record where a run's time goes, as Chrome trace events.
+
+A Tracer collects spans: named, timed sections of the run, each with a
+category and a dict of args.  write() saves them in the trace event
+format, which chrome://tracing and https://ui.perfetto.dev can open.
+
+When tracing is off, callers get NULL_SPAN, which does nothing, so the
+instrumentation can stay in place.
+"""
+
+import os
+import threading
+import time
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+
+def query_command_name(command):
+    """Return a short name for a command list or shell string, to
+    label its span.
+    """
+    if isinstance(command, basestring):
+        command = command.split()
+    if not command:
+        return 'command'
+    return os.path.basename(str(command[0]))
+
+
+# Span {{{1
+class Span(object):
+    """A section of the run, timed from when it's created until
+    finish() is called or the with block exits.
+    """
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = time.time()
+        self.finished = False
+
+    def set(self, **args):
+        """Add or change args to record with the span."""
+        self.args.update(args)
+
+    def count_output(self, callback):
+        """Wrap an output callback so the span records how many bytes
+        went through it, as args['output_bytes'].  The callback can take
+        a chunk of output or a list of lines.
+        """
+        self.args.setdefault('output_bytes', 0)
+
+        def _counted(data):
+            if isinstance(data, list):
+                self.args['output_bytes'] += sum(len(line) + 1 for line in data)
+            else:
+                self.args['output_bytes'] += len(data)
+            return callback(data)
+        return _counted
+
+    def finish(self, **args):
+        if self.finished:
+            return
+        self.finished = True
+        self.args.update(args)
+        self.tracer.add_span(self, time.time())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.args['exception'] = exc_type.__name__
+        self.finish()
+
+
+class _NullSpan(object):
+    """Stands in for a Span when tracing is off."""
+    def set(self, **args):
+        pass
+
+    def count_output(self, callback):
+        return callback
+
+    def finish(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+
+# Tracer {{{1
+class Tracer(object):
+    """Collect spans from any thread, and write them out as a trace
+    event JSON file.
+    """
+    def __init__(self, process_name=None):
+        self.pid = os.getpid()
+        self.process_name = process_name
+        self.events = []
+        self.thread_names = {}
+
+    def span(self, name, cat, **args):
+        return Span(self, name, cat, args)
+
+    def add_span(self, span, end):
+        thread = threading.current_thread()
+        self.thread_names[thread.ident] = thread.name
+        # list.append is atomic, so no lock is needed.
+        self.events.append({
+            'name': span.name,
+            'cat': span.cat,
+            'ph': 'X',
+            'ts': int(span.start * 1000000),
+            'dur': int((end - span.start) * 1000000),
+            'pid': self.pid,
+            'tid': thread.ident,
+            'args': span.args,
+        })
+
+    def query_trace(self):
+        """Return the trace as a dict in the trace event format."""
+        metadata = []
+        if self.process_name:
+            metadata.append({'name': 'process_name', 'ph': 'M',
+                             'pid': self.pid,
+                             'args': {'name': self.process_name}})
+        for tid, name in self.thread_names.items():
+            metadata.append({'name': 'thread_name', 'ph': 'M',
+                             'pid': self.pid, 'tid': tid,
+                             'args': {'name': name}})
+        return {
+            'traceEvents': metadata + sorted(self.events,
+                                             key=lambda e: e['ts']),
+            'displayTimeUnit': 'ms',
+        }
+
+    def write(self, path):
+        fh = open(path, 'w')
+        try:
+            json.dump(self.query_trace(), fh, default=str)
+        finally:
+            fh.close()
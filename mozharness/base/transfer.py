@@ -7,15 +7,17 @@
 """Generic ways to upload + download files.
 """
 
+import hashlib
 import os
 import pprint
-import urllib2
+import time
 try:
     import simplejson as json
     assert json
 except ImportError:
     import json
 
+from mozharness.base.copier import copy_file
 from mozharness.base.errors import SSHErrorList
 from mozharness.base.log import DEBUG, ERROR
 
@@ -104,6 +106,7 @@ class TransferMixin(object):
             return -3
 
     def load_json_from_url(self, url, timeout=30, log_level=DEBUG):
+        import urllib2
         self.log("Attempting to download %s; timeout=%i" % (url, timeout),
                  level=log_level)
         try:
@@ -114,3 +117,188 @@ class TransferMixin(object):
             self.exception(message="Unable to download %s!" % url)
             raise
         return j
+
+
+# DownloadCache {{{1
+class DownloadCache(object):
+    """On-disk cache of downloaded files, keyed by url.
+
+    Each entry is a data file plus a json metadata file holding the url,
+    the ETag/Last-Modified validators the server sent, the sha512 of the
+    contents, and the last time the entry was used.  The cache is bounded
+    to max_size bytes; the least recently used entries are evicted first.
+
+    Entries are written via atomic renames, so several jobs on the same
+    machine can share one cache_dir.
+
+    This object doesn't talk to the network or log; ScriptMixin does that.
+    """
+    tmp_prefix = '.download-'
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _key(self, url):
+        return hashlib.sha1(url).hexdigest()
+
+    def query_data_path(self, url):
+        return os.path.join(self.cache_dir, self._key(url))
+
+    def _query_meta_path(self, url):
+        return os.path.join(self.cache_dir, '%s.json' % self._key(url))
+
+    def _read_meta(self, meta_path):
+        try:
+            fh = open(meta_path)
+            try:
+                return json.load(fh)
+            finally:
+                fh.close()
+        except (IOError, ValueError):
+            return None
+
+    def _write_meta(self, url, meta):
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                        prefix=self.tmp_prefix)
+        fh = os.fdopen(fd, 'w')
+        json.dump(meta, fh)
+        fh.close()
+        os.rename(tmp_path, self._query_meta_path(url))
+
+    def lookup(self, url):
+        """Return the metadata dict for url, or None if there's no usable
+        entry.
+
+        An entry whose data file has changed size or mtime since it was
+        cached (e.g. a hardlinked copy was written to) is dropped.
+        """
+        meta = self._read_meta(self._query_meta_path(url))
+        if meta is None or meta.get('url') != url:
+            return None
+        try:
+            st = os.stat(self.query_data_path(url))
+        except OSError:
+            self.remove(url)
+            return None
+        if st.st_size != meta['size'] or int(st.st_mtime) != meta['mtime']:
+            self.remove(url)
+            return None
+        return meta
+
+    def is_valid(self, entry, validators=None, sha512=None):
+        """Decide whether entry can be used in place of a download.
+
+        A known sha512 takes precedence; otherwise the ETag, then
+        the Last-Modified header the server currently sends must match
+        the ones stored with the entry.
+        """
+        if sha512:
+            return entry.get('sha512') == sha512
+        if not validators:
+            return False
+        if validators.get('etag') and entry.get('etag'):
+            return validators['etag'] == entry['etag']
+        if validators.get('last_modified') and entry.get('last_modified'):
+            return validators['last_modified'] == entry['last_modified']
+        return False
+
+    def query_tmp_path(self):
+        """Return a new temporary file path inside the cache dir, so
+        a finished download can be renamed into place.
+        """
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                        prefix=self.tmp_prefix)
+        os.close(fd)
+        return tmp_path
+
+    def add(self, url, file_path, validators=None, sha512=None):
+        """Move file_path (from query_tmp_path()) into the cache as the
+        entry for url, then evict old entries if we're over max_size.
+        """
+        data_path = self.query_data_path(url)
+        os.rename(file_path, data_path)
+        st = os.stat(data_path)
+        meta = {
+            'url': url,
+            'size': st.st_size,
+            'mtime': int(st.st_mtime),
+            'sha512': sha512,
+            'last_used': time.time(),
+        }
+        meta.update(validators or {})
+        self._write_meta(url, meta)
+        self.prune(keep=url)
+        return meta
+
+    def touch(self, url):
+        meta = self._read_meta(self._query_meta_path(url))
+        if meta is not None:
+            meta['last_used'] = time.time()
+            self._write_meta(url, meta)
+
+    def remove(self, url):
+        for path in (self._query_meta_path(url), self.query_data_path(url)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def copy_out(self, url, dest, hardlink=True):
+        """Place the cached file for url at dest, hardlinking (or else
+        reflinking) if we can.
+
+        Returns True on success, False if the entry disappeared underneath
+        us (e.g. evicted by another job).
+        """
+        data_path = self.query_data_path(url)
+        try:
+            copy_file(data_path, dest, link=hardlink)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def query_entries(self):
+        """Return a list of metadata dicts for every entry in the cache.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json') or name.startswith(self.tmp_prefix):
+                continue
+            meta = self._read_meta(os.path.join(self.cache_dir, name))
+            if meta and 'url' in meta:
+                entries.append(meta)
+        return entries
+
+    def prune(self, keep=None, tmp_max_age=24 * 60 * 60):
+        """Evict least recently used entries until the cache fits in
+        max_size, never evicting `keep'.  Also clean up temp files left
+        behind by interrupted runs.
+        """
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(self.tmp_prefix):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > tmp_max_age:
+                        os.remove(path)
+                except OSError:
+                    pass
+        if self.max_size is None:
+            return []
+        entries = sorted(self.query_entries(), key=lambda e: e['last_used'])
+        total = sum(e['size'] for e in entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            if entry['url'] == keep:
+                continue
+            self.remove(entry['url'])
+            total -= entry['size']
+            evicted.append(entry['url'])
+        return evicted
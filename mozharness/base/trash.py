@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Delete directory trees in the background.
+
+DeferredDeleter.delete() renames a directory into its trash directory,
+which is atomic and instant, and leaves the slow part, unlinking every
+file, to a background thread.  That only works on the trash directory's
+volume; anything elsewhere is left for the caller to delete itself.
+Anything left in the trash directory by a run that died before finishing
+is deleted the next time it's used.
+"""
+
+import atexit
+import errno
+import os
+import Queue
+import shutil
+import threading
+
+TRASH_DIR_NAME = '.mozharness_trash'
+
+
+def query_default_trash_dir(work_dir):
+    """Return the trash directory for a run in work_dir: TRASH_DIR_NAME
+    next to it, so it's on the same volume as most of what the run
+    deletes, and only shared with runs in the same parent directory.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(work_dir)),
+                        TRASH_DIR_NAME)
+
+
+def _is_running(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class DeferredDeleter(object):
+    """Move directories into trash_dir and delete them in a background
+    thread.  join() waits for every pending delete; it's also called at
+    exit, so nothing is left half-deleted by a normal exit.
+    """
+    def __init__(self, trash_dir, remove=shutil.rmtree):
+        self.trash_dir = os.path.abspath(trash_dir)
+        self.remove = remove
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.trash_device = None
+        self.errors = []
+        self.lock = threading.Lock()
+        atexit.register(self.join)
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            try:
+                if entry is None:
+                    break
+                try:
+                    self.remove(entry)
+                except Exception, e:
+                    with self.lock:
+                        self.errors.append((entry, e))
+            finally:
+                self.queue.task_done()
+
+    def _queue(self, entry):
+        with self.lock:
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+        self.queue.put(entry)
+
+    def prepare(self):
+        """Create the trash directory, and queue anything stale in it for
+        deletion, the first time it's called.  Returns the trash
+        directory's device.
+        """
+        if self.trash_device is None:
+            if not os.path.isdir(self.trash_dir):
+                os.makedirs(self.trash_dir)
+            self.purge_trash_dir()
+            self.trash_device = os.stat(self.trash_dir).st_dev
+        return self.trash_device
+
+    def purge_trash_dir(self):
+        """Queue deletion of the entries in the trash directory left
+        behind by runs that are no longer running.  Returns the list of
+        entries queued.
+        """
+        trash_dir = self.trash_dir
+        stale = []
+        for name in os.listdir(trash_dir):
+            try:
+                pid = int(name.split('-', 1)[0])
+            except ValueError:
+                pid = None
+            if pid is not None and _is_running(pid):
+                continue
+            entry = os.path.join(trash_dir, name)
+            stale.append(entry)
+            self._queue(entry)
+        return stale
+
+    def delete(self, path):
+        """Move the directory at path to the trash and delete it in the
+        background.
+
+        Returns the path it was moved to, or None if it couldn't be moved
+        (it isn't a directory, or the trash isn't on the same volume), in
+        which case the caller should delete it itself.
+        """
+        import tempfile
+        if os.path.islink(path) or not os.path.isdir(path):
+            return None
+        entry = None
+        try:
+            device = self.prepare()
+            if os.stat(os.path.dirname(os.path.realpath(path))).st_dev != device:
+                return None
+            entry = tempfile.mkdtemp(prefix='%d-' % os.getpid(),
+                                     dir=self.trash_dir)
+            dest = os.path.join(entry, os.path.basename(os.path.normpath(path)))
+            os.rename(path, dest)
+        except OSError:
+            if entry:
+                try:
+                    os.rmdir(entry)
+                except OSError:
+                    # The background purge of a later run gets it.
+                    pass
+            return None
+        self._queue(entry)
+        return dest
+
+    def join(self):
+        """Wait for every queued delete to finish.
+
+        Returns a list of (path, exception) for the deletes that failed.
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread:
+            self.queue.put(None)
+            thread.join()
+        with self.lock:
+            errors, self.errors = self.errors, []
+        return errors
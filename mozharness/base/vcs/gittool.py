@@ -6,6 +6,8 @@ from mozharness.base.script import ScriptMixin
 from mozharness.base.log import LogMixin, OutputParser
 from mozharness.base.errors import GitErrorList, VCSException
 
+FULL_REVISION_RE = re.compile('^[0-9a-f]{40}$')
+
 
 class GittoolParser(OutputParser):
     """
@@ -43,6 +45,39 @@ class GittoolVCS(ScriptMixin, LogMixin):
         # }
         self.vcs_config = vcs_config
         self.gittool = self.query_exe('gittool.py', return_type='list')
+        self.git = self.query_exe('git', return_type='list')
+
+    def has_revision(self, dest, revision):
+        """Returns True if `revision' is a full SHA-1, and the clone at
+        dest already has that commit.
+
+        Branch and tag names, and abbreviated SHA-1s, can point somewhere
+        else after a fetch, so they're never taken to be present.
+        """
+        if not revision or not FULL_REVISION_RE.match(revision):
+            return False
+        if not os.path.isdir(os.path.join(dest, '.git')):
+            return False
+        return self.run_command(self.git + ['cat-file', '-e', '%s^{commit}' % revision],
+                                cwd=dest, success_codes=[0, 1, 128]) == 0
+
+    def _checkout_local_revision(self, dest, revision, clean=False):
+        """Checks out `revision' in dest without fetching, if dest already
+        has it.  Returns True if it did.
+        """
+        if not self.has_revision(dest, revision):
+            return False
+        self.info("%s already has revision %s; not fetching." % (dest, revision))
+        if self.run_command(self.git + ['checkout', '-q', '-f', revision],
+                            cwd=dest, error_list=GitErrorList):
+            self.warning("Can't check out %s in %s; running gittool.py." %
+                         (revision, dest))
+            return False
+        if clean and self.run_command(self.git + ['clean', '-f', '-d', '-x'],
+                                      cwd=dest, error_list=GitErrorList):
+            self.warning("Can't clean %s; running gittool.py." % dest)
+            return False
+        return True
 
     def ensure_repo_and_revision(self):
         """Makes sure that `dest` is has `revision` or `branch` checked out
@@ -59,6 +94,8 @@ class GittoolVCS(ScriptMixin, LogMixin):
         revision = c.get('revision')
         branch = c.get('branch')
         clean = c.get('clean')
+        if self._checkout_local_revision(dest, revision, clean=clean):
+            return revision
         share_base = c.get('vcs_share_base', os.environ.get("GIT_SHARE_BASE_DIR", None))
         env = {'PATH': os.environ.get('PATH')}
         if share_base is not None:
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Run hg commands through Mercurial's command server.
+
+Every hg process pays for starting Python and loading extensions before
+it does anything.  A command server (`hg serve --cmdserver pipe') pays
+that once, then runs each command sent to it in a few milliseconds.
+HgCommandServer keeps one running for a repository and speaks its
+protocol: https://www.mercurial-scm.org/wiki/CommandServer
+"""
+
+import os
+import struct
+import subprocess
+import threading
+
+from mozharness.base.errors import HgCommandServerException
+
+
+def query_repo_id(path):
+    """Return what identifies the repository at path: the device and
+    inode of its .hg directory, which change if it's clobbered and
+    cloned again.  None if there's no repository there.
+    """
+    try:
+        st = os.stat(os.path.join(path, '.hg'))
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+# HgCommandServer {{{1
+class HgCommandServer(object):
+    """A command server for the repository at path, run with the hg
+    command list.
+    """
+    def __init__(self, hg, path, env=None):
+        self.hg = list(hg)
+        self.path = path
+        self.env = dict(env or os.environ)
+        # Output meant for scripts, not people, whatever the hgrc says.
+        self.env['HGPLAIN'] = '1'
+        self.lock = threading.Lock()
+        self.process = None
+        self.repo_id = None
+
+    def start(self):
+        """Start the server, and check it can run commands."""
+        self.repo_id = query_repo_id(self.path)
+        devnull = open(os.devnull, 'w')
+        try:
+            self.process = subprocess.Popen(
+                self.hg + ['serve', '--cmdserver', 'pipe'], cwd=self.path,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=devnull,
+                env=self.env)
+        except OSError, e:
+            raise HgCommandServerException("Can't start hg command server in %s: %s" %
+                                           (self.path, e))
+        finally:
+            devnull.close()
+        try:
+            channel, hello = self._read_channel()
+        except HgCommandServerException:
+            self.close()
+            raise
+        capabilities = []
+        for line in hello.splitlines():
+            if line.startswith('capabilities:'):
+                capabilities = line.split(':', 1)[1].split()
+        if channel != 'o' or 'runcommand' not in capabilities:
+            self.close()
+            raise HgCommandServerException("hg command server in %s can't run commands: %r" %
+                                           (self.path, hello))
+
+    def is_current(self):
+        """Return True if the server is still running, on the same
+        repository it started on.
+        """
+        return (self.process is not None and self.process.poll() is None and
+                query_repo_id(self.path) == self.repo_id)
+
+    def _read(self, length):
+        data = self.process.stdout.read(length)
+        if len(data) != length:
+            raise HgCommandServerException("hg command server in %s went away" %
+                                           self.path)
+        return data
+
+    def _read_channel(self):
+        channel, length = struct.unpack('>cI', self._read(5))
+        # Upper case channels are the server asking for input; the
+        # length is how much it wants, not data that follows.
+        if channel.isupper():
+            return channel, length
+        return channel, self._read(length)
+
+    def _write(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (IOError, OSError), e:
+            raise HgCommandServerException("Can't write to hg command server in %s: %s" %
+                                           (self.path, e))
+
+    def runcommand(self, args):
+        """Run hg with args, and return (return code, stdout, stderr).
+
+        Commands that ask for input get none.  Raises
+        HgCommandServerException if the server fails; it's closed, and
+        shouldn't be used again.
+        """
+        data = '\0'.join(a.encode('utf-8') if isinstance(a, unicode) else str(a)
+                         for a in args)
+        output = []
+        errors = []
+        with self.lock:
+            try:
+                self._write('runcommand\n' + struct.pack('>I', len(data)) + data)
+                while True:
+                    channel, payload = self._read_channel()
+                    if channel == 'o':
+                        output.append(payload)
+                    elif channel == 'e':
+                        errors.append(payload)
+                    elif channel == 'r':
+                        return (struct.unpack('>i', payload)[0],
+                                ''.join(output), ''.join(errors))
+                    elif channel in ('I', 'L'):
+                        # End of input.
+                        self._write(struct.pack('>I', 0))
+                    elif channel.isupper():
+                        raise HgCommandServerException(
+                            "hg command server in %s wants unknown channel %s" %
+                            (self.path, channel))
+                    # Other lower case channels (debug, messages) can be
+                    # ignored.
+            except HgCommandServerException:
+                self.close()
+                raise
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            # The server exits when its input ends.
+            self.process.stdin.close()
+            self.process.stdout.close()
+        except (IOError, OSError):
+            pass
+        self.process.wait()
+        self.process = None
+
+
+# HgCommandServerPool {{{1
+class HgCommandServerPool(object):
+    """One command server per hg command and repository, started when
+    first needed, and started again if its repository was replaced.
+
+    If a server can't be started with an hg command, that hg doesn't
+    support command servers; run() returns None for it from then on.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers = {}
+        self.unavailable = set()
+
+    def run(self, hg, path, args):
+        """Run hg with args in the repository at path, and return
+        (return code, stdout, stderr), or None if that can't be done
+        through a command server.
+        """
+        hg = tuple(hg)
+        path = os.path.realpath(path)
+        key = (hg, path)
+        with self.lock:
+            if hg in self.unavailable or query_repo_id(path) is None:
+                return None
+            server = self.servers.get(key)
+            if server is not None and not server.is_current():
+                server.close()
+                server = None
+            if server is None:
+                server = HgCommandServer(hg, path)
+                try:
+                    server.start()
+                except HgCommandServerException:
+                    self.unavailable.add(hg)
+                    return None
+                self.servers[key] = server
+        try:
+            return server.runcommand(args)
+        except HgCommandServerException:
+            with self.lock:
+                if self.servers.get(key) is server:
+                    del self.servers[key]
+            return None
+
+    def close(self):
+        with self.lock:
+            servers = self.servers.values()
+            self.servers = {}
+        for server in servers:
+            server.close()
@@ -13,14 +13,19 @@ https://hg.mozilla.org/build/tools/file/cf265ea8fb5e/lib/python/util/hg.py .
 import os
 import re
 import subprocess
+import time
+from contextlib import contextmanager
 from urlparse import urlsplit
 
 import sys
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.dirname(sys.path[0]))))
 
 from mozharness.base.errors import HgErrorList, VCSException
-from mozharness.base.log import LogMixin
+from mozharness.base.log import LogMixin, WARNING
 from mozharness.base.script import ScriptMixin
+from mozharness.base.vcs.hgcmdserver import HgCommandServerPool
+from mozharness.base.vcs.sharedrepo import SharedRepoLock, \
+    read_sync_record, write_sync_record
 
 HG_OPTIONS = ['--config', 'ui.merge=internal:merge']
 
@@ -29,6 +34,7 @@ HG_OPTIONS = ['--config', 'ui.merge=internal:merge']
 # TODO Add the various tag functionality that are currently in
 # build/tools/scripts to MercurialVCS -- generic tagging logic belongs here.
 REVISION, BRANCH = 0, 1
+FULL_REVISION_RE = re.compile('^[0-9a-f]{40}$')
 
 
 def make_hg_url(hg_host, repo_path, protocol='http', revision=None,
@@ -57,6 +63,17 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
     #  apply_and_push, update, get_revision, out, BRANCH, REVISION,
     #  get_branches, cleanOutgoingRevs
 
+    # Shared by every MercurialVCS in this process, since hg's version,
+    # whether its share extension works, and the repositories' command
+    # servers don't depend on the caller.
+    hg_versions = {}
+    hg_can_share = {}
+    command_servers = HgCommandServerPool()
+    # How often to check a busy shared repo lock, and to say we're
+    # still waiting for it.
+    share_lock_poll_interval = 1
+    share_lock_report_interval = 60
+
     def __init__(self, log_obj=None, config=None, vcs_config=None,
                  script_obj=None):
         super(MercurialVCS, self).__init__()
@@ -74,6 +91,8 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
         #  revision: revision,
         #  ssh_username: ssh_username,
         #  ssh_key: ssh_key,
+        #  clone_bundle: path or url of a bundle to seed clones of repo with,
+        #  clone_bundle_sha512: its sha512, to trust a cached copy,
         # }
         self.vcs_config = vcs_config or {}
         self.hg = self.query_exe("hg", return_type="list") + HG_OPTIONS
@@ -96,26 +115,87 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
         else:
             return urlsplit(repo).path.lstrip("/")
 
+    def query_hg_output(self, args, path, ignore_errors=False):
+        """Return the output of `hg args' run in the repository at path,
+        like get_output_from_command() would.
+
+        For commands that only read from the repository.  If
+        self.config['hg_command_server'] is set, they're run through a
+        command server kept running for path, saving an hg startup each.
+        hg is run as usual if the command server can't be used, or the
+        command fails, so errors are reported the usual way.
+        """
+        if self.config.get('hg_command_server'):
+            result = self.command_servers.run(self.hg, path, args)
+            if result and result[0] == 0:
+                self.info("Ran command: %s in %s (hg command server)" %
+                          (self.hg + args, path))
+                output = '\n'.join(result[1].rstrip().splitlines())
+                if output:
+                    self.info("Output received: %s" % output)
+                return output or None
+        return self.get_output_from_command(self.hg + args, cwd=path,
+                                            ignore_errors=ignore_errors)
+
     def get_revision_from_path(self, path):
         """Returns which revision directory `path` currently has checked out."""
-        return self.get_output_from_command(
-            self.hg + ['parent', '--template', '{node|short}'], cwd=path
-        )
+        return self.query_hg_output(['parent', '--template', '{node|short}'],
+                                    path)
 
     def get_branch_from_path(self, path):
-        branch = self.get_output_from_command(self.hg + ['branch'], cwd=path)
+        branch = self.query_hg_output(['branch'], path)
         return str(branch).strip()
 
     def get_branches_from_path(self, path):
         branches = []
-        for line in self.get_output_from_command(self.hg + ['branches', '-c'],
-                                                 cwd=path).splitlines():
+        for line in self.query_hg_output(['branches', '-c'],
+                                         path).splitlines():
             branches.append(line.split()[0])
         return branches
 
+    def query_revision_id(self, path, revision):
+        """Returns the short id of `revision' in the repository at path,
+        or None if it isn't there."""
+        output = self.query_hg_output(['id', '-i', '-r', revision], path,
+                                      ignore_errors=True)
+        if output:
+            return output.split()[0]
+
+    def has_revision(self, path, revision):
+        """Returns True if `revision' is a full changeset id, and the
+        repository at path has it.
+
+        Names and short ids can point somewhere else after a pull, so
+        they're never taken to be present.
+        """
+        if not revision or not FULL_REVISION_RE.match(revision):
+            return False
+        if not os.path.isdir(os.path.join(path, '.hg')):
+            return False
+        return self.query_revision_id(path, revision) is not None
+
+    def _has_pinned_revision(self, path, revision):
+        """Returns True, and says so, if there's no need to pull into path
+        since it already has the full changeset id `revision'."""
+        if self.has_revision(path, revision):
+            self.info("%s already has revision %s; not pulling." %
+                      (path, revision))
+            return True
+        return False
+
+    def query_heads(self, path):
+        """Returns the full ids of every head in the repository at path,
+        sorted, including closed heads."""
+        output = self.query_hg_output(['heads', '--closed', '--template',
+                                       '{node}\n'], path)
+        return sorted((output or '').split())
+
     def hg_ver(self):
         """Returns the current version of hg, as a tuple of
         (major, minor, build)"""
+        key = tuple(self.hg)
+        if key in self.hg_versions:
+            return self.hg_versions[key]
         ver_string = self.get_output_from_command(self.hg + ['-q', 'version'])
         match = re.search("\(version ([0-9.]+)\)", ver_string)
         if match:
@@ -126,6 +206,7 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
         else:
             ver = (0, 0, 0)
         self.debug("Running hg version %s" % str(ver))
+        self.hg_versions[key] = ver
         return ver
 
     def update(self, dest, branch=None, revision=None):
@@ -183,6 +264,12 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
             self.info("Removing %s before clone." % dest)
             self.rmtree(dest)
 
+        if self._clone_from_bundle(repo, dest, branch=branch,
+                                   revision=revision):
+            if update_dest:
+                return self.update(dest, branch, revision)
+            return
+
         cmd = self.hg + ['clone']
         if not update_dest:
             cmd.append('-U')
@@ -205,6 +292,70 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
         if update_dest:
             return self.update(dest, branch, revision)
 
+    def _query_clone_bundle(self, repo, dest):
+        """Returns (local path, whether it was downloaded) of the bundle
+        to seed a clone of repo with, or (None, False) if there isn't one.
+
+        vcs_config['clone_bundle'] only applies to clones of
+        vcs_config['repo'].  A url is downloaded next to dest, through the
+        download cache if there is one.
+        """
+        bundle = self.vcs_config.get('clone_bundle')
+        if not bundle or not self.vcs_config.get('repo') or \
+                self._make_absolute(repo) != self._make_absolute(self.vcs_config['repo']):
+            return None, False
+        scheme = urlsplit(bundle).scheme
+        if scheme == 'file':
+            bundle = bundle[len('file://'):]
+        elif scheme:
+            file_name = '%s.bundle' % dest.rstrip(os.sep)
+            status = self.download_file(
+                bundle, file_name=file_name, error_level=WARNING,
+                expected_sha512=self.vcs_config.get('clone_bundle_sha512'))
+            if status != file_name:
+                return None, False
+            return file_name, True
+        if not os.path.exists(bundle):
+            self.warning("Clone bundle %s doesn't exist!" % bundle)
+            return None, False
+        return bundle, False
+
+    def _clone_from_bundle(self, repo, dest, branch=None, revision=None):
+        """Makes dest a clone of repo, without a working copy, by applying
+        a bundle of most of its history locally, then pulling only what's
+        missing from repo.  Returns True if it did, or False if there's no
+        bundle, or it didn't work; dest is then removed again.
+        """
+        bundle, downloaded = self._query_clone_bundle(repo, dest)
+        if not bundle:
+            return False
+        self.info("Seeding %s from bundle %s." % (dest, bundle))
+        output_timeout = self.config.get("vcs_output_timeout",
+                                         self.vcs_config.get("output_timeout"))
+        try:
+            if self.run_command(self.hg + ['init', dest],
+                                error_list=HgErrorList) or \
+                    self.run_command(self.hg + ['unbundle', bundle], cwd=dest,
+                                     error_list=HgErrorList,
+                                     output_timeout=output_timeout):
+                raise VCSException("Unable to apply bundle %s to %s!" %
+                                   (bundle, dest))
+            # Make it look cloned from repo, for later pulls and pushes.
+            self.write_to_file(os.path.join(dest, '.hg', 'hgrc'),
+                               "[paths]\ndefault = %s\n" % self._make_absolute(repo))
+            self.pull(repo, dest, update_dest=False, branch=branch,
+                      revision=revision)
+        except VCSException:
+            self.warning("Couldn't seed %s from bundle %s; cloning instead." %
+                         (dest, bundle))
+            self.exception(level='debug')
+            self.rmtree(dest)
+            return False
+        finally:
+            if downloaded:
+                self.rmtree(bundle)
+        return True
+
     def common_args(self, revision=None, branch=None, ssh_username=None,
                     ssh_key=None):
         """Fill in common hg arguments, encapsulating logic checks that
@@ -307,6 +458,10 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
     def query_can_share(self):
         if self.can_share is not None:
             return self.can_share
+        key = tuple(self.hg)
+        if key in self.hg_can_share:
+            self.can_share = self.hg_can_share[key]
+            return self.can_share
         # Check that 'hg share' works
         self.can_share = True
         try:
@@ -328,6 +483,7 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
             self.can_share = False
         if self.can_share:
             self.info("hg share works.")
+        self.hg_can_share[key] = self.can_share
         return self.can_share
 
     def _ensure_shared_repo_and_revision(self, share_base):
@@ -373,20 +529,13 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
                 self.info("We're currently shared from %s, but are being requested to pull from %s (%s); clobbering" % (dest_shared_path_data, repo, norm_shared_repo))
                 self.rmtree(dest)
 
-        self.info("Updating shared repo")
-        if os.path.exists(shared_repo):
-            try:
-                self.pull(repo, shared_repo)
-            except VCSException:
-                self.warning("Error pulling changes into %s from %s; clobbering" % (shared_repo, repo))
-                self.exception(level='debug')
-                self.clone(repo, shared_repo)
-        else:
-            self.clone(repo, shared_repo)
+        with self._lock_shared_repo(shared_repo):
+            self._update_shared_repo(repo, shared_repo, revision)
 
         if os.path.exists(dest):
             try:
-                self.pull(shared_repo, dest)
+                if not self._has_pinned_revision(dest, revision):
+                    self.pull(shared_repo, dest)
                 status = self.update(dest, branch=branch, revision=revision)
                 return status
             except VCSException:
@@ -415,6 +564,81 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
             self.exception(level='error')
             self.rmtree(dest)
 
+    def _query_share_option(self, name, default=None):
+        """Returns vcs_config[name], or config[name] if it isn't set."""
+        return self.vcs_config.get(name, self.config.get(name, default))
+
+    @contextmanager
+    def _lock_shared_repo(self, shared_repo):
+        """Holds the lock on shared_repo, waiting for it for up to
+        vcs_share_lock_timeout seconds (forever if unset) if another job
+        is updating it.
+        """
+        lock = SharedRepoLock(shared_repo)
+        if not lock.try_acquire():
+            timeout = self._query_share_option('vcs_share_lock_timeout')
+            start = last_report = time.time()
+            self.info("Waiting for the lock on shared repo %s, held by %s." %
+                      (shared_repo, lock.query_holder()))
+            while not lock.try_acquire():
+                now = time.time()
+                if timeout is not None and now - start >= timeout:
+                    raise VCSException("Timed out after %d seconds waiting for the lock on shared repo %s, held by %s!" %
+                                       (now - start, shared_repo, lock.query_holder()))
+                if now - last_report >= self.share_lock_report_interval:
+                    self.info("Still waiting for the lock on shared repo %s after %d seconds, held by %s." %
+                              (shared_repo, now - start, lock.query_holder()))
+                    last_report = now
+                time.sleep(self.share_lock_poll_interval)
+            self.info("Got the lock on shared repo %s after waiting %.1f seconds." %
+                      (shared_repo, time.time() - start))
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def _query_recently_synced(self, repo, shared_repo):
+        """Returns True if shared_repo was pulled from repo less than
+        vcs_share_sync_window seconds ago, and its heads haven't changed
+        since.
+        """
+        window = self._query_share_option('vcs_share_sync_window')
+        if not window:
+            return False
+        record = read_sync_record(shared_repo)
+        if not record or record.get('repo') != repo:
+            return False
+        age = time.time() - record['time']
+        if age < 0 or age > window:
+            return False
+        if record['heads'] != self.query_heads(shared_repo):
+            return False
+        self.info("Shared repo %s was pulled from %s %d seconds ago; not pulling again." %
+                  (shared_repo, repo, age))
+        return True
+
+    def _update_shared_repo(self, repo, shared_repo, revision=None):
+        """Brings shared_repo up to date with repo, unless it already has
+        revision, or a sibling job has just pulled it.  Call with the lock
+        on shared_repo held.
+        """
+        if os.path.exists(shared_repo):
+            if self._has_pinned_revision(shared_repo, revision):
+                return
+            if self._query_recently_synced(repo, shared_repo):
+                return
+            self.info("Updating shared repo")
+            try:
+                self.pull(repo, shared_repo)
+            except VCSException:
+                self.warning("Error pulling changes into %s from %s; clobbering" % (shared_repo, repo))
+                self.exception(level='debug')
+                self.clone(repo, shared_repo)
+        else:
+            self.info("Updating shared repo")
+            self.clone(repo, shared_repo)
+        write_sync_record(shared_repo, repo, self.query_heads(shared_repo))
+
     def share(self, source, dest, branch=None, revision=None):
         """Creates a new working directory in "dest" that shares history
         with "source" using Mercurial's share extension
@@ -460,7 +684,8 @@ class MercurialVCS(ScriptMixin, LogMixin, object):
         # Non-shared
         if os.path.exists(dest):
             try:
-                self.pull(repo, dest)
+                if not self._has_pinned_revision(dest, revision):
+                    self.pull(repo, dest)
                 return self.update(dest, branch=branch, revision=revision)
             except VCSException:
                 self.warning("Error pulling changes into %s from %s; clobbering" % (dest, repo))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Coordinate the jobs on a machine that use the same shared repository.
+
+With vcs_share_base set, every job keeps one store per remote repository
+under it, and shares its working directories from that.  SharedRepoLock
+keeps two jobs from updating a store at once, and the sync record
+remembers when a store was last pulled and what its heads were then, so
+a job starting just after a sibling pulled needn't pull again.
+"""
+
+import errno
+import os
+import time
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SYNC_RECORD = 'mozharness-sync.json'
+
+
+# SharedRepoLock {{{1
+class SharedRepoLock(object):
+    """An exclusive lock on the store at path, across processes and
+    threads: an flock() on path.lock, next to the store, since the store
+    itself may not exist yet.
+
+    Without fcntl (Windows) there's nothing to lock with, and
+    try_acquire() always succeeds.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path).rstrip(os.sep) + '.lock'
+        self.fh = None
+
+    def try_acquire(self):
+        """Take the lock if nobody holds it.  Returns whether we have it."""
+        if fcntl is None:
+            return True
+        parent = os.path.dirname(self.path)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # Another job made it first.
+                if not os.path.isdir(parent):
+                    raise
+        fh = open(self.path, 'a+')
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError, e:
+            fh.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        # Say who we are, for anybody waiting on us.
+        import socket
+        fh.seek(0)
+        fh.truncate()
+        fh.write("pid %d on %s since %s" % (os.getpid(), socket.gethostname(),
+                                             time.strftime('%H:%M:%S')))
+        fh.flush()
+        self.fh = fh
+        return True
+
+    def query_holder(self):
+        """Return who the lock file says holds the lock, or None."""
+        try:
+            fh = open(self.path)
+            try:
+                return fh.read().strip() or None
+            finally:
+                fh.close()
+        except IOError:
+            return None
+
+    def release(self):
+        if self.fh is None:
+            return
+        self.fh.truncate(0)
+        fcntl.flock(self.fh.fileno(), fcntl.LOCK_UN)
+        self.fh.close()
+        self.fh = None
+
+
+# sync records {{{1
+def read_sync_record(path):
+    """Return the sync record of the store at path: a dict with the repo
+    it was last pulled from, the time of that pull, and the heads it had
+    afterwards.  None if there isn't a readable one.
+    """
+    try:
+        fh = open(os.path.join(path, '.hg', SYNC_RECORD))
+        try:
+            return json.load(fh)
+        finally:
+            fh.close()
+    except (IOError, ValueError):
+        return None
+
+
+def write_sync_record(path, repo, heads, now=None):
+    """Record that the store at path was just pulled from repo, and now
+    has heads.  It's kept inside .hg, so clobbering the store drops it.
+    """
+    import tempfile
+    record = {
+        'repo': repo,
+        'time': time.time() if now is None else now,
+        'heads': sorted(heads),
+    }
+    hg_dir = os.path.join(path, '.hg')
+    fd, tmp_path = tempfile.mkstemp(dir=hg_dir, prefix='.sync-')
+    fh = os.fdopen(fd, 'w')
+    try:
+        json.dump(record, fh)
+    finally:
+        fh.close()
+    os.rename(tmp_path, os.path.join(hg_dir, SYNC_RECORD))
+    return record
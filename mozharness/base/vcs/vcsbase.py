@@ -7,12 +7,13 @@
 """Generic VCS support.
 """
 
-from copy import deepcopy
 import os
 import sys
+import urlparse
 
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.dirname(sys.path[0]))))
 
+from mozharness.base.config import make_immutable
 from mozharness.base.errors import VCSException
 from mozharness.base.log import FATAL
 from mozharness.base.script import BaseScript
@@ -83,29 +84,92 @@ class VCSMixin(object):
             error_level=error_level,
             error_message="Automation Error: Can't checkout %s!" % kwargs['repo'],
             args=(vcs_obj, kwargs['dest']),
+            policy=self.query_retry_policy('vcs'),
+            circuit_key=urlparse.urlparse(kwargs['repo']).netloc,
         )
 
+    def _query_checkout_repo(self, repo, parent_dir):
+        """Return repo, with a relative path to a local repo made
+        relative to parent_dir rather than the current directory.
+        """
+        if '://' in repo or os.path.isabs(repo):
+            return repo
+        path = os.path.join(parent_dir, repo)
+        if os.path.exists(path):
+            return path
+        return repo
+
+    def _vcs_checkout_thread(self, job):
+        """Check out one of vcs_checkout_repos()'s repos, in a worker
+        thread.  Returns (revision, exc_info); the SystemExit from a fatal
+        error is caught too, so the caller can raise it.
+        """
+        dest, kwargs, failures = job
+        if failures:
+            # Another repo failed; don't start any more.
+            return None, None
+        set_thread_prefix = getattr(self.log_obj, 'set_thread_prefix', None)
+        if set_thread_prefix:
+            set_thread_prefix('[%s] ' % dest)
+        try:
+            return self.vcs_checkout(**kwargs), None
+        except BaseException:
+            failures.append(True)
+            return None, sys.exc_info()
+        finally:
+            if set_thread_prefix:
+                set_thread_prefix(None)
+
     def vcs_checkout_repos(self, repo_list, parent_dir=None,
-                           tag_override=None, **kwargs):
-        """Check out a list of repos.
+                           tag_override=None, max_workers=None, **kwargs):
+        """Check out a list of repos into parent_dir, and return a dict
+        mapping each repo's dest to its repo and the revision checked out.
+
+        Up to max_workers repos (default
+        self.config['vcs_checkout_workers'], or 1) are checked out at a
+        time, each with its own retries.  If one fails, no more are
+        started, and once the others finish its error is raised again.
+
+        Relative dests and local repo paths are relative to parent_dir;
+        the current directory isn't used or changed.
         """
-        orig_dir = os.getcwd()
         c = self.config
         if not parent_dir:
             parent_dir = os.path.join(c['base_work_dir'], c['work_dir'])
+        parent_dir = os.path.abspath(parent_dir)
         self.mkdir_p(parent_dir)
-        self.chdir(parent_dir)
-        revision_dict = {}
-        kwargs_orig = deepcopy(kwargs)
+        # Each repo's kwargs share everything but the repo's own settings.
+        kwargs_orig = make_immutable(kwargs)
+        repos = []
         for repo_dict in repo_list:
-            kwargs = deepcopy(kwargs_orig)
-            kwargs.update(repo_dict)
+            kwargs = kwargs_orig.overlay(repo_dict)
             if tag_override:
-                kwargs['revision'] = tag_override
+                kwargs = kwargs.overlay(revision=tag_override)
             dest = self.query_dest(kwargs)
-            revision_dict[dest] = {'repo': kwargs['repo']}
-            revision_dict[dest]['revision'] = self.vcs_checkout(**kwargs)
-        self.chdir(orig_dir)
+            repos.append((dest, kwargs['repo'], kwargs.overlay(
+                dest=os.path.join(parent_dir, dest),
+                repo=self._query_checkout_repo(kwargs['repo'], parent_dir),
+            )))
+        max_workers = max_workers or c.get('vcs_checkout_workers') or 1
+        if max_workers > 1 and len(repos) > 1:
+            from multiprocessing.pool import ThreadPool
+            failures = []
+            pool = ThreadPool(min(max_workers, len(repos)))
+            try:
+                results = pool.map(self._vcs_checkout_thread,
+                                   [(r[0], r[2], failures) for r in repos], 1)
+            finally:
+                pool.close()
+                pool.join()
+            for revision, exc_info in results:
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+            revisions = [revision for revision, exc_info in results]
+        else:
+            revisions = [self.vcs_checkout(**r[2]) for r in repos]
+        revision_dict = {}
+        for (dest, repo, kwargs), revision in zip(repos, revisions):
+            revision_dict[dest] = {'repo': repo, 'revision': revision}
         return revision_dict
 
 
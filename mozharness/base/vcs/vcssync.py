@@ -37,6 +37,7 @@ class VCSSyncScript(VCSScript):
         subject = "[vcs2vcs] Successful conversion for %s" % job_name
         text = ''
         error_contents = ''
+        self.log_obj.flush()
         error_log = os.path.join(dirs['abs_log_dir'], self.log_obj.log_files[ERROR])
         info_log = os.path.join(dirs['abs_log_dir'], self.log_obj.log_files[INFO])
         if os.path.exists(error_log) and os.path.getsize(error_log) > 0:
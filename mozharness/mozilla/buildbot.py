@@ -74,6 +74,7 @@ class BuildbotMixin(object):
             # Set failure if our log > buildbot_max_log_size (bug 876159)
             if self.config.get("buildbot_max_log_size") and self.log_obj:
                 # Find the path to the default log
+                self.log_obj.flush()
                 dirs = self.query_abs_dirs()
                 log_file = os.path.join(
                     dirs['abs_log_dir'],
@@ -16,8 +16,6 @@ import pprint
 import subprocess
 import re
 import time
-import uuid
-import copy
 import glob
 from itertools import chain
 
@@ -652,6 +650,7 @@ or run without that action (ie: --no-{action})"
             self.builduid = self.buildbot_config['properties']['builduid']
         else:
             self.info("Creating builduid through uuid hex")
+            import uuid
             self.builduid = uuid.uuid4().hex
 
         if self.builduid:
@@ -764,7 +763,7 @@ or run without that action (ie: --no-{action})"
 
         # let's evoke the base query_env and make a copy of it
         # as we don't always want every key below added to the same dict
-        env = copy.deepcopy(
+        env = dict(
             super(BuildScript, self).query_env(replace_dict=replace_dict,
                                                **kwargs)
         )
@@ -1186,24 +1185,21 @@ or run without that action (ie: --no-{action})"
     def _set_file_properties(self, file_name, find_dir, prop_type,
                              error_level=ERROR):
         c = self.config
-        dirs = self.query_abs_dirs()
         error_msg = "Not setting props: %s{Filename, Size, Hash}" % prop_type
-        cmd = ["find", find_dir, "-maxdepth", "1", "-type",
-               "f", "-name", file_name]
-        file_path = self.get_output_from_command(cmd,
-                                                 dirs['abs_work_dir'])
-        if not file_path:
+        matches = [f for f in glob.glob(os.path.join(find_dir, file_name))
+                   if os.path.isfile(f)]
+        if len(matches) != 1:
             self.error(error_msg)
-            self.error("Can't determine filepath with cmd: %s" % (str(cmd),))
+            self.error("Can't determine filepath for %s in %s: found %s" %
+                       (file_name, find_dir, str(matches)))
             return
+        file_path = matches[0]
 
-        cmd = [
-            self.query_exe('openssl'), 'dgst',
-            '-%s' % (c.get("hash_type", "sha512"),), file_path
-        ]
-        hash_prop = self.get_output_from_command(cmd, dirs['abs_work_dir'])
-        if not hash_prop:
-            self.log("undetermined hash_prop with cmd: %s" % (str(cmd),),
+        hash_type = c.get("hash_type", "sha512")
+        try:
+            hash_prop = self.query_file_hash(file_path, hash_type=hash_type)
+        except (IOError, OSError, ValueError), e:
+            self.log("undetermined hash_prop for %s: %s" % (file_path, str(e)),
                      level=error_level)
             self.log(error_msg, level=error_level)
             return
@@ -1214,7 +1210,7 @@ or run without that action (ie: --no-{action})"
                                    os.path.getsize(file_path),
                                    write_to_file=True)
         self.set_buildbot_property(prop_type + 'Hash',
-                                   hash_prop.strip().split(' ', 2)[1],
+                                   hash_prop,
                                    write_to_file=True)
 
     def _query_previous_buildid(self):
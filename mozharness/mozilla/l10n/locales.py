@@ -10,7 +10,6 @@
 import os
 from urlparse import urljoin
 import sys
-from copy import deepcopy
 
 sys.path.insert(1, os.path.dirname(sys.path[0]))
 
@@ -164,9 +163,9 @@ class LocalesMixin(ChunkingMixin):
         if c.get("l10n_repos"):
             if c.get("user_repo_override"):
                 replace_dict['user_repo_override'] = c['user_repo_override']
-                for repo_dict in deepcopy(c['l10n_repos']):
-                    repo_dict['repo'] = repo_dict['repo'] % replace_dict
-                    repos.append(repo_dict)
+                for repo_dict in c['l10n_repos']:
+                    repos.append(repo_dict.overlay(
+                        repo=repo_dict['repo'] % replace_dict))
             else:
                 repos = c.get("l10n_repos")
             self.vcs_checkout_repos(repos, tag_override=c.get('tag_override'))
@@ -6,13 +6,13 @@
 # ***** END LICENSE BLOCK *****
 """Support for hg/git mapper
 """
-import urllib2
-import time
 try:
     import simplejson as json
 except ImportError:
     import json
 
+from mozharness.base.log import FATAL
+
 
 class MapperMixin:
     def query_mapper(self, mapper_url, project, vcs, rev,
@@ -32,7 +32,7 @@ class MapperMixin:
                 revision you're asking about), then set this to False. If True,
                 then will return the revision, or cause a fatal error.
             attempts (int): How many times to try to do the lookup
-            sleeptime (int): How long to sleep between attempts
+            sleeptime (int): The longest to sleep between attempts
             project_name (str): Used for logging only to give a more
                 descriptive name to the project, otherwise just uses the
                 project parameter
@@ -40,31 +40,39 @@ class MapperMixin:
         Returns:
             A revision string, or None
         """
+        import urllib2
         if project_name is None:
             project_name = project
         url = mapper_url.format(project=project, vcs=vcs, rev=rev)
         self.info('Mapping %s revision to %s using %s' % (project_name, vcs, url))
-        n = 1
-        while n <= attempts:
-            try:
-                r = urllib2.urlopen(url, timeout=10)
-                j = json.loads(r.readline())
-                if j['%s_rev' % vcs] is None:
-                    if require_answer:
-                        raise Exception("Mapper returned a revision of None; maybe it needs more time.")
-                    else:
-                        self.warning("Mapper returned a revision of None.  Accepting because require_answer is False.")
-                return j['%s_rev' % vcs]
-            except Exception, err:
-                self.warning('Error: %s' % str(err))
-                if n == attempts:
-                    self.fatal('Giving up on %s %s revision for %s.' % (project_name, vcs, rev))
-                if sleeptime > 0:
-                    self.info('Sleeping %i seconds before retrying' % sleeptime)
-                    time.sleep(sleeptime)
-                continue
-            finally:
-                n += 1
+
+        def _query_mapper():
+            r = urllib2.urlopen(url, timeout=10)
+            j = json.loads(r.readline())
+            if j['%s_rev' % vcs] is None:
+                if require_answer:
+                    raise Exception("Mapper returned a revision of None; maybe it needs more time.")
+                else:
+                    self.warning("Mapper returned a revision of None.  Accepting because require_answer is False.")
+            return j['%s_rev' % vcs]
+
+        # Start retrying quickly, backing off to sleeptime, for as long as
+        # attempts * sleeptime used to take; with quick retries that's more
+        # than `attempts' tries.  There's no circuit breaker: "not mapped
+        # yet" is a healthy mapper's answer, and we keep asking until it
+        # knows.
+        max_elapsed = attempts * sleeptime
+        policy = self.query_retry_policy(
+            'mapper', sleeptime=min(1, sleeptime), max_sleeptime=sleeptime,
+            max_elapsed=max_elapsed or None,
+        )
+        return self.retry(
+            _query_mapper,
+            attempts=None if max_elapsed else attempts,
+            policy=policy,
+            error_level=FATAL,
+            error_message='Giving up on %s %s revision for %s.' % (project_name, vcs, rev),
+        )
 
     def query_mapper_git_revision(self, url, project, rev, **kwargs):
         """
@@ -10,6 +10,7 @@
 # Figure out where our external_tools are
 # These are in a sibling directory to the 'mozharness' module
 import os
+import urlparse
 import mozharness
 external_tools_path = os.path.join(
     os.path.abspath(os.path.dirname(os.path.dirname(mozharness.__file__))),
@@ -105,7 +106,9 @@ class PurgeMixin(object):
 
         retval = self.retry(self.run_command, attempts=3, good_statuses=(0,), args=[cmd],
                  kwargs={'cwd':os.path.dirname(self.buildbot_config['properties']['basedir']),
-                         'error_list':error_list})
+                         'error_list':error_list},
+                 policy=self.query_retry_policy('clobberer'),
+                 circuit_key=urlparse.urlparse(clobberer_url).netloc)
         if retval != 0:
             self.fatal("failed to clobber build", exit_code=2)
 
@@ -13,7 +13,7 @@ import time
 # load modules from parent dir
 sys.path.insert(1, os.path.dirname(os.path.dirname(sys.path[0])))
 
-from mozharness.base.errors import TarErrorList, ZipErrorList
+from mozharness.base.errors import TarErrorList
 from mozharness.base.log import INFO, ERROR, WARNING, FATAL
 from mozharness.base.script import PreScriptAction
 from mozharness.base.transfer import TransferMixin
@@ -202,8 +202,6 @@ class GaiaTest(TestingMixin, TooltoolMixin, MercurialScript, TransferMixin,
                              fatal_exit_code=3)
         else:
             # a tooltool xre.zip
-            command = self.query_exe('unzip', return_type='list')
-            command.extend(['-q', '-o', filename])
             # Gaia assumes that xpcshell is in a 'xulrunner-sdk' dir, but
             # xre.zip doesn't have a top-level directory name, so we'll
             # create it.
@@ -211,10 +209,7 @@ class GaiaTest(TestingMixin, TooltoolMixin, MercurialScript, TransferMixin,
                                       self.config.get('xre_path'))
             if not os.access(parent_dir, os.F_OK):
                 self.mkdir_p(parent_dir, error_level=FATAL)
-            self.run_command(command,
-                             cwd=parent_dir,
-                             error_list=ZipErrorList,
-                             halt_on_failure=True,
+            self.extract_zip(filename, parent_dir, halt_on_failure=True,
                              fatal_exit_code=3)
 
     def _retry_download_file(self, url, file_name, error_level=FATAL):
@@ -7,10 +7,9 @@
 
 import copy
 import os
-import platform
 
 from mozharness.base.config import ReadOnlyDict, parse_config_file
-from mozharness.base.errors import BaseErrorList
+from mozharness.base.errors import BaseErrorList, ExtractException
 from mozharness.base.log import FATAL
 from mozharness.base.python import (
     ResourceMonitoringMixin,
@@ -59,6 +58,12 @@ testing_config_options = [
      "choices": ['ondemand', 'true'],
      "help": "Download and extract crash reporter symbols.",
       }],
+    [["--streaming-unzip"],
+     {"action": "store_true",
+     "dest": "streaming_unzip",
+     "default": False,
+     "help": "Extract test zips while downloading them, without saving the zip.",
+      }],
 ] + copy.deepcopy(virtualenv_config_options)
 
 
@@ -80,6 +85,13 @@ class TestingMixin(VirtualenvMixin, BuildbotMixin, ResourceMonitoringMixin):
     jsshell_url = None
     minidump_stackwalk_path = None
     default_tools_repo = 'https://hg.mozilla.org/build/tools'
+    # With --parallel-actions, fetch the build and tests while the repos
+    # are pulled; see BaseScript.run_actions_concurrently().  Some pulls
+    # (marionette's, gaia's) pick their revision from buildbot_config.
+    action_dependencies = {
+        'download-and-extract': ['clobber', 'read-buildbot-config'],
+        'pull': ['clobber', 'read-buildbot-config'],
+    }
 
     def query_jsshell_url(self):
         """
@@ -204,34 +216,66 @@ You can set this by:
                                     error_level=FATAL)
         self.test_zip_path = os.path.realpath(source)
 
+    def _stream_download_unzip(self, url, parent_dir, target_unzip_dirs=None):
+        """Download url and extract it into parent_dir as it arrives,
+        without writing the zip itself to disk.  Only members matching
+        target_unzip_dirs are written.
+
+        This is only done with self.config['streaming_unzip'] and no
+        download cache (which wants the zip on disk anyway).  Returns
+        False if the zip wasn't extracted this way, so the caller can fall
+        back to download + unzip.  Halts on network failure.
+        """
+        if not self.config.get('streaming_unzip') or self.query_download_cache():
+            return False
+        import socket
+        import urllib2
+        from mozharness.base.extract import extract_zip_stream
+        self.info("Downloading and extracting %s to %s" % (url, parent_dir))
+        self.mkdir_p(parent_dir)
+
+        def _extract():
+            f = urllib2.urlopen(url, timeout=30)
+            try:
+                return extract_zip_stream(f, parent_dir,
+                                          include=target_unzip_dirs)
+            finally:
+                f.close()
+
+        try:
+            extracted = self.retry(
+                _extract,
+                retry_exceptions=(urllib2.URLError, socket.timeout,
+                                  socket.error),
+                failure_status=None,
+                error_message="Can't download and extract %s!" % url,
+                error_level=FATAL,
+            )
+        except ExtractException, e:
+            self.warning("Can't extract %s while downloading: %s; "
+                         "falling back to download + unzip." % (url, str(e)))
+            return False
+        self.info("Extracted %d files." % len(extracted))
+        return True
+
     def _download_unzip(self, url, parent_dir):
         """Generic download+unzip.
         This is hardcoded to halt on failure.
         We should probably change some other methods to call this."""
+        if self._stream_download_unzip(url, parent_dir):
+            return
         dirs = self.query_abs_dirs()
         zipfile = self.download_file(url, parent_dir=dirs['abs_work_dir'],
                                      error_level=FATAL)
-        command = self.query_exe('unzip', return_type='list')
-        command.extend(['-q', '-o', zipfile])
-        self.run_command(command, cwd=parent_dir, halt_on_failure=True,
-                         fatal_exit_code=3, output_timeout=1760)
+        self.extract_zip(zipfile, parent_dir, halt_on_failure=True,
+                         fatal_exit_code=3)
 
     def _extract_test_zip(self, target_unzip_dirs=None):
         dirs = self.query_abs_dirs()
-        unzip = self.query_exe("unzip")
         test_install_dir = dirs.get('abs_test_install_dir',
                                     os.path.join(dirs['abs_work_dir'], 'tests'))
-        self.mkdir_p(test_install_dir)
-        # adding overwrite flag otherwise subprocess.Popen hangs on waiting for
-        # input in a hidden pipe whenever this action is run twice without
-        # clobber
-        unzip_cmd = [unzip, '-q', '-o', self.test_zip_path]
-        if target_unzip_dirs:
-            unzip_cmd.extend(target_unzip_dirs)
-        # TODO error_list
-        # unzip return code 11 is 'no matching files were found'
-        self.run_command(unzip_cmd, cwd=test_install_dir,
-                         halt_on_failure=True, success_codes=[0, 11],
+        self.extract_zip(self.test_zip_path, test_install_dir,
+                         include=target_unzip_dirs, halt_on_failure=True,
                          fatal_exit_code=3)
 
     def _read_tree_config(self):
@@ -285,8 +329,8 @@ You can set this by:
                                     error_level=FATAL)
         self.set_buildbot_property("symbols_url", self.symbols_url,
                                    write_to_file=True)
-        self.run_command(['unzip', '-q', source], cwd=self.symbols_path,
-                         halt_on_failure=True, fatal_exit_code=3)
+        self.extract_zip(source, self.symbols_path, halt_on_failure=True,
+                         fatal_exit_code=3)
 
     def download_and_extract(self, target_unzip_dirs=None):
         """
@@ -304,8 +348,13 @@ You can set this by:
                 setattr(self, attr, new_url)
 
         if self.test_url:
-            self._download_test_zip()
-            self._extract_test_zip(target_unzip_dirs=target_unzip_dirs)
+            dirs = self.query_abs_dirs()
+            test_install_dir = dirs.get('abs_test_install_dir',
+                                        os.path.join(dirs['abs_work_dir'], 'tests'))
+            if not self._stream_download_unzip(self.test_url, test_install_dir,
+                                               target_unzip_dirs=target_unzip_dirs):
+                self._download_test_zip()
+                self._extract_test_zip(target_unzip_dirs=target_unzip_dirs)
             self._read_tree_config()
         self._download_installer()
         if self.config.get('download_symbols'):
@@ -365,6 +414,7 @@ Did you run with --create-virtualenv? Is mozinstall in virtualenv_modules?""")
             self.vcs_checkout(**repos[0])
 
     def query_minidump_stackwalk(self):
+        import platform
         if self.minidump_stackwalk_path:
             return self.minidump_stackwalk_path
 
@@ -395,6 +445,7 @@ Did you run with --create-virtualenv? Is mozinstall in virtualenv_modules?""")
         return self.minidump_stackwalk_path
 
     def _run_cmd_checks(self, suites):
+        import platform
         if not suites:
             return
         dirs = self.query_abs_dirs()
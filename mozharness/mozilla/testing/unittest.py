@@ -192,9 +192,8 @@ class EmulatorMixin(object):
         dirs = self.query_abs_dirs()
         if self.tooltool_fetch(manifest_path, output_dir=dirs['abs_work_dir']):
             self.fatal("Unable to download emulator via tooltool!")
-        unzip = self.query_exe("unzip")
-        unzip_cmd = [unzip, '-q', os.path.join(dirs['abs_work_dir'], "emulator.zip")]
-        self.run_command(unzip_cmd, cwd=dirs['abs_emulator_dir'], halt_on_failure=True,
+        self.extract_zip(os.path.join(dirs['abs_work_dir'], "emulator.zip"),
+                         dirs['abs_emulator_dir'], halt_on_failure=True,
                          fatal_exit_code=3)
 
     def install_emulator(self):
@@ -30,6 +30,7 @@ class TooltoolMixin(object):
             good_statuses=(0, ),
             error_message="Tooltool %s fetch failed!" % manifest,
             error_level=FATAL,
+            policy=self.query_retry_policy('tooltool'),
         )
         if bootstrap_cmd is not None:
             self.retry(
@@ -42,6 +43,7 @@ class TooltoolMixin(object):
                 good_statuses=(0, ),
                 error_message="Tooltool bootstrap %s failed!" % str(bootstrap_cmd),
                 error_level=FATAL,
+                policy=self.query_retry_policy('tooltool'),
             )
 
     def create_tooltool_manifest(self, contents, path=None):
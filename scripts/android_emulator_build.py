@@ -409,10 +409,9 @@ class EmulatorBuild(BaseScript, PurgeMixin):
                 self.fatal("unable to find *tests.zip at ftp://%s/%s" % (host,path))
             url = "ftp://%s/%s/%s" % (host,path,zipname)
             self.download_file(url, file_name=zipname, parent_dir=self.workdir)
-            self.run_command(["unzip", zipname,
-                              "bin/sutAgentAndroid.apk",
-                              "bin/Watcher.apk"],
-                             cwd=self.workdir,
+            self.extract_zip(os.path.join(self.workdir, zipname), self.workdir,
+                             include=["bin/sutAgentAndroid.apk",
+                                      "bin/Watcher.apk"],
                              halt_on_failure=True)
 
 
@@ -359,10 +359,8 @@ class AndroidEmulatorTest(BlobUploadMixin, TestingMixin, TooltoolMixin, Emulator
             #find appname from package-name.txt - assumes download-and-extract has completed successfully
             apk_dir = self.abs_dirs['abs_work_dir']
             self.apk_path = os.path.join(apk_dir, self.installer_path)
-            unzip = self.query_exe("unzip")
             package_path = os.path.join(apk_dir, 'package-name.txt')
-            unzip_cmd = [unzip, '-q', '-o',  self.apk_path]
-            self.run_command(unzip_cmd, cwd=apk_dir, halt_on_failure=True)
+            self.extract_zip(self.apk_path, apk_dir, halt_on_failure=True)
             self.app_name = str(self.read_from_file(package_path, verbose=True)).rstrip()
         return self.app_name
 
@@ -419,15 +417,10 @@ class AndroidEmulatorTest(BlobUploadMixin, TestingMixin, TooltoolMixin, Emulator
         if not os.path.isfile(self.adb_path):
             self.fatal("The adb binary '%s' is not a valid file!" % self.adb_path)
 
-    def _trigger_test(self, suite_name, emulator_index):
+    def _query_test_job(self, suite_name, emulator_index):
         """
-        Run a test suite on an emulator
-
-        We return a dictionary with the following information:
-         - subprocess object that is running the test on the emulator
-         - the filename where the stdout is going to
-         - the stdout where the output is going to
-         - the suite name that is associated
+        Return a run_commands_parallel() job that runs a test suite on an
+        emulator, with its own output parser
         """
         dirs = self.query_abs_dirs()
         cmd = self._build_command(self.emulators[emulator_index], suite_name)
@@ -443,15 +436,17 @@ class AndroidEmulatorTest(BlobUploadMixin, TestingMixin, TooltoolMixin, Emulator
         env['MINIDUMP_SAVE_PATH'] = self.query_abs_dirs()['abs_blob_upload_dir']
 
         self.info("Running on %s the command %s" % (self.emulators[emulator_index]["name"], subprocess.list2cmdline(cmd)))
-        tmp_file = tempfile.NamedTemporaryFile(mode='w')
-        tmp_stdout = open(tmp_file.name, 'w')
-        self.info("Created temp file %s." % tmp_file.name)
+        parser = DesktopUnittestOutputParser(
+            suite_category=self.test_suite_definitions[suite_name]["category"],
+            config=self.config,
+            log_obj=self.log_obj,
+            error_list=self.error_list)
         return {
-            "process": subprocess.Popen(cmd, cwd=cwd, stdout=tmp_stdout, stderr=tmp_stdout, env=env),
-            "tmp_file": tmp_file,
-            "tmp_stdout": tmp_stdout,
-            "suite_name": suite_name,
-            "emulator_index": emulator_index
+            "command": cmd,
+            "name": suite_name,
+            "cwd": cwd,
+            "env": env,
+            "output_parser": parser,
         }
 
     ##########################################
@@ -623,58 +618,28 @@ class AndroidEmulatorTest(BlobUploadMixin, TestingMixin, TooltoolMixin, Emulator
         """
         Run the tests
         """
-        procs = []
-
+        jobs = []
         emulator_index = 0
         for suite_name in self.test_suites:
-            procs.append(self._trigger_test(suite_name, emulator_index))
+            jobs.append(self._query_test_job(suite_name, emulator_index))
             emulator_index += 1
 
+        # One job per emulator, so run them all at once.
+        results = self.run_commands_parallel(jobs, max_workers=len(jobs))
+
         joint_tbpl_status = None
         joint_log_level = None
-        start_time = int(time.time())
-        while True:
-            for p in procs:
-                emulator_index = p["emulator_index"]
-                return_code = p["process"].poll()
-                if return_code is not None:
-                    suite_name = p["suite_name"]
-                    # To make reading the log of the suite not mix with the previous line
-                    sys.stdout.write('\n')
-                    self.info("##### %s log begins" % p["suite_name"])
-                    # Let's close the stdout
-                    p["tmp_stdout"].close()
-                    # Let's read the file that now has the output
-                    output = self.read_from_file(p["tmp_file"].name, verbose=False)
-                    # Let's parse the output (which also prints it)
-                    # and determine what the results should be
-                    parser = DesktopUnittestOutputParser(
-                        suite_category=self.test_suite_definitions[p["suite_name"]]["category"],
-                        config=self.config,
-                        log_obj=self.log_obj,
-                        error_list=self.error_list)
-                    for line in output.splitlines():
-                        parser.parse_single_line(line)
-
-                    # After parsing each line we should know what the summary for this suite should be
-                    tbpl_status, log_level = parser.evaluate_parser(return_code)
-                    parser.append_tinderboxprint_line(p["suite_name"])
-                    # After running all jobs we will report the worst status of all emulator runs
-                    joint_tbpl_status = self.worst_level(tbpl_status, joint_tbpl_status, TBPL_WORST_LEVEL_TUPLE)
-                    joint_log_level = self.worst_level(log_level, joint_log_level)
-
-                    self.info("##### %s log ends" % p["suite_name"])
-                    self._dump_emulator_log(emulator_index)
-                    procs.remove(p)
-            if procs == []:
-                break
-            else:
-                # Every 5 minutes let's print something to stdout
-                # so buildbot won't kill the process due to lack of output
-                if int(time.time()) - start_time > 5 * 60:
-                    self.info('#')
-                    start_time = int(time.time())
-                time.sleep(30)
+        emulator_index = 0
+        for result in results:
+            parser = result["parser"]
+            # After parsing each line we should know what the summary for this suite should be
+            tbpl_status, log_level = parser.evaluate_parser(result["return_code"])
+            parser.append_tinderboxprint_line(result["name"])
+            # After running all jobs we will report the worst status of all emulator runs
+            joint_tbpl_status = self.worst_level(tbpl_status, joint_tbpl_status, TBPL_WORST_LEVEL_TUPLE)
+            joint_log_level = self.worst_level(log_level, joint_log_level)
+            self._dump_emulator_log(emulator_index)
+            emulator_index += 1
 
         self.buildbot_status(joint_tbpl_status, level=joint_log_level)
 
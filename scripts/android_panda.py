@@ -426,10 +426,9 @@ class PandaTest(TestingMixin, MercurialScript, BlobUploadMixin, MozpoolMixin, Bu
         #find appname from package-name.txt - assumes download-and-extract has completed successfully
         apk_dir = self.abs_dirs['abs_work_dir']
         self.apk_path = os.path.join(apk_dir, self.filename_apk)
-        unzip = self.query_exe("unzip")
         package_path = os.path.join(apk_dir, 'package-name.txt')
-        unzip_cmd = [unzip, '-q', '-o',  self.apk_path]
-        self.run_command(unzip_cmd, cwd=apk_dir, halt_on_failure=True, fatal_exit_code=3)
+        self.extract_zip(self.apk_path, apk_dir, halt_on_failure=True,
+                         fatal_exit_code=3)
         self.app_name = str(self.read_from_file(package_path, verbose=True)).rstrip()
 
         str_format_values = {
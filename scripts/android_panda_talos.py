@@ -321,9 +321,7 @@ class PandaTalosTest(TestingMixin, MercurialScript, BlobUploadMixin, MozpoolMixi
         talos_base_cmd.append(talos_json_url)
         env = self.query_env()
         self.run_command(talos_base_cmd, dirs['abs_talosdata_dir'], env=env, halt_on_failure=True, fatal_exit_code=3)
-        unzip = self.query_exe("unzip")
-        unzip_cmd = [unzip, '-q', '-o',  talos_zip_path]
-        self.run_command(unzip_cmd, cwd=dirs['abs_talosdata_dir'], halt_on_failure=True, fatal_exit_code=3)
+        self.extract_zip(talos_zip_path, dirs['abs_talosdata_dir'], halt_on_failure=True, fatal_exit_code=3)
 
     def _query_abs_base_cmd(self, suite_category):
         dirs = self.query_abs_dirs()
@@ -340,10 +338,9 @@ class PandaTalosTest(TestingMixin, MercurialScript, BlobUploadMixin, MozpoolMixi
         #find appname from package-name.txt - assumes download-and-extract has completed successfully
         apk_dir = self.abs_dirs['abs_work_dir']
         self.apk_path = os.path.join(apk_dir, self.filename_apk)
-        unzip = self.query_exe("unzip")
         package_path = os.path.join(dirs['abs_fennec_dir'], 'package-name.txt')
-        unzip_cmd = [unzip, '-q', '-o',  self.apk_path]
-        self.run_command(unzip_cmd, cwd=dirs['abs_fennec_dir'], halt_on_failure=True, fatal_exit_code=3)
+        self.extract_zip(self.apk_path, dirs['abs_fennec_dir'],
+                         halt_on_failure=True, fatal_exit_code=3)
         self.app_name = str(self.read_from_file(package_path, verbose=True)).rstrip()
 
         str_format_values = {
@@ -9,7 +9,6 @@
 This script manages Desktop repacks for nightly builds
 """
 
-from copy import deepcopy
 import os
 import re
 import subprocess
@@ -310,10 +309,9 @@ class DesktopSingleLocale(LocalesMixin, ReleaseMixin, MobileSigningMixin,
         replace_dict = {}
         if config.get("user_repo_override"):
             replace_dict['user_repo_override'] = config['user_repo_override']
-            # deepcopy() needed because of self.config lock bug :(
-            for repo_dict in deepcopy(config['repos']):
-                repo_dict['repo'] = repo_dict['repo'] % replace_dict
-                repos.append(repo_dict)
+            for repo_dict in config['repos']:
+                repos.append(repo_dict.overlay(
+                    repo=repo_dict['repo'] % replace_dict))
         else:
             repos = config['repos']
         self.vcs_checkout_repos(repos, parent_dir=dirs['abs_work_dir'],
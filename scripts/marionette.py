@@ -13,7 +13,7 @@ import sys
 # load modules from parent dir
 sys.path.insert(1, os.path.dirname(sys.path[0]))
 
-from mozharness.base.errors import TarErrorList, ZipErrorList
+from mozharness.base.errors import TarErrorList
 from mozharness.base.log import INFO, ERROR, WARNING, FATAL
 from mozharness.base.script import PreScriptAction
 from mozharness.base.transfer import TransferMixin
@@ -305,8 +305,6 @@ class MarionetteTest(TestingMixin, TooltoolMixin,
                              halt_on_failure=True, fatal_exit_code=3)
         else:
             # a tooltool xre.zip
-            command = self.query_exe('unzip', return_type='list')
-            command.extend(['-q', '-o', filename])
             # Gaia assumes that xpcshell is in a 'xulrunner-sdk' dir, but
             # xre.zip doesn't have a top-level directory name, so we'll
             # create it.
@@ -314,10 +312,8 @@ class MarionetteTest(TestingMixin, TooltoolMixin,
                                       self.config.get('xre_path'))
             if not os.access(parent_dir, os.F_OK):
                 self.mkdir_p(parent_dir, error_level=FATAL)
-            self.run_command(command,
-                             cwd=parent_dir,
-                             error_list=ZipErrorList,
-                             halt_on_failure=True, fatal_exit_code=3)
+            self.extract_zip(filename, parent_dir, halt_on_failure=True,
+                             fatal_exit_code=3)
 
     def download_and_extract(self):
         super(MarionetteTest, self).download_and_extract()
@@ -36,6 +36,7 @@ from mozharness.base.errors import HgErrorList, GitErrorList
 from mozharness.base.log import INFO, ERROR, FATAL
 from mozharness.base.python import VirtualenvMixin, virtualenv_config_options
 from mozharness.base.transfer import TransferMixin
+from mozharness.base.vcs.mercurial import MercurialVCS
 from mozharness.base.vcs.vcssync import VCSSyncScript
 from mozharness.mozilla.tooltool import TooltoolMixin
 
@@ -624,6 +625,15 @@ intree=1
         exe_command.extend(hg_options)
         return exe_command
 
+    def _query_hg_vcs(self):
+        """Returns a MercurialVCS that runs the same hg, for queries that
+        can go through a command server (see MercurialVCS.query_hg_output).
+        """
+        hg_vcs = MercurialVCS(log_obj=self.log_obj, config=self.config,
+                              script_obj=self)
+        hg_vcs.hg = self._query_hg_exe()
+        return hg_vcs
+
     def query_branches(self, branch_config, repo_path, vcs='hg'):
         """ Given a branch_config of branches and branch_regexes, return
             a dict of existing branch names to target branch names.
@@ -770,6 +780,7 @@ intree=1
             the git conversion repo.
             """
         hg = self._query_hg_exe()
+        hg_vcs = self._query_hg_vcs()
         git = self.query_exe("git", return_type="list")
         dirs = self.query_abs_dirs()
         repo_map = self._read_repo_update_json()
@@ -805,13 +816,8 @@ intree=1
                 source,
             )
             for (branch, target_branch) in branch_map.items():
-                output = self.get_output_from_command(
-                    hg + ['id', '-r', branch],
-                    cwd=source
-                )
-                if output:
-                    rev = output.split(' ')[0]
-                else:
+                rev = hg_vcs.query_revision_id(source, branch)
+                if not rev:
                     self.fatal("Branch %s doesn't exist in %s!" % (branch, repo_name))
                 timestamp = int(time.time())
                 datetime = time.strftime('%Y-%m-%d %H:%M %Z')
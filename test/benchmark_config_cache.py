@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Measure script startup with and without the compiled config cache.
+
+Runs `--list-actions' for a few build and test scripts, first with
+MOZHARNESS_CONFIG_CACHE turned off, then with a warm cache, and prints
+the median wall time of each, plus the time to parse every config file
+in configs/ in-process.
+
+  python test/benchmark_config_cache.py [runs]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, MH_DIR)
+
+from mozharness.base import config
+
+COMMANDS = (
+    ['scripts/fx_desktop_build.py', '--config', 'builds/releng_base_linux_64_builds.py',
+     '--branch', 'mozilla-central', '--build-pool', 'staging'],
+    ['scripts/desktop_unittest.py', '--cfg', 'unittests/linux_unittest.py'],
+    ['scripts/b2g_emulator_unittest.py', '--cfg', 'b2g/emulator_automation_config.py'],
+)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) / 2]
+
+
+def time_command(command, env, runs):
+    times = []
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable] + command + ['--list-actions'],
+                              cwd=MH_DIR, env=env, stdout=open(os.devnull, 'w'))
+        times.append(time.time() - start)
+    return median(times)
+
+
+def time_all_configs(runs):
+    files = []
+    for root, dirs, names in os.walk(os.path.join(MH_DIR, 'configs')):
+        files.extend(os.path.join(root, n) for n in names
+                     if n.endswith(('.py', '.json')))
+    times = []
+    for i in range(runs):
+        start = time.time()
+        for f in files:
+            try:
+                config.parse_config_file(f)
+            except Exception:
+                # e.g. the deliberately malformed test configs
+                pass
+        times.append(time.time() - start)
+    return len(files), median(times)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for label, value in (('no cache', ''), ('warm cache', cache_dir)):
+            env = dict(os.environ, MOZHARNESS_CONFIG_CACHE=value)
+            os.environ['MOZHARNESS_CONFIG_CACHE'] = value
+            if value:
+                # Warm it up.
+                time_all_configs(1)
+            for command in COMMANDS:
+                print "%-10s %-30s %6.1fms" % (
+                    label, os.path.basename(command[0]),
+                    time_command(command, env, runs) * 1000)
+            count, seconds = time_all_configs(runs)
+            print "%-10s %-30s %6.1fms" % (label, 'all %d configs' % count,
+                                           seconds * 1000)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
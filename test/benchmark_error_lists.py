@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Measure how fast OutputParser matches lines against error lists.
+
+Compares walking each error_list entry per line (the old
+parse_single_line) with the compiled ErrorListMatcher, and checks both
+pick the same entry for every line.
+
+  python test/benchmark_error_lists.py [build.log ...]
+
+Without log files, a synthetic build log is used.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mozharness.base.errors import HgErrorList, MakefileErrorList, \
+    PythonErrorList, SSHErrorList, VirtualenvErrorList
+from mozharness.base.log import ErrorListMatcher
+
+ERROR_LISTS = (
+    ('HgErrorList', HgErrorList),
+    ('SSHErrorList', SSHErrorList),
+    ('PythonErrorList', PythonErrorList),
+    ('VirtualenvErrorList', VirtualenvErrorList),
+    ('MakefileErrorList', MakefileErrorList),
+)
+
+SYNTHETIC_LINES = [
+    "/usr/bin/ccache /builds/slave/m-in-l64-000000000000000000000/build/obj-firefox/_virtualenv/bin/gcc -std=gnu99 -o nsFoo.o -c -fvisibility=hidden -DMOZILLA_CLIENT -include ../../mozilla-config.h -MD -MP -MF .deps/nsFoo.o.pp /builds/slave/build/content/base/src/nsFoo.cpp",
+    "make[5]: Entering directory `/builds/slave/m-in-l64-000000000000000000000/build/obj-firefox/content/base/src'",
+    "make[5]: Leaving directory `/builds/slave/m-in-l64-000000000000000000000/build/obj-firefox/content/base/src'",
+    "nsFoo.cpp",
+    "Unified_cpp_content_base_src0.cpp",
+    "/builds/slave/build/dom/base/nsDOMWindowUtils.cpp:1234:5: warning: unused variable 'rv' [-Wunused-variable]",
+    "11:42:07     INFO -  TEST-PASS | /tests/content/base/test/test_bug123456.html | Should be true",
+    "11:42:07     INFO -  TEST-INFO | /tests/content/base/test/test_bug123456.html | Loaded in 54ms",
+    "python /builds/slave/build/config/pythonpath.py -I../../config /builds/slave/build/python/mozbuild/mozbuild/action/process_install_manifest.py --no-remove ../../dist/bin _build_manifests/install/dist_bin",
+    "Elapsed: 0.15s; From dist/bin: Kept 1234 existing; Added/updated 2; Removed 0 files and 0 directories.",
+    "Traceback (most recent call last):",
+    "Downloading/unpacking mozbase (from -r requirements.txt (line 1))",
+]
+
+
+def synthetic_log(num_lines=200000):
+    rand = random.Random(0)
+    # Most lines are compiler/make chatter; a few match something.
+    weights = [30, 20, 20, 10, 10, 2, 10, 10, 5, 5, 1, 1]
+    choices = []
+    for line, weight in zip(SYNTHETIC_LINES, weights):
+        choices.extend([line] * weight)
+    return [rand.choice(choices) for i in range(num_lines)]
+
+
+def walk(error_list, line):
+    """The pre-ErrorListMatcher parse_single_line loop."""
+    for error_check in error_list:
+        if 'substr' in error_check:
+            if error_check['substr'] in line:
+                return error_check
+        elif 'regex' in error_check:
+            if error_check['regex'].search(line):
+                return error_check
+    return None
+
+
+def match_batches(matcher, lines, batch_size):
+    """What OutputParser.add_lines() does with each batch of output."""
+    matched = []
+    for start in range(0, len(lines), batch_size):
+        batch = lines[start:start + batch_size]
+        candidates = matcher.query_candidates(batch)
+        for index, line in enumerate(batch):
+            if candidates is not None and index not in candidates:
+                matched.append(None)
+            else:
+                matched.append(matcher.match(line))
+    return matched
+
+
+def benchmark(lines, name, error_list, batch_size):
+    start = time.time()
+    walked = [walk(error_list, line) for line in lines]
+    walk_time = time.time() - start
+    start = time.time()
+    matched = match_batches(ErrorListMatcher(error_list), lines, batch_size)
+    match_time = time.time() - start
+    for line, a, b in zip(lines, walked, matched):
+        if a is not b:
+            print "MISMATCH for %s: %r (%r != %r)" % (name, line, a, b)
+            sys.exit(1)
+    print "%-20s %3d entries  walk %8.0f lines/s  matcher %8.0f lines/s  %5.1fx" % (
+        name, len(error_list), len(lines) / walk_time,
+        len(lines) / match_time, walk_time / match_time)
+
+
+def main(args):
+    if args:
+        lines = []
+        for path in args:
+            fh = open(path)
+            lines.extend(l.decode('utf-8', 'replace').rstrip() for l in fh)
+            fh.close()
+    else:
+        lines = [l.decode('utf-8') for l in synthetic_log()]
+    # Roughly one 64k read of build output.
+    batch_size = 400
+    print "%d lines, %d per batch" % (len(lines), batch_size)
+    for name, error_list in ERROR_LISTS:
+        benchmark(lines, name, error_list, batch_size)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
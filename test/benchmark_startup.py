@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# ***** BEGIN LICENSE BLOCK *****
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+# ***** END LICENSE BLOCK *****
+"""Measure how long the top scripts take to start.
+
+For each script, prints the median of:
+
+  import     importing the script module, in a fresh interpreter
+  config     BaseConfig parsing the script's config file, in-process
+  actions    running the script with `--list-actions', wall time
+
+plus the modules that were loaded by the import but are only needed by
+some actions (network, threads, uuid, the copy/extract/hash helpers...).  Those
+should be imported where they're used, so short invocations don't pay
+for them.
+
+  python test/benchmark_startup.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+MH_DIR = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(1, MH_DIR)
+
+from mozharness.base.config import BaseConfig, parse_config_file
+
+# (script, config file, extra arguments)
+SCRIPTS = (
+    ('fx_desktop_build.py', 'builds/releng_base_linux_64_builds.py',
+     ['--branch', 'mozilla-central', '--build-pool', 'staging']),
+    ('desktop_unittest.py', 'unittests/linux_unittest.py', []),
+    ('b2g_emulator_unittest.py', 'b2g/emulator_automation_config.py', []),
+)
+
+LAZY_MODULES = (
+    'httplib', 'inspect', 'multiprocessing', 'platform', 'random', 'socket',
+    'ssl', 'tarfile', 'tempfile', 'urllib2', 'uuid', 'zipfile',
+    'mozharness.base.checkpoint', 'mozharness.base.copier',
+    'mozharness.base.extract', 'mozharness.base.hashing',
+    'mozharness.base.resources', 'mozharness.base.trace',
+    'mozharness.base.transfer',
+)
+
+IMPORT_SNIPPET = """
+import imp, sys, time
+sys.path[0:0] = [%(script_dir)r, %(mh_dir)r]
+start = time.time()
+imp.load_source('script', %(script)r)
+elapsed = time.time() - start
+print elapsed
+print ' '.join(m for m in %(lazy)r if sys.modules.get(m))
+"""
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) / 2]
+
+
+def time_import(script, runs):
+    script_dir = os.path.join(MH_DIR, 'scripts')
+    code = IMPORT_SNIPPET % {
+        'script_dir': script_dir, 'mh_dir': MH_DIR, 'lazy': LAZY_MODULES,
+        'script': os.path.join(script_dir, script),
+    }
+    times = []
+    for i in range(runs):
+        output = subprocess.Popen([sys.executable, '-c', code],
+                                  stdout=subprocess.PIPE).communicate()[0]
+        elapsed, loaded = (output.splitlines() + [''])[:2]
+        times.append(float(elapsed))
+    return median(times), loaded.split()
+
+
+def time_config(config_file, runs):
+    path = os.path.join(MH_DIR, 'configs', config_file)
+    # BaseConfig doesn't know the script's actions; allow the config's own.
+    actions = parse_config_file(path).get('default_actions', [])
+    times = []
+    for i in range(runs):
+        start = time.time()
+        BaseConfig(all_actions=actions, option_args=['--cfg', path])
+        times.append(time.time() - start)
+    return median(times)
+
+
+def time_list_actions(script, config_file, args, runs):
+    command = [sys.executable, os.path.join('scripts', script),
+               '--cfg', config_file] + args + ['--list-actions']
+    devnull = open(os.devnull, 'w')
+    times = []
+    try:
+        for i in range(runs):
+            start = time.time()
+            subprocess.check_call(command, cwd=MH_DIR, stdout=devnull)
+            times.append(time.time() - start)
+    finally:
+        devnull.close()
+    return median(times)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print "%-26s %9s %9s %9s  %s" % ('script', 'import', 'config',
+                                     'actions', 'eagerly loaded')
+    for script, config_file, args in SCRIPTS:
+        import_time, loaded = time_import(script, runs)
+        print "%-26s %7.1fms %7.1fms %7.1fms  %s" % (
+            script, import_time * 1000, time_config(config_file, runs) * 1000,
+            time_list_actions(script, config_file, args, runs) * 1000,
+            ' '.join(loaded) or '-')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import gc
+import os
+import shutil
+import unittest
+
+import mozharness.base.script as script
+from mozharness.base.checkpoint import CheckpointStore, query_fingerprint
+
+tmp_dir = "test_checkpoint_dir"
+
+
+def cleanup():
+    gc.collect()
+    for path in (tmp_dir, 'test_logs'):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+
+class CheckpointScript(script.BaseScript):
+    action_checkpoints = {
+        'build': {
+            'config': ['build_type'],
+            'inputs': ['input.txt'],
+            'outputs': ['%(abs_work_dir)s/output.txt'],
+        },
+    }
+
+    def __init__(self, **kwargs):
+        self.builds = 0
+        self.fail = False
+        config = {'base_work_dir': os.path.abspath(tmp_dir),
+                  'copy_logs_post_run': False,
+                  'checkpoint_actions': True}
+        config.update(kwargs)
+        super(CheckpointScript, self).__init__(
+            initial_config_file='test/test.json', all_actions=['build'],
+            config=config)
+
+    def build(self):
+        self.builds += 1
+        if self.fail:
+            self.fatal("Build failed")
+        self.write_to_file(os.path.join(self.query_abs_dirs()['abs_work_dir'],
+                                        'output.txt'), 'built')
+
+
+def write_input(contents):
+    path = os.path.join(tmp_dir, 'build', 'input.txt')
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    fh = open(path, 'w')
+    fh.write(contents)
+    fh.close()
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.mkdir(tmp_dir)
+        self.path = os.path.join(tmp_dir, 'checkpoints.json')
+        self.output = os.path.join(tmp_dir, 'output')
+        open(self.output, 'w').close()
+
+    def tearDown(self):
+        cleanup()
+
+    def test_fingerprint(self):
+        self.assertEqual(query_fingerprint('a', {'x': 1}, {'f': 'abc'}),
+                         query_fingerprint('a', {'x': 1}, {'f': 'abc'}))
+        self.assertNotEqual(query_fingerprint('a', {'x': 1}, {}),
+                            query_fingerprint('a', {'x': 2}, {}))
+        self.assertNotEqual(query_fingerprint('a', {}, {}),
+                            query_fingerprint('b', {}, {}))
+
+    def test_record(self):
+        store = CheckpointStore(self.path)
+        self.assertFalse(store.is_current('a', 'abc'))
+        store.record('a', 'abc', [self.output, tmp_dir])
+        self.assertTrue(store.is_current('a', 'abc'))
+        self.assertFalse(store.is_current('a', 'def'))
+        # It's kept across runs.
+        self.assertTrue(CheckpointStore(self.path).is_current('a', 'abc'))
+        store.forget('a')
+        self.assertFalse(CheckpointStore(self.path).is_current('a', 'abc'))
+
+    def test_changed_output(self):
+        store = CheckpointStore(self.path)
+        store.record('a', 'abc', [self.output])
+        fh = open(self.output, 'w')
+        fh.write('changed')
+        fh.close()
+        self.assertFalse(store.is_current('a', 'abc'))
+        store.record('a', 'abc', [os.path.join(tmp_dir, 'missing')])
+        self.assertFalse(store.is_current('a', 'abc'))
+
+    def test_corrupt(self):
+        fh = open(self.path, 'w')
+        fh.write('{')
+        fh.close()
+        self.assertEqual(CheckpointStore(self.path).checkpoints, {})
+
+
+class TestScriptCheckpoints(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        write_input('1')
+
+    def tearDown(self):
+        cleanup()
+
+    def run_script(self, **kwargs):
+        s = CheckpointScript(**kwargs)
+        s.run()
+        builds = s.builds
+        # Close its logs now, rather than whenever gc gets to it.
+        del s
+        gc.collect()
+        return builds
+
+    def test_skip(self):
+        self.assertEqual(self.run_script(), 1)
+        self.assertEqual(self.run_script(), 0)
+
+    def test_disabled(self):
+        self.assertEqual(self.run_script(checkpoint_actions=False), 1)
+        self.assertEqual(self.run_script(checkpoint_actions=False), 1)
+
+    def test_changed_input(self):
+        self.run_script()
+        write_input('2')
+        self.assertEqual(self.run_script(), 1)
+        self.assertEqual(self.run_script(), 0)
+
+    def test_changed_config(self):
+        self.run_script()
+        self.assertEqual(self.run_script(build_type='debug'), 1)
+
+    def test_missing_output(self):
+        self.run_script()
+        os.remove(os.path.join(tmp_dir, 'build', 'output.txt'))
+        self.assertEqual(self.run_script(), 1)
+
+    def test_force(self):
+        self.run_script()
+        self.assertEqual(self.run_script(force_actions=['build']), 1)
+
+    def test_failure(self):
+        self.run_script()
+        write_input('2')
+        s = CheckpointScript()
+        s.fail = True
+        self.assertRaises(SystemExit, s.run)
+        del s
+        gc.collect()
+        # The old output is still there, but the checkpoint is gone.
+        write_input('1')
+        self.assertEqual(self.run_script(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
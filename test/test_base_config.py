@@ -1,4 +1,6 @@
+import mock
 import os
+import shutil
 import unittest
 
 JSON_TYPE = None
@@ -12,7 +14,7 @@ else:
     JSON_TYPE = 'simplejson'
 
 import mozharness.base.config as config
-from copy import deepcopy
+from copy import copy, deepcopy
 
 MH_DIR = os.path.dirname(os.path.dirname(__file__))
 
@@ -101,6 +103,66 @@ class TestParseConfigFile(unittest.TestCase):
         self.assertEqual(c._config['keep_string'], "don't change me")
 
 
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = os.path.abspath('test_config_cache')
+        self.old_env = os.environ.get('MOZHARNESS_CONFIG_CACHE')
+        os.environ['MOZHARNESS_CONFIG_CACHE'] = self.cache_dir
+        self.config_file = os.path.join(self.cache_dir, 'configs', 'cached.py')
+        os.makedirs(os.path.dirname(self.config_file))
+        self._write("config = {'a': os.sep}\n")
+
+    def tearDown(self):
+        if self.old_env is None:
+            os.environ.pop('MOZHARNESS_CONFIG_CACHE', None)
+        else:
+            os.environ['MOZHARNESS_CONFIG_CACHE'] = self.old_env
+        shutil.rmtree(self.cache_dir)
+
+    def _write(self, contents):
+        fh = open(self.config_file, 'w')
+        fh.write("import os\n" + contents)
+        fh.close()
+
+    def test_cache_hit(self):
+        self.assertEqual(config.parse_config_file(self.config_file), {'a': os.sep})
+        with mock.patch.object(config, '_compile_config') as compile_config:
+            self.assertEqual(config.parse_config_file(self.config_file), {'a': os.sep})
+            self.assertEqual(compile_config.call_count, 0)
+
+    def test_json(self):
+        self.assertEqual(config.parse_config_file('test/test.json'),
+                         config.parse_config_file('test/test.json'))
+
+    def test_edited_file(self):
+        config.parse_config_file(self.config_file)
+        self._write("config = {'a': 'changed'}\n")
+        self.assertEqual(config.parse_config_file(self.config_file), {'a': 'changed'})
+
+    def test_disabled(self):
+        os.environ['MOZHARNESS_CONFIG_CACHE'] = ''
+        self.assertEqual(config.parse_config_file(self.config_file), {'a': os.sep})
+        self.assertEqual(os.listdir(self.cache_dir), ['configs'])
+
+    def test_off_by_default(self):
+        del os.environ['MOZHARNESS_CONFIG_CACHE']
+        self.assertEqual(config.query_config_cache_dir(), None)
+        self.assertEqual(config.parse_config_file(self.config_file), {'a': os.sep})
+
+    def test_prune(self):
+        for i in range(5):
+            self._write("config = {'a': %d}\n" % i)
+            config.parse_config_file(self.config_file)
+            os.utime(self.config_file, None)
+        entries = [n for n in os.listdir(self.cache_dir) if n != 'configs']
+        self.assertEqual(len(entries), 5)
+        newest = max(entries, key=lambda n: os.path.getmtime(
+            os.path.join(self.cache_dir, n)))
+        config._prune_config_cache(self.cache_dir, max_entries=1)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(['configs', newest]))
+
+
 class TestReadOnlyDict(unittest.TestCase):
     control_dict = {
         'b': '2',
@@ -247,6 +309,34 @@ class TestReadOnlyDict(unittest.TestCase):
         c['e'] = 'hey'
         self.assertEqual(c['e'], 'hey', "can't set var in ROD after deepcopy")
 
+    def test_locked_copy(self):
+        r = self.get_locked_ROD()
+        self.assertTrue(copy(r) is r)
+        self.assertTrue(copy(r['e']) is r['e'])
+
+    def test_unlocked_copy(self):
+        r = self.get_unlocked_ROD()
+        c = copy(r)
+        c['b'] = 'changed'
+        self.assertEqual(r['b'], self.control_dict['b'])
+
+    def test_lock_shares_locked_values(self):
+        r = self.get_locked_ROD()
+        r2 = config.ReadOnlyDict({'r': r, 'e': r['e']})
+        r2.lock()
+        self.assertTrue(r2['r'] is r)
+        self.assertTrue(r2['e'] is r['e'])
+
+    def test_overlay(self):
+        r = self.get_locked_ROD()
+        o = r.overlay({'b': 'changed'}, f=['new'])
+        self.assertEqual(o['b'], 'changed')
+        self.assertEqual(r['b'], self.control_dict['b'])
+        self.assertTrue(o['d'] is r['d'])
+        self.assertTrue(isinstance(o['f'], config.LockedTuple))
+        self.assertRaises(AssertionError, o.update, {})
+        self.assertEqual(deepcopy(o)['d'], self.control_dict['d'])
+
 
 class TestActions(unittest.TestCase):
     all_actions = ['a', 'b', 'c', 'd', 'e']
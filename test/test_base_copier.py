@@ -0,0 +1,128 @@
+import gzip
+import os
+import shutil
+import stat
+import unittest
+
+import mozharness.base.copier as copier
+
+tmp_dir = "test_copier_dir"
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+
+def write_file(path, contents):
+    fh = open(path, 'wb')
+    fh.write(contents)
+    fh.close()
+
+
+def read_file(path):
+    fh = open(path, 'rb')
+    contents = fh.read()
+    fh.close()
+    return contents
+
+
+class TestCopyTree(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        self.src = os.path.join(tmp_dir, 'src')
+        os.makedirs(os.path.join(self.src, 'a', 'b'))
+        os.makedirs(os.path.join(self.src, 'empty'))
+        write_file(os.path.join(self.src, 'x'), 'x' * 100000)
+        write_file(os.path.join(self.src, 'a', 'y'), 'y')
+        write_file(os.path.join(self.src, 'a', 'b', 'z'), 'z')
+        os.chmod(os.path.join(self.src, 'a', 'y'), 0755)
+        self.dest = os.path.join(tmp_dir, 'dest')
+
+    def tearDown(self):
+        cleanup()
+
+    def test_copy_tree(self):
+        counts = copier.copy_tree(self.src, self.dest, workers=4)
+        self.assertEqual(sum(counts.values()), 3)
+        self.assertEqual(read_file(os.path.join(self.dest, 'x')), 'x' * 100000)
+        self.assertEqual(read_file(os.path.join(self.dest, 'a', 'b', 'z')), 'z')
+        self.assertTrue(os.path.isdir(os.path.join(self.dest, 'empty')))
+        self.assertNotEqual(os.stat(os.path.join(self.src, 'x')).st_ino,
+                            os.stat(os.path.join(self.dest, 'x')).st_ino)
+
+    @unittest.skipIf(os.name == "nt", "Not for Windows")
+    def test_permissions(self):
+        copier.copy_tree(self.src, self.dest)
+        mode = os.stat(os.path.join(self.dest, 'a', 'y')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0755)
+
+    @unittest.skipIf(os.name == "nt", "Not for Windows")
+    def test_link(self):
+        counts = copier.copy_tree(self.src, self.dest, link=True)
+        self.assertEqual(counts, {copier.LINK: 3})
+        self.assertEqual(os.stat(os.path.join(self.src, 'x')).st_ino,
+                         os.stat(os.path.join(self.dest, 'x')).st_ino)
+
+    @unittest.skipIf(os.name == "nt", "Not for Windows")
+    def test_copy_over_link(self):
+        src = os.path.join(self.src, 'x')
+        dest = os.path.join(tmp_dir, 'x')
+        copier.copy_file(src, dest, link=True)
+        copier.copy_file(os.path.join(self.src, 'a', 'y'), dest)
+        # Replacing the hardlink mustn't write through to the source.
+        self.assertEqual(read_file(src), 'x' * 100000)
+        self.assertEqual(read_file(dest), 'y')
+
+    @unittest.skipIf(os.name == "nt", "Not for Windows")
+    def test_same_file(self):
+        src = os.path.join(self.src, 'x')
+        hardlink = os.path.join(tmp_dir, 'hardlink')
+        symlink = os.path.join(tmp_dir, 'symlink')
+        os.link(src, hardlink)
+        os.symlink(os.path.abspath(src), symlink)
+        for dest in (src, os.path.join(self.src, 'a', '..', 'x'), hardlink,
+                     symlink):
+            self.assertRaises(shutil.Error, copier.copy_file, src, dest)
+            self.assertEqual(read_file(src), 'x' * 100000)
+
+
+class TestGzipFile(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.src = os.path.join(tmp_dir, 'src')
+        self.dest = os.path.join(tmp_dir, 'src.gz')
+
+    def tearDown(self):
+        cleanup()
+
+    def _round_trip(self, contents, **kwargs):
+        write_file(self.src, contents)
+        copier.gzip_file(self.src, self.dest, **kwargs)
+        fh = gzip.open(self.dest, 'rb')
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+
+    def test_serial(self):
+        contents = ''.join(chr(i % 251) for i in range(300000))
+        self.assertEqual(self._round_trip(contents, block_size=65536), contents)
+
+    def test_parallel(self):
+        contents = ''.join(chr(i % 251) for i in range(300000))
+        self.assertEqual(self._round_trip(contents, workers=3, block_size=4096),
+                         contents)
+
+    def test_parallel_exact_blocks(self):
+        contents = 'a' * 8192
+        self.assertEqual(self._round_trip(contents, workers=2, block_size=4096),
+                         contents)
+
+    def test_parallel_empty(self):
+        self.assertEqual(self._round_trip('', workers=2), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import stat
+import unittest
+import zipfile
+from StringIO import StringIO
+
+from mozharness.base.errors import ExtractException
+import mozharness.base.extract as extract
+
+tmp_dir = "test_extract_dir"
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+
+def make_zip():
+    """Return the contents of a small zip file with a mix of stored and
+    deflated members.
+    """
+    buf = StringIO()
+    z = zipfile.ZipFile(buf, 'w')
+    z.writestr('bin/run.sh', '#!/bin/sh\necho hi\n', zipfile.ZIP_DEFLATED)
+    z.getinfo('bin/run.sh').external_attr = (stat.S_IFREG | 0755) << 16
+    z.writestr('bin/data.txt', 'x' * 200000, zipfile.ZIP_DEFLATED)
+    z.writestr('mochitest/a.html', '<html/>', zipfile.ZIP_STORED)
+    z.writestr('xpcshell/b.js', 'var b;', zipfile.ZIP_DEFLATED)
+    z.close()
+    return buf.getvalue()
+
+
+class TestExtractZip(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.zip_path = os.path.join(tmp_dir, 'test.zip')
+        fh = open(self.zip_path, 'wb')
+        fh.write(make_zip())
+        fh.close()
+        self.dest = os.path.join(tmp_dir, 'out')
+
+    def tearDown(self):
+        cleanup()
+
+    def test_extract_all(self):
+        timings = extract.extract_zip(self.zip_path, self.dest, workers=4)
+        self.assertEqual(sorted(t[0] for t in timings),
+                         ['bin/data.txt', 'bin/run.sh', 'mochitest/a.html',
+                          'xpcshell/b.js'])
+        fh = open(os.path.join(self.dest, 'bin', 'data.txt'))
+        self.assertEqual(fh.read(), 'x' * 200000)
+        fh.close()
+
+    def test_include_exclude(self):
+        extract.extract_zip(self.zip_path, self.dest, include=['bin/*'],
+                            exclude=['*.txt'])
+        self.assertTrue(os.path.exists(os.path.join(self.dest, 'bin', 'run.sh')))
+        self.assertFalse(os.path.exists(os.path.join(self.dest, 'bin', 'data.txt')))
+        self.assertFalse(os.path.exists(os.path.join(self.dest, 'mochitest')))
+
+    @unittest.skipIf(os.name == "nt", "Not for Windows")
+    def test_permissions(self):
+        extract.extract_zip(self.zip_path, self.dest, workers=2)
+        mode = os.stat(os.path.join(self.dest, 'bin', 'run.sh')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0755)
+
+
+class TestExtractZipStream(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+
+    def tearDown(self):
+        cleanup()
+
+    def test_extract_all(self):
+        names = extract.extract_zip_stream(StringIO(make_zip()), tmp_dir)
+        self.assertEqual(len(names), 4)
+        fh = open(os.path.join(tmp_dir, 'bin', 'data.txt'))
+        self.assertEqual(fh.read(), 'x' * 200000)
+        fh.close()
+
+    def test_include(self):
+        extract.extract_zip_stream(StringIO(make_zip()), tmp_dir,
+                                   include=['bin/*', 'mochitest/*'])
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'mochitest', 'a.html')))
+        self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'xpcshell')))
+
+    @unittest.skipIf(os.name == "nt", "Not for Windows")
+    def test_permissions(self):
+        extract.extract_zip_stream(StringIO(make_zip()), tmp_dir)
+        mode = os.stat(os.path.join(tmp_dir, 'bin', 'run.sh')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0755)
+
+    def test_truncated(self):
+        data = make_zip()
+        self.assertRaises(ExtractException, extract.extract_zip_stream,
+                          StringIO(data[:len(data) / 2]), tmp_dir)
+
+    def test_escaping_path(self):
+        self.assertRaises(ExtractException, extract.query_zip_member_path,
+                          tmp_dir, '../../etc/passwd')
+
+
+if __name__ == '__main__':
+    unittest.main()
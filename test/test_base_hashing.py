@@ -0,0 +1,83 @@
+import hashlib
+import mock
+import os
+import shutil
+import time
+import unittest
+
+import mozharness.base.hashing as hashing
+
+tmp_dir = "test_hashing_dir"
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+
+def write_file(path, contents):
+    fh = open(path, 'wb')
+    fh.write(contents)
+    fh.close()
+
+
+class TestHashService(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.paths = []
+        for i in range(6):
+            path = os.path.join(tmp_dir, 'file%d' % i)
+            write_file(path, str(i) * (i * 100000))
+            self.paths.append(path)
+        self.cache_file = os.path.join(tmp_dir, 'cache', 'hashes.json')
+
+    def tearDown(self):
+        cleanup()
+
+    def _expected(self, path, hash_type='sha512'):
+        fh = open(path, 'rb')
+        digest = hashlib.new(hash_type, fh.read()).hexdigest()
+        fh.close()
+        return digest
+
+    def test_hash_file(self):
+        self.assertEqual(hashing.hash_file(self.paths[3], block_size=4096),
+                         self._expected(self.paths[3]))
+
+    def test_parallel(self):
+        service = hashing.HashService(workers=4)
+        digests = service.query_hashes(self.paths, hash_type='sha1')
+        self.assertEqual(digests, dict((p, self._expected(p, 'sha1'))
+                                       for p in self.paths))
+
+    def test_cached(self):
+        service = hashing.HashService(cache_file=self.cache_file)
+        service.query_hashes(self.paths)
+        # A new service reads the saved digests instead of the files.
+        service = hashing.HashService(cache_file=self.cache_file)
+        with mock.patch.object(hashing, 'hash_file') as hash_file:
+            digests = service.query_hashes(self.paths)
+            self.assertEqual(hash_file.call_count, 0)
+        self.assertEqual(digests[self.paths[2]], self._expected(self.paths[2]))
+
+    def test_changed_file(self):
+        service = hashing.HashService(cache_file=self.cache_file)
+        old = service.query_hash(self.paths[1])
+        write_file(self.paths[1], 'changed')
+        st = os.stat(self.paths[1])
+        os.utime(self.paths[1], (st.st_atime, time.time() + 10))
+        new = service.query_hash(self.paths[1])
+        self.assertNotEqual(old, new)
+        self.assertEqual(new, self._expected(self.paths[1]))
+
+    def test_corrupt_cache(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+        write_file(self.cache_file, '{not json')
+        service = hashing.HashService(cache_file=self.cache_file)
+        self.assertEqual(service.query_hash(self.paths[0]),
+                         self._expected(self.paths[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,11 @@
 import os
+import re
 import shutil
 import subprocess
 import unittest
 
 import mozharness.base.log as log
+from mozharness.base.errors import MakefileErrorList
 
 tmp_dir = "test_log_dir"
 log_name = "test"
@@ -38,5 +40,99 @@ class TestLog(unittest.TestCase):
         self.assertTrue(os.path.exists(get_log_file_path()))
         del(l)
 
+
+class TestAsyncLogging(unittest.TestCase):
+    def setUp(self):
+        clean_log_dir()
+
+    def tearDown(self):
+        clean_log_dir()
+
+    def _read(self, level=None):
+        fh = open(get_log_file_path(level))
+        contents = fh.read()
+        fh.close()
+        return contents
+
+    def test_multi_file_logger(self):
+        l = log.MultiFileLogger(log_dir=tmp_dir, log_name=log_name,
+                                log_to_console=False, async_logging=True)
+        for i in range(5000):
+            l.log_message('info %d' % i)
+        l.log_message('first\nsecond', level=log.ERROR)
+        l.log_message(u'caf\xe9')
+        l.flush()
+        info = self._read(log.INFO)
+        self.assertEqual(info.count(' INFO - info '), 5000)
+        self.assertTrue('ERROR - first\n' in info)
+        self.assertTrue('ERROR - second\n' in info)
+        self.assertTrue('INFO - caf\xc3\xa9\n' in info)
+        error = self._read(log.ERROR)
+        self.assertEqual(error.count('\n'), 2)
+        # The raw log has no level or date.
+        self.assertTrue('\ninfo 4999\n' in self._read('raw'))
+        del(l)
+
+    def test_fatal_flushes(self):
+        l = log.SimpleFileLogger(log_dir=tmp_dir, log_name=log_name,
+                                 log_to_console=False, async_logging=True)
+        self.assertRaises(SystemExit, l.log_message, 'oh no', level=log.FATAL,
+                          exit_code=3)
+        contents = self._read()
+        self.assertTrue('FATAL - oh no\n' in contents)
+        self.assertTrue('FATAL - Exiting 3\n' in contents)
+        del(l)
+
+
+class TestErrorListMatcher(unittest.TestCase):
+    error_list = [
+        {'substr': 'Warning: ', 'level': log.WARNING},
+        {'regex': re.compile(r'^abort:'), 'level': log.ERROR},
+        {'regex': re.compile(r':\d+: error:'), 'level': log.ERROR},
+        {'regex': re.compile(r'\d+ failed'), 'level': log.ERROR},
+    ]
+
+    def test_required_literal(self):
+        self.assertEqual(log._query_required_literal(re.compile(r'make\[\d+\]: \*\*\* \[')),
+                         ']: *** [')
+        self.assertEqual(log._query_required_literal(re.compile(r'\d+')), None)
+        self.assertEqual(log._query_required_literal(re.compile(r'abort', re.I)), None)
+
+    def test_first_match_wins(self):
+        matcher = log.ErrorListMatcher(self.error_list)
+        self.assertTrue(matcher.match('foo.c:12: error: Warning: x') is self.error_list[0])
+        self.assertTrue(matcher.match('abort: no') is self.error_list[1])
+        self.assertEqual(matcher.match('nothing to see'), None)
+
+    def test_query_candidates(self):
+        matcher = log.ErrorListMatcher(self.error_list)
+        lines = ['fine', 'abort: no', 'fine', 'not abort: here', '3 failed',
+                 'foo.c:12: error: bar']
+        self.assertEqual(matcher.query_candidates(lines), set([1, 3, 4, 5]))
+
+    def test_malformed_entry(self):
+        warnings = []
+        matcher = log.ErrorListMatcher([{'level': log.ERROR}])
+        self.assertEqual(matcher.query_candidates(['foo']), None)
+        self.assertEqual(matcher.match('foo', warn=warnings.append), None)
+        self.assertEqual(len(warnings), 1)
+
+    def test_cache(self):
+        self.assertTrue(log.query_error_list_matcher(self.error_list) is
+                        log.query_error_list_matcher(list(self.error_list)))
+
+    def test_output_parser(self):
+        lines = ['gcc -c foo.c', 'foo.c:1: warning: unused', 'Warning: meh',
+                 'make[1]: *** [foo.o] Error 1', 'Stop.'] * 100
+        batch = log.OutputParser(error_list=MakefileErrorList, log_output=False)
+        batch.add_lines(lines)
+        single = log.OutputParser(error_list=MakefileErrorList, log_output=False)
+        for line in lines:
+            single.parse_single_line(line)
+        self.assertEqual(batch.num_errors, 200)
+        self.assertEqual(batch.num_warnings, 200)
+        self.assertEqual((batch.num_errors, batch.num_warnings),
+                         (single.num_errors, single.num_warnings))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,139 @@
+import os
+import shutil
+import subprocess
+import time
+import unittest
+
+import mozharness.base.process as process
+
+tmp_dir = "test_process_dir"
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+
+def popen(command, **kwargs):
+    return subprocess.Popen(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, **kwargs)
+
+
+class TestLineSplitter(unittest.TestCase):
+    def test_split_across_chunks(self):
+        batches = []
+        splitter = process.LineSplitter(batches.append)
+        splitter.feed('one\ntw')
+        splitter.feed('o\nthree\nfou')
+        splitter.flush()
+        self.assertEqual(batches, [['one'], ['two', 'three'], ['fou']])
+
+    def test_long_line(self):
+        batches = []
+        splitter = process.LineSplitter(batches.append, max_line_length=4)
+        splitter.feed('abcdefgh')
+        self.assertEqual(batches, [['abcdefgh']])
+        self.assertEqual(splitter.partial, '')
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+
+    def tearDown(self):
+        cleanup()
+
+    def test_in_memory(self):
+        buf = process.OutputBuffer()
+        buf.write('abc\n')
+        buf.write('def\n')
+        self.assertFalse(buf.is_spilled())
+        self.assertEqual(buf.getvalue(), 'abc\ndef\n')
+
+    def test_spill(self):
+        spill_file_name = os.path.join(tmp_dir, 'spill')
+        buf = process.OutputBuffer(max_size=5, spill_file_name=spill_file_name)
+        buf.write('abc')
+        self.assertFalse(buf.is_spilled())
+        buf.write('def')
+        self.assertTrue(buf.is_spilled())
+        self.assertEqual(buf.getvalue(), 'abcdef')
+        self.assertEqual(os.path.getsize(spill_file_name), 6)
+
+    def test_truncate(self):
+        buf = process.OutputBuffer(max_size=5)
+        buf.write('abc')
+        buf.write('def')
+        self.assertEqual(buf.getvalue(), 'abcde')
+        self.assertEqual(buf.dropped_bytes, 1)
+
+    def test_head_and_tail(self):
+        buf = process.OutputBuffer(head=2, tail=1)
+        buf.write('1\n2\n3\n4\n5')
+        self.assertEqual(buf.getvalue(), '1\n2\n5\n')
+        self.assertEqual(buf.dropped_lines, 2)
+
+    def test_head_and_tail_spill(self):
+        spill_file_name = os.path.join(tmp_dir, 'spill')
+        buf = process.OutputBuffer(max_size=0, spill_file_name=spill_file_name,
+                                   head=1, tail=1)
+        buf.write('1\n2\n3\n4\n5')
+        self.assertEqual(buf.getvalue(), '1\n5\n')
+        fh = open(spill_file_name)
+        self.assertEqual(fh.read(), '1\n2\n3\n4\n5')
+        fh.close()
+
+
+@unittest.skipIf(os.name == "nt", "Not for Windows")
+class TestPumpOutput(unittest.TestCase):
+    def test_all_lines(self):
+        lines = []
+        p = popen(['python', '-c', 'for i in range(100000): print i'])
+        self.assertEqual(process.pump_output(p, lines.extend), None)
+        self.assertEqual(len(lines), 100000)
+        self.assertEqual(lines[-1], '99999')
+        self.assertEqual(p.returncode, 0)
+
+    def test_no_trailing_newline(self):
+        lines = []
+        p = popen(['printf', 'a\\nb'])
+        process.pump_output(p, lines.extend)
+        self.assertEqual(lines, ['a', 'b'])
+
+    def test_pump_streams(self):
+        stdout = process.OutputBuffer()
+        stderr = process.OutputBuffer()
+        p = subprocess.Popen(
+            ['python', '-c', 'import sys\n'
+             'for i in range(20000):\n'
+             '    sys.stdout.write("out\\n"); sys.stderr.write("err\\n")'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process.pump_streams(p, [p.stdout, p.stderr],
+                             [stdout.write, stderr.write])
+        self.assertEqual(stdout.getvalue(), 'out\n' * 20000)
+        self.assertEqual(stderr.getvalue(), 'err\n' * 20000)
+
+    def test_output_timeout(self):
+        start = time.time()
+        p = popen(['bash', '-c', 'echo started; sleep 30'],
+                  preexec_fn=os.setpgrp)
+        lines = []
+        status = process.pump_output(p, lines.extend, output_timeout=1)
+        self.assertEqual(status, process.OUTPUT_TIMEOUT)
+        self.assertEqual(lines, ['started'])
+        self.assertTrue(time.time() - start < 10)
+        self.assertNotEqual(p.returncode, 0)
+
+    def test_max_time(self):
+        start = time.time()
+        p = popen(['bash', '-c', 'while true; do echo tick; sleep 0.1; done'],
+                  preexec_fn=os.setpgrp)
+        status = process.pump_output(p, lambda lines: None,
+                                     output_timeout=5, max_time=1)
+        self.assertEqual(status, process.MAX_TIME)
+        self.assertTrue(time.time() - start < 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import os
+import shutil
 import unittest
 
 import mozharness.base.python as python
+from mozharness.base.script import BaseScript
 
 here = os.path.dirname(os.path.abspath(__file__))
 
@@ -32,6 +34,30 @@ class TestVirtualenvMixin(unittest.TestCase):
 
         self.assertEqual(packages, expected)
 
+    def test_create_virtualenv_checkpoint(self):
+        class VenvScript(python.VirtualenvMixin, BaseScript):
+            pass
+        try:
+            s = VenvScript(
+                initial_config_file='test/test.json',
+                all_actions=['create-virtualenv', 'run-tests'],
+                config={'virtualenv_path': 'venv',
+                        'virtualenv_modules': ['mozinfo', {'name': 'x'}],
+                        'mozinfo_url': 'http://example.com/mozinfo.tar.gz',
+                        'virtualenv_requirements': ['requirements.txt']})
+            s.register_virtualenv_module('mozfile', url='tests/mozfile')
+            checkpoint = s.query_action_checkpoint('create-virtualenv')
+            self.assertEqual(checkpoint['inputs'],
+                             ['requirements.txt',
+                              'http://example.com/mozinfo.tar.gz',
+                              'tests/mozfile'])
+            self.assertTrue('mozinfo_url' in checkpoint['config'])
+            self.assertEqual(checkpoint['outputs'], [s.query_python_path()])
+            self.assertEqual(s.query_action_checkpoint('run-tests'), None)
+        finally:
+            if os.path.exists('test_logs'):
+                shutil.rmtree('test_logs')
+
 
 if __name__ == '__main__':
     unittest.main()
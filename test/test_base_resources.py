@@ -0,0 +1,167 @@
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+from mozharness.base import resources
+from mozharness.base.resources import ResourceSampler
+from mozharness.base.script import BaseScript
+
+tmp_dir = "test_resources_dir"
+
+STAT = """cpu  100 10 50 800 40 0 0 0 0 0
+cpu0 100 10 50 800 40 0 0 0 0 0
+"""
+MEMINFO = """MemTotal:        1000 kB
+MemFree:          100 kB
+MemAvailable:     600 kB
+"""
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:  999       9    0    0    0     0          0         0      999       9    0    0    0     0       0          0
+  eth0:  100       1    0    0    0     0          0         0      200       2    0    0    0     0       0          0
+  eth1:   10       1    0    0    0     0          0         0       20       2    0    0    0     0       0          0
+"""
+IO = """rchar: 5000
+wchar: 6000
+read_bytes: 4096
+write_bytes: 8192
+"""
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+
+def write_file(path, contents):
+    path = os.path.join(tmp_dir, path)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    fh = open(path, 'w')
+    fh.write(contents)
+    fh.close()
+
+
+def process_stat(pid, name, ppid, ticks, rss):
+    # pid (comm) state ppid ... utime stime cutime cstime ... starttime ... rss
+    fields = ['S', ppid] + [0] * 9 + [ticks, 0, 0, 0, 0, 0, 0, 0, 1234, 0, rss]
+    return '%d (%s) %s\n' % (pid, name, ' '.join(str(f) for f in fields))
+
+
+class TestProcReaders(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        write_file('stat', STAT)
+        write_file('meminfo', MEMINFO)
+        write_file('net/dev', NET_DEV)
+        write_file('1/stat', process_stat(1, 'init', 0, 5, 10))
+        write_file('10/stat', process_stat(10, 'make (x) y', 1, 20, 100))
+        write_file('11/stat', process_stat(11, 'cc', 10, 30, 200))
+        write_file('12/stat', process_stat(12, 'cc', 11, 40, 300))
+        write_file('10/io', IO)
+
+    def tearDown(self):
+        cleanup()
+
+    def test_system(self):
+        self.assertEqual(resources.read_cpu_ticks(tmp_dir), (160, 1000))
+        self.assertEqual(resources.read_mem_used(tmp_dir), 400 * 1024)
+        self.assertEqual(resources.read_net_bytes(tmp_dir), (110, 220))
+
+    def test_processes(self):
+        table = resources.read_process_table(tmp_dir)
+        self.assertEqual(table[10], (1, 20, 100, 1234))
+        self.assertEqual(sorted(resources.query_descendants(table, 10)),
+                         [10, 11, 12])
+        self.assertEqual(resources.query_descendants(table, 12), [12])
+        self.assertEqual(resources.query_descendants(table, 99), [])
+        self.assertEqual(resources.read_process_io(10, tmp_dir), (4096, 8192))
+        self.assertEqual(resources.read_process_io(11, tmp_dir), (0, 0))
+
+
+class TestResourceSampler(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        if not ResourceSampler.is_supported():
+            raise unittest.SkipTest("No /proc")
+
+    def tearDown(self):
+        cleanup()
+
+    def test_sampler(self):
+        sampler = ResourceSampler(interval=0.05)
+        sampler.start()
+        sampler.begin_phase('build')
+        p = subprocess.Popen([sys.executable, '-c', 'import time\n'
+                              'end = time.time() + 0.5\n'
+                              'while time.time() < end: pass'])
+        sampler.track(p.pid, 'python')
+        p.wait()
+        sampler.untrack(p.pid)
+        sampler.finish_phase('build')
+        sampler.stop()
+
+        self.assertEqual([phase['name'] for phase in sampler.phases], ['build'])
+        self.assertTrue(sampler.phases[0]['cpu_time'] > 0.2)
+        self.assertTrue(sampler.total['duration'] >= 0.5)
+        self.assertTrue(sampler.total['max_rss'] > 0)
+        self.assertEqual(len(sampler.processes), 1)
+        process = sampler.processes[0]
+        self.assertEqual(process['name'], 'python')
+        self.assertTrue(process['cpu_time'] > 0.1)
+        self.assertTrue(process['max_rss'] > 0)
+
+        os.mkdir(tmp_dir)
+        path = os.path.join(tmp_dir, 'resource-usage.json')
+        sampler.write(path)
+        fh = open(path)
+        data = json.load(fh)
+        fh.close()
+        self.assertEqual(data['columns'], list(resources.COLUMNS))
+        lengths = set(len(column) for column in data['samples'])
+        self.assertEqual(len(lengths), 1)
+        self.assertTrue(lengths.pop() > 2)
+
+    def test_quick_commands(self):
+        # Both commands are over long before the next sample: one is only
+        # counted through sample_tree(), the other is left out.
+        sampler = ResourceSampler(interval=60)
+        sampler.start()
+        for name in ('sampled', 'unsampled'):
+            p = subprocess.Popen([sys.executable, '-c',
+                                  'print sum(range(10 ** 6))'],
+                                 stdout=subprocess.PIPE)
+            sampler.track(p.pid, name)
+            p.stdout.read()
+            if name == 'sampled':
+                sampler.sample_tree(p.pid)
+            p.wait()
+            sampler.untrack(p.pid)
+        sampler.stop()
+        self.assertEqual([process['name'] for process in sampler.processes],
+                         ['sampled'])
+        self.assertTrue(sampler.processes[0]['cpu_time'] > 0)
+
+    def test_script_commands(self):
+        s = BaseScript(initial_config_file='test/test.json')
+        s.resource_sampler = ResourceSampler(interval=60)
+        s.resource_sampler.start()
+        command = [sys.executable, '-c', 'print sum(range(10 ** 6))']
+        s.run_command(command)
+        s.get_output_from_command(command)
+        s.resource_sampler.stop()
+        processes = s.resource_sampler.processes
+        self.assertEqual(len(processes), 2)
+        self.assertTrue(all(p['cpu_time'] > 0 for p in processes))
+        del s
+        gc.collect()
+        if os.path.exists('test_logs'):
+            shutil.rmtree('test_logs')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import urllib2
+
+from mozharness.base.retry import RetryPolicy, CircuitBreaker, \
+    classify_network_error, RETRY, GIVE_UP
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def _sleeptimes(self, policy, n):
+        sleeptimes = policy.query_sleeptimes()
+        return [sleeptimes.next() for i in range(n)]
+
+    def test_doubling(self):
+        policy = RetryPolicy(sleeptime=60, max_sleeptime=300)
+        self.assertEqual(self._sleeptimes(policy, 5), [60, 120, 240, 300, 300])
+
+    def test_jitter(self):
+        policy = RetryPolicy(sleeptime=1, max_sleeptime=30, jitter=True)
+        previous = 1
+        for sleeptime in self._sleeptimes(policy, 50):
+            self.assertTrue(1 <= sleeptime <= min(30, previous * 3))
+            previous = sleeptime
+
+    def test_no_sleep(self):
+        policy = RetryPolicy(sleeptime=0, jitter=True)
+        self.assertEqual(self._sleeptimes(policy, 3), [0, 0, 0])
+
+    def test_classify_network_error(self):
+        def http_error(code):
+            return urllib2.HTTPError('http://example.com', code, 'msg', {}, None)
+        self.assertEqual(classify_network_error(http_error(404)), GIVE_UP)
+        self.assertEqual(classify_network_error(http_error(429)), RETRY)
+        self.assertEqual(classify_network_error(http_error(503)), RETRY)
+        self.assertEqual(classify_network_error(urllib2.URLError('down')), RETRY)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_and_resets(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+        breaker.record_failure('example.com')
+        self.assertFalse(breaker.is_open('example.com'))
+        breaker.record_failure('example.com')
+        self.assertTrue(breaker.is_open('example.com'))
+        self.assertTrue(breaker.allow('other.com'))
+        # reset_timeout has passed, so a trial attempt is allowed.
+        self.assertTrue(breaker.allow('example.com'))
+        breaker.record_success('example.com')
+        self.assertFalse(breaker.is_open('example.com'))
+
+    def test_stays_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure('example.com')
+        self.assertFalse(breaker.allow('example.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
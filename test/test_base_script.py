@@ -2,6 +2,10 @@ import gc
 import mock
 import os
 import re
+import subprocess
+import sys
+import threading
+import time
 import types
 import unittest
 PYWIN32 = False
@@ -17,6 +21,7 @@ import mozharness.base.errors as errors
 import mozharness.base.log as log
 from mozharness.base.log import DEBUG, INFO, WARNING, ERROR, CRITICAL, FATAL, IGNORE
 import mozharness.base.script as script
+from mozharness.base.retry import RetryPolicy, CircuitBreaker, GIVE_UP
 from mozharness.base.config import parse_config_file
 
 test_string = '''foo
@@ -285,6 +290,60 @@ class TestHelperFunctions(unittest.TestCase):
         self.assertEqual(test_string, contents,
                          msg="get_output_from_command('cat file') differs from fh.write")
 
+    def test_get_output_from_command_no_tmpfiles(self):
+        self.s = script.BaseScript(initial_config_file='test/test.json')
+        output = self.s.get_output_from_command(["bash", "-c", "echo foo; echo bar >&2"],
+                                                ignore_errors=True)
+        self.assertEqual(output, "foo")
+        self.assertFalse(os.path.exists("tmpfile_stdout"))
+        self.assertFalse(os.path.exists("tmpfile_stderr"))
+
+    def test_get_output_from_command_tail_lines(self):
+        self.s = script.BaseScript(initial_config_file='test/test.json')
+        output = self.s.get_output_from_command(["seq", "1000"], tail_lines=2)
+        self.assertEqual(output, "999\n1000")
+
+    def test_get_output_from_command_tail_lines_tmpfiles(self):
+        self.s = script.BaseScript(initial_config_file='test/test.json')
+        stdout_filename, stderr_filename = self.s.get_output_from_command(
+            ["seq", "1000"], tail_lines=2, return_type='files')
+        fh = open(stdout_filename)
+        self.assertEqual(len(fh.read().splitlines()), 1000)
+        fh.close()
+        output = self.s.get_output_from_command(
+            ["seq", "1000"], head_lines=1, tail_lines=1, save_tmpfiles=True)
+        self.assertEqual(output, "1\n1000")
+        fh = open('tmpfile_stdout')
+        self.assertEqual(fh.read(), "\n".join(map(str, range(1, 1001))) + "\n")
+        fh.close()
+
+    def test_run_commands_parallel(self):
+        self.s = get_debug_script_obj()
+        results = self.s.run_commands_parallel([
+            {'name': 'slow', 'command': 'sleep 1; echo slow1; echo slow2'},
+            {'name': 'fast', 'command': ['bash', '-c', 'echo fast1; echo fast2; exit 3']},
+            {'name': 'error', 'command': 'echo oops',
+             'error_list': [{'substr': 'oops', 'level': ERROR}]},
+        ], max_workers=3)
+        self.assertEqual([r['name'] for r in results], ['slow', 'fast', 'error'])
+        self.assertEqual([r['return_code'] for r in results], [0, 3, 0])
+        self.assertEqual([r['num_errors'] for r in results], [0, 0, 1])
+        fh = open('test_logs/test_info.log')
+        contents = fh.read()
+        fh.close()
+        # Each command's output is logged as one block, in the order
+        # they finished.
+        self.assertTrue(re.search(r'fast output begins\n.* fast1\n.* fast2\n', contents))
+        self.assertTrue(re.search(r'slow output begins\n.* slow1\n.* slow2\n', contents))
+        self.assertTrue(contents.index('fast1') < contents.index('slow1'))
+
+    def test_run_commands_parallel_halt_on_failure(self):
+        self.s = get_debug_script_obj()
+        self.assertRaises(SystemExit, self.s.run_commands_parallel,
+                          ['true', 'false'], halt_on_failure=True,
+                          fatal_exit_code=5)
+        self.assertEqual(self.s.return_code, 5)
+
     def test_run_command(self):
         self._create_temp_file()
         self.s = script.BaseScript(initial_config_file='test/test.json')
@@ -293,6 +352,14 @@ class TestHelperFunctions(unittest.TestCase):
                                             cwd="test_dir"), 0,
                          msg="run_command('cat file') did not exit 0")
 
+    def test_run_command_output_timeout(self):
+        self.s = get_debug_script_obj()
+        self.assertNotEqual(self.s.run_command("echo started; sleep 30",
+                                               output_timeout=1), 0)
+        error_logsize = os.path.getsize("test_logs/test_error.log")
+        self.assertTrue(error_logsize > 0,
+                        msg="output_timeout error not hit")
+
     def test_move1(self):
         self._create_temp_file()
         self.s = script.BaseScript(initial_config_file='test/test.json')
@@ -614,6 +681,44 @@ class TestRetry(unittest.TestCase):
         self.assertEqual(ret[0], args)
         self.assertEqual(ret[1], kwargs)
 
+    def testRetryPolicyGivesUp(self):
+        policy = RetryPolicy(sleeptime=0,
+                                    classifier=lambda exception, status: GIVE_UP)
+        ret = self.s.retry(self._alwaysFail, attempts=5, policy=policy)
+        self.assertEqual(ret, -1)
+
+    def testRetryPolicyTimeBudget(self):
+        policy = RetryPolicy(sleeptime=10, max_elapsed=5)
+        ret = self.s.retry(self._alwaysPass, attempts=5, good_statuses=(False, ),
+                           policy=policy)
+        self.assertEqual(ret, -1)
+        self.assertEqual(self.ATTEMPT_N, 2)
+
+    def testRetryOnlyTimeBudget(self):
+        now = [0]
+        clock = mock.Mock()
+        clock.time = lambda: now[0]
+        clock.sleep = lambda seconds: now.__setitem__(0, now[0] + seconds)
+        policy = RetryPolicy(sleeptime=10, max_sleeptime=10, max_elapsed=100)
+        with mock.patch.object(script, 'time', clock):
+            ret = self.s.retry(self._alwaysPass, attempts=None,
+                               good_statuses=(False, ), policy=policy)
+        self.assertEqual(ret, -1)
+        # Calls at 0, 10, ... 100 seconds.
+        self.assertEqual(self.ATTEMPT_N - 1, 11)
+        self.assertRaises(SystemExit, self.s.retry, self._alwaysPass,
+                          attempts=None, sleeptime=0)
+
+    def testRetryCircuitBreaker(self):
+        self.s.circuit_breaker = CircuitBreaker(failure_threshold=2)
+        self.s.retry(self._alwaysPass, attempts=5, sleeptime=0,
+                     good_statuses=(False, ), circuit_key='example.com')
+        self.assertEqual(self.ATTEMPT_N, 3)
+        # The circuit is open, so later calls don't try at all.
+        ret = self.s.retry(self._alwaysPass, sleeptime=0, circuit_key='example.com')
+        self.assertEqual(ret, -1)
+        self.assertEqual(self.ATTEMPT_N, 3)
+
 
 class BaseScriptWithDecorators(script.BaseScript):
     def __init__(self, *args, **kwargs):
@@ -809,6 +914,96 @@ class TestScriptDecorators(unittest.TestCase):
         self.assertEqual(len(self.s.post_run_2_args), 1)
 
 
+class ParallelScript(script.BaseScript):
+    # b and c only need a, so they can run at the same time; d waits
+    # for all of them.
+    action_dependencies = {'b': ['a'], 'c': ['a']}
+
+    def __init__(self, **kwargs):
+        self.events = []
+        self.c_started = threading.Event()
+        self.fail_in = None
+        super(ParallelScript, self).__init__(
+            initial_config_file='test/test.json',
+            all_actions=['a', 'b', 'c', 'd'],
+            config={'parallel_actions': True}, **kwargs)
+
+    def _action(self, name):
+        self.events.append((name, self.log_obj.thread_state.prefix))
+        if name == self.fail_in:
+            self.fatal("Failing in %s" % name)
+
+    def a(self):
+        self._action('a')
+
+    def b(self):
+        # Only returns early if c is running alongside it.
+        self.c_started.wait(10)
+        self._action('b')
+
+    def c(self):
+        self.c_started.set()
+        self._action('c')
+
+    def d(self):
+        self._action('d')
+
+
+class TestParallelActions(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+
+    def tearDown(self):
+        cleanup()
+
+    def test_dependencies(self):
+        s = ParallelScript()
+        self.assertEqual(s.query_action_dependencies('a'), [])
+        self.assertEqual(s.query_action_dependencies('c'), ['a'])
+        self.assertEqual(s.query_action_dependencies('d'), ['a', 'b', 'c'])
+        s.action_dependencies = {'b': ['c']}
+        self.assertRaises(SystemExit, s.query_action_dependencies, 'b')
+
+    def test_run(self):
+        s = ParallelScript()
+        start = time.time()
+        s.run()
+        self.assertTrue(time.time() - start < 10)
+        self.assertEqual(s.events[0], ('a', '[a] '))
+        self.assertEqual(sorted(s.events[1:3]), [('b', '[b] '), ('c', '[c] ')])
+        self.assertEqual(s.events[3], ('d', '[d] '))
+
+    def test_failure(self):
+        s = ParallelScript()
+        s.fail_in = 'c'
+        self.assertRaises(SystemExit, s.run)
+        self.assertEqual(sorted(e[0] for e in s.events), ['a', 'b', 'c'])
+
+
+class TestLazyImports(unittest.TestCase):
+    # Modules only some actions need; importing the script base classes
+    # shouldn't load them.
+    lazy_modules = ('httplib', 'inspect', 'multiprocessing',
+                    'multiprocessing.pool', 'platform', 'random', 'socket',
+                    'ssl', 'tarfile', 'tempfile', 'urllib2', 'uuid', 'zipfile',
+                    'mozharness.base.checkpoint', 'mozharness.base.copier',
+                    'mozharness.base.extract', 'mozharness.base.hashing',
+                    'mozharness.base.resources', 'mozharness.base.trace',
+                    'mozharness.base.transfer')
+
+    def test_lazy_imports(self):
+        code = '''import sys
+import mozharness.base.script
+import mozharness.base.python
+import mozharness.base.vcs.vcsbase
+import mozharness.mozilla.building.buildbase
+import mozharness.mozilla.testing.testbase
+print " ".join(m for m in %r if sys.modules.get(m))''' % (self.lazy_modules,)
+        output = subprocess.Popen([sys.executable, '-c', code],
+                                  stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual(output.strip(), '')
+
+
 # main {{{1
 if __name__ == '__main__':
     unittest.main()
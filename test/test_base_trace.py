@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+import sys
+import unittest
+
+import mozharness.base.script as script
+from mozharness.base.trace import Tracer, NULL_SPAN, query_command_name
+
+tmp_dir = "test_trace_dir"
+
+
+def cleanup():
+    for path in (tmp_dir, 'test_logs'):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+
+class TracedScript(script.BaseScript):
+    def __init__(self, **kwargs):
+        super(TracedScript, self).__init__(
+            initial_config_file='test/test.json', all_actions=['build'],
+            **kwargs)
+
+    def preflight_build(self):
+        pass
+
+    def build(self):
+        self.run_command([sys.executable, '-c', 'print "hello"'])
+        self.get_output_from_command([sys.executable, '-c', 'print "hi"'])
+
+
+class TestTracer(unittest.TestCase):
+    def test_span(self):
+        tracer = Tracer(process_name='test')
+        with tracer.span('outer', 'test', a=1) as span:
+            span.set(b=2)
+            callback = span.count_output(lambda data: None)
+            callback(['abc', 'de'])
+            callback('fghi')
+        trace = tracer.query_trace()
+        events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['name'], 'outer')
+        self.assertEqual(events[0]['args'],
+                         {'a': 1, 'b': 2, 'output_bytes': 11})
+        names = [e['name'] for e in trace['traceEvents'] if e['ph'] == 'M']
+        self.assertEqual(sorted(names), ['process_name', 'thread_name'])
+
+    def test_exception(self):
+        tracer = Tracer()
+        try:
+            with tracer.span('broken', 'test'):
+                raise ValueError
+        except ValueError:
+            pass
+        span = tracer.span('finished', 'test')
+        span.finish(exit_code=1)
+        span.finish(exit_code=2)
+        self.assertEqual([e['args'] for e in tracer.events],
+                         [{'exception': 'ValueError'}, {'exit_code': 1}])
+
+    def test_null_span(self):
+        callback = lambda data: None
+        self.assertTrue(NULL_SPAN.count_output(callback) is callback)
+        with NULL_SPAN as span:
+            span.set(a=1)
+            span.finish()
+
+    def test_command_name(self):
+        self.assertEqual(query_command_name(['/usr/bin/hg', 'pull']), 'hg')
+        self.assertEqual(query_command_name('make -j4'), 'make')
+
+
+class TestScriptTrace(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+
+    def tearDown(self):
+        cleanup()
+
+    def test_disabled(self):
+        s = TracedScript(config={'base_work_dir': os.path.abspath(tmp_dir),
+                                 'copy_logs_post_run': False})
+        self.assertTrue(s.trace_span('x', 'test') is NULL_SPAN)
+        s.run()
+        self.assertFalse(os.path.exists(
+            os.path.join(s.query_abs_dirs()['abs_upload_dir'], 'trace.json')))
+
+    def test_trace(self):
+        s = TracedScript(config={'base_work_dir': os.path.abspath(tmp_dir),
+                                 'copy_logs_post_run': False,
+                                 'trace': True})
+        s.run()
+        trace_file = os.path.join(s.query_abs_dirs()['abs_upload_dir'],
+                                  'trace.json')
+        fh = open(trace_file)
+        events = [e for e in json.load(fh)['traceEvents'] if e['ph'] == 'X']
+        fh.close()
+        spans = [(e['cat'], e['name']) for e in events]
+        for span in [('script', 'run'), ('action', 'build'),
+                     ('method', 'preflight_build'), ('method', 'build')]:
+            self.assertTrue(span in spans, span)
+        commands = [e['args'] for e in events if e['cat'] == 'command']
+        self.assertEqual([(c['exit_code'], c['output_bytes']) for c in commands],
+                         [(0, 6), (0, 3)])
+        self.assertEqual(commands[0]['argv'][1:],
+                         ['-c', 'print "hello"'])
+
+
+if __name__ == '__main__':
+    unittest.main()
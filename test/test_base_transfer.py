@@ -0,0 +1,192 @@
+import BaseHTTPServer
+import os
+import re
+import shutil
+import threading
+import time
+import unittest
+
+import mozharness.base.script as script
+from mozharness.base.transfer import DownloadCache
+
+tmp_dir = "test_transfer_dir"
+cache_dir = os.path.join(tmp_dir, "cache")
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    if os.path.exists('test_logs'):
+        shutil.rmtree('test_logs')
+
+
+def write_file(path, contents):
+    fh = open(path, 'wb')
+    fh.write(contents)
+    fh.close()
+
+
+def read_file(path):
+    fh = open(path, 'rb')
+    contents = fh.read()
+    fh.close()
+    return contents
+
+
+class TestDownloadCache(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.cache = DownloadCache(cache_dir, max_size=10)
+
+    def tearDown(self):
+        cleanup()
+
+    def _add(self, url, contents, **kwargs):
+        tmp_path = self.cache.query_tmp_path()
+        write_file(tmp_path, contents)
+        return self.cache.add(url, tmp_path, **kwargs)
+
+    def test_lookup_missing(self):
+        self.assertEqual(self.cache.lookup('http://example.com/foo'), None)
+
+    def test_add_and_copy_out(self):
+        self._add('http://example.com/foo', 'abc', validators={'etag': '"1"'})
+        entry = self.cache.lookup('http://example.com/foo')
+        self.assertEqual(entry['size'], 3)
+        self.assertTrue(self.cache.is_valid(entry, validators={'etag': '"1"'}))
+        self.assertFalse(self.cache.is_valid(entry, validators={'etag': '"2"'}))
+        dest = os.path.join(tmp_dir, 'foo')
+        self.assertTrue(self.cache.copy_out('http://example.com/foo', dest))
+        self.assertEqual(read_file(dest), 'abc')
+
+    def test_modified_entry_is_dropped(self):
+        self._add('http://example.com/foo', 'abc')
+        write_file(self.cache.query_data_path('http://example.com/foo'), 'abcd')
+        self.assertEqual(self.cache.lookup('http://example.com/foo'), None)
+
+    def test_lru_eviction(self):
+        self._add('http://example.com/old', 'aaaa')
+        self._add('http://example.com/used', 'bbbb')
+        time.sleep(0.01)
+        self.cache.touch('http://example.com/old')
+        self._add('http://example.com/new', 'cccc')
+        self.assertNotEqual(self.cache.lookup('http://example.com/old'), None)
+        self.assertEqual(self.cache.lookup('http://example.com/used'), None)
+        self.assertNotEqual(self.cache.lookup('http://example.com/new'), None)
+
+
+class TestCachedDownloadFile(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.src = os.path.abspath(os.path.join(tmp_dir, 'src.txt'))
+        write_file(self.src, 'cached contents')
+        self.url = 'file://%s' % self.src
+        self.s = script.BaseScript(
+            initial_config_file='test/test.json',
+            config={'download_cache_dir': cache_dir},
+        )
+
+    def tearDown(self):
+        del(self.s)
+        cleanup()
+
+    def test_download_populates_cache(self):
+        dest = self.s.download_file(self.url, parent_dir=os.path.join(tmp_dir, 'a'))
+        self.assertEqual(read_file(dest), 'cached contents')
+        entry = self.s.query_download_cache().lookup(self.url)
+        self.assertEqual(entry['size'], len('cached contents'))
+
+    def test_cache_hit_by_sha512(self):
+        self.s.download_file(self.url, parent_dir=os.path.join(tmp_dir, 'a'))
+        sha512 = self.s.query_download_cache().lookup(self.url)['sha512']
+        # A hit on a known hash doesn't need the original to exist.
+        os.remove(self.src)
+        dest = self.s.download_file(self.url, parent_dir=os.path.join(tmp_dir, 'b'),
+                                    expected_sha512=sha512)
+        self.assertEqual(read_file(dest), 'cached contents')
+
+    def test_bad_sha512(self):
+        status = self.s.download_file(self.url, parent_dir=os.path.join(tmp_dir, 'a'),
+                                      expected_sha512='0' * 128)
+        self.assertEqual(status, None)
+
+
+PAYLOAD = ''.join(chr(i % 256) for i in range(100000))
+
+
+class RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requested_ranges.append(self.headers.get('Range'))
+        m = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if m:
+            start = int(m.group(1))
+            end = int(m.group(2) or len(PAYLOAD) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(PAYLOAD)))
+        else:
+            start, end = 0, len(PAYLOAD) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(PAYLOAD[start:end + 1])
+
+
+class TestRangedDownload(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.requested_ranges = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d/payload' % self.server.server_port
+        self.dest = os.path.join(tmp_dir, 'payload')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        del(self.s)
+        cleanup()
+
+    def test_resume(self):
+        self.s = script.BaseScript(initial_config_file='test/test.json')
+        write_file('%s.part' % self.dest, PAYLOAD[:1234])
+        self.s._download_file(self.url, self.dest)
+        self.assertEqual(self.server.requested_ranges, ['bytes=1234-'])
+        self.assertEqual(read_file(self.dest), PAYLOAD)
+        self.assertFalse(os.path.exists('%s.part' % self.dest))
+
+    def test_stale_partial_is_not_resumed(self):
+        self.s = script.BaseScript(initial_config_file='test/test.json')
+        write_file('%s.part' % self.dest, 'garbage')
+        self.s.download_file(self.url, file_name=self.dest)
+        self.assertEqual(self.server.requested_ranges, [None])
+        self.assertEqual(read_file(self.dest), PAYLOAD)
+
+    def test_parallel(self):
+        self.s = script.BaseScript(
+            initial_config_file='test/test.json',
+            config={'download_connections': 4,
+                    'download_parallel_min_size': 1},
+        )
+        self.s.download_file(self.url, file_name=self.dest)
+        self.assertEqual(sorted(self.server.requested_ranges),
+                         ['bytes=0-24999', 'bytes=25000-49999',
+                          'bytes=50000-74999', 'bytes=75000-99999'])
+        self.assertEqual(read_file(self.dest), PAYLOAD)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import unittest
+
+import mozharness.base.script as script
+import mozharness.base.trash as trash
+from mozharness.base.trash import DeferredDeleter, query_default_trash_dir
+
+tmp_dir = "test_trash_dir"
+trash_dir = os.path.join(tmp_dir, 'trash')
+
+
+def cleanup():
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    if os.path.exists('test_logs'):
+        shutil.rmtree('test_logs')
+
+
+def make_tree(path):
+    os.makedirs(os.path.join(path, 'a', 'b'))
+    for name in ('x', os.path.join('a', 'y'), os.path.join('a', 'b', 'z')):
+        fh = open(os.path.join(path, name), 'w')
+        fh.write(name)
+        fh.close()
+
+
+class TestDeferredDeleter(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.trash_dir = os.path.abspath(trash_dir)
+
+    def tearDown(self):
+        cleanup()
+
+    def test_default_trash_dir(self):
+        self.assertEqual(query_default_trash_dir('/builds/slave/work'),
+                         '/builds/slave/.mozharness_trash')
+
+    def test_delete(self):
+        path = os.path.join(tmp_dir, 'objdir')
+        make_tree(path)
+        deleter = DeferredDeleter(trash_dir)
+        dest = deleter.delete(path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(dest.startswith(self.trash_dir))
+        self.assertEqual(deleter.join(), [])
+        self.assertFalse(os.path.exists(os.path.dirname(dest)))
+
+    def test_file_is_not_deferred(self):
+        path = os.path.join(tmp_dir, 'file')
+        open(path, 'w').close()
+        self.assertEqual(DeferredDeleter(trash_dir).delete(path), None)
+        self.assertTrue(os.path.exists(path))
+
+    def test_other_volume_is_not_deferred(self):
+        path = os.path.join(tmp_dir, 'objdir')
+        make_tree(path)
+        deleter = DeferredDeleter(trash_dir)
+        deleter.prepare()
+        deleter.trash_device = -1
+        self.assertEqual(deleter.delete(path), None)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.listdir(trash_dir), [])
+
+    def test_failed_rename(self):
+        path = os.path.join(tmp_dir, 'objdir')
+        make_tree(path)
+        deleter = DeferredDeleter(trash_dir)
+        orig_rename, orig_rmdir = os.rename, os.rmdir
+
+        def fail(*args):
+            raise OSError("nope")
+        trash.os.rename = trash.os.rmdir = fail
+        try:
+            self.assertEqual(deleter.delete(path), None)
+        finally:
+            trash.os.rename, trash.os.rmdir = orig_rename, orig_rmdir
+        self.assertTrue(os.path.exists(path))
+
+    def test_purge_leftovers(self):
+        deleter = DeferredDeleter(trash_dir)
+        deleter.prepare()
+        # A leftover from a run that died, and one from a live process.
+        stale = os.path.join(self.trash_dir, '999999999-dead')
+        live = os.path.join(self.trash_dir, '%d-live' % os.getpid())
+        make_tree(stale)
+        os.makedirs(live)
+        self.assertEqual(deleter.purge_trash_dir(), [stale])
+        deleter.join()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(live))
+
+
+class TestDeferredRmtree(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        os.makedirs(tmp_dir)
+        self.trash_dir = os.path.abspath(trash_dir)
+        self.s = script.BaseScript(initial_config_file='test/test.json',
+                                   config={'deferred_delete': True,
+                                           'deferred_delete_dir': trash_dir})
+
+    def tearDown(self):
+        del(self.s)
+        cleanup()
+
+    def test_rmtree(self):
+        path = os.path.join(tmp_dir, 'objdir')
+        make_tree(path)
+        self.assertEqual(self.s.rmtree(path), None)
+        self.assertFalse(os.path.exists(path))
+        self.s.wait_for_deferred_deletes()
+        mine = [name for name in os.listdir(self.trash_dir)
+                if name.startswith('%d-' % os.getpid())]
+        self.assertEqual(mine, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
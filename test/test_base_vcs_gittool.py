@@ -0,0 +1,64 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from mozharness.base.errors import VCSException
+from mozharness.base.vcs.gittool import GittoolVCS
+
+
+def git(args, cwd):
+    return subprocess.check_output(['git'] + args, cwd=cwd).strip()
+
+
+class TestGittool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.repodir = os.path.join(self.tmpdir, 'repo')
+        self.wc = os.path.join(self.tmpdir, 'wc')
+        os.mkdir(self.repodir)
+        git(['init', '-q'], self.repodir)
+        self.revisions = []
+        for i in range(2):
+            open(os.path.join(self.repodir, 'hello.txt'), 'w').write(str(i))
+            git(['add', 'hello.txt'], self.repodir)
+            git(['-c', 'user.name=Test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'Change %d' % i], self.repodir)
+            self.revisions.append(git(['rev-parse', 'HEAD'], self.repodir))
+        git(['clone', '-q', self.repodir, self.wc], self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_gittool_vcs_obj(self, **kwargs):
+        vcs_config = {'repo': self.repodir, 'dest': self.wc}
+        vcs_config.update(kwargs)
+        g = GittoolVCS(vcs_config=vcs_config)
+        # Any run of gittool.py fails the checkout.
+        g.gittool = ['false']
+        return g
+
+    def test_has_revision(self):
+        g = self.get_gittool_vcs_obj()
+        self.assertTrue(g.has_revision(self.wc, self.revisions[0]))
+        self.assertFalse(g.has_revision(self.wc, self.revisions[0][:12]))
+        self.assertFalse(g.has_revision(self.wc, 'master'))
+        self.assertFalse(g.has_revision(self.wc, 'f' * 40))
+        self.assertFalse(g.has_revision(self.repodir + '-missing',
+                                        self.revisions[0]))
+
+    def test_local_revision(self):
+        open(os.path.join(self.wc, 'untracked.txt'), 'w').write('junk')
+        g = self.get_gittool_vcs_obj(revision=self.revisions[0], clean=True)
+        self.assertEqual(g.ensure_repo_and_revision(), self.revisions[0])
+        self.assertEqual(git(['rev-parse', 'HEAD'], self.wc), self.revisions[0])
+        self.assertFalse(os.path.exists(os.path.join(self.wc, 'untracked.txt')))
+
+    def test_missing_revision(self):
+        g = self.get_gittool_vcs_obj(revision='f' * 40)
+        self.assertRaises(VCSException, g.ensure_repo_and_revision)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,9 @@ import unittest
 
 import mozharness.base.errors as errors
 import mozharness.base.vcs.mercurial as mercurial
+from mozharness.base.vcs.hgcmdserver import HgCommandServer, \
+    HgCommandServerPool
+from mozharness.base.vcs.sharedrepo import SharedRepoLock, read_sync_record
 
 test_string = '''foo
 bar
@@ -93,6 +96,24 @@ class TestHg(unittest.TestCase):
         shutil.rmtree(self.tmpdir)
         os.chdir(self.pwd)
 
+    def test_can_share_cached(self):
+        mercurial.MercurialVCS.hg_can_share.clear()
+        commands = []
+        m = get_mercurial_vcs_obj()
+        orig_get_output = m.get_output_from_command
+
+        def get_output(command, **kwargs):
+            commands.append(command)
+            return orig_get_output(command, **kwargs)
+        m.get_output_from_command = get_output
+        self.assertTrue(m.query_can_share())
+        self.assertEquals(len(commands), 1)
+        # Another instance with the same hg doesn't run it again.
+        m2 = get_mercurial_vcs_obj()
+        m2.get_output_from_command = get_output
+        self.assertTrue(m2.query_can_share())
+        self.assertEquals(len(commands), 1)
+
     def test_get_branch(self):
         m = get_mercurial_vcs_obj()
         m.clone(self.repodir, self.wc)
@@ -332,6 +353,182 @@ class TestHg(unittest.TestCase):
         self.assertEquals(get_revisions(self.repodir), get_revisions(self.wc))
         self.assertEquals(get_revisions(self.repodir), get_revisions(sharerepo))
 
+    def _commit_to_repodir(self, m):
+        open(os.path.join(self.repodir, 'test.txt'), 'w').write('hello!')
+        m.run_command(HG + ['add', 'test.txt'], cwd=self.repodir)
+        m.run_command(HG + ['commit', '-m', 'adding changeset'], cwd=self.repodir)
+
+    def _count_pulls(self, m, share_base=None, dest=None):
+        if dest is None:
+            dest = os.path.join(share_base, self.repodir.lstrip("/"))
+        pulls = []
+        pull = m.pull
+
+        def counting_pull(repo, pull_dest, *args, **kwargs):
+            if pull_dest == dest:
+                pulls.append(repo)
+            return pull(repo, pull_dest, *args, **kwargs)
+        m.pull = counting_pull
+        return pulls
+
+    def test_mercurial_share_sync_window(self):
+        m = get_mercurial_vcs_obj()
+        share_base = os.path.join(self.tmpdir, 'share')
+        sharerepo = os.path.join(share_base, self.repodir.lstrip("/"))
+        vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                      'vcs_share_base': share_base,
+                      'vcs_share_sync_window': 3600}
+        m.vcs_config = vcs_config
+        m.ensure_repo_and_revision()
+        record = read_sync_record(sharerepo)
+        self.assertEquals(record['repo'], self.repodir)
+        self.assertEquals(len(record['heads']), 2)
+
+        # A sibling just pulled, so the new changeset isn't picked up.
+        self._commit_to_repodir(m)
+        m = get_mercurial_vcs_obj()
+        m.vcs_config = vcs_config
+        pulls = self._count_pulls(m, share_base)
+        m.ensure_repo_and_revision()
+        self.assertEquals(pulls, [])
+        self.assertEquals(get_revisions(sharerepo), self.revisions)
+
+        # Once the window is over, it is.
+        m = get_mercurial_vcs_obj()
+        m.vcs_config = dict(vcs_config, vcs_share_sync_window=0)
+        pulls = self._count_pulls(m, share_base)
+        m.ensure_repo_and_revision()
+        self.assertEquals(pulls, [self.repodir])
+        self.assertEquals(get_revisions(sharerepo), get_revisions(self.repodir))
+
+    def test_mercurial_share_pinned_revision(self):
+        m = get_mercurial_vcs_obj()
+        share_base = os.path.join(self.tmpdir, 'share')
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'vcs_share_base': share_base}
+        m.ensure_repo_and_revision()
+        revision = m.get_output_from_command(
+            HG + ['log', '-r', self.revisions[1], '--template', '{node}'],
+            cwd=self.repodir)
+        self._commit_to_repodir(m)
+
+        m = get_mercurial_vcs_obj()
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'vcs_share_base': share_base, 'revision': revision}
+        pulls = self._count_pulls(m, share_base)
+        self.assertEquals(m.ensure_repo_and_revision(), self.revisions[1])
+        self.assertEquals(pulls, [])
+
+        # A short id could be ambiguous after a pull, so it isn't trusted.
+        m = get_mercurial_vcs_obj()
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'vcs_share_base': share_base,
+                        'revision': self.revisions[1]}
+        pulls = self._count_pulls(m, share_base)
+        m.ensure_repo_and_revision()
+        self.assertEquals(pulls, [self.repodir])
+
+    def test_mercurial_pinned_revision(self):
+        m = get_mercurial_vcs_obj()
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc}
+        m.ensure_repo_and_revision()
+        revision = m.get_output_from_command(
+            HG + ['log', '-r', self.revisions[1], '--template', '{node}'],
+            cwd=self.repodir)
+        self._commit_to_repodir(m)
+
+        m = get_mercurial_vcs_obj()
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'revision': revision}
+        pulls = []
+        m.pull = lambda *args, **kwargs: pulls.append(args)
+        self.assertEquals(m.ensure_repo_and_revision(), self.revisions[1])
+        self.assertEquals(pulls, [])
+        self.assertEquals(get_revisions(self.wc), self.revisions)
+
+    def _make_bundle(self, m, revision):
+        bundle = os.path.join(self.tmpdir, 'repo.hg')
+        m.run_command(HG + ['bundle', '-r', revision, '--all', bundle],
+                      cwd=self.repodir)
+        return bundle
+
+    def test_clone_from_bundle(self):
+        m = get_mercurial_vcs_obj()
+        bundle = self._make_bundle(m, self.revisions[1])
+        self._commit_to_repodir(m)
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'clone_bundle': bundle}
+        pulls = self._count_pulls(m, dest=self.wc)
+        rev = m.clone(self.repodir, self.wc)
+        self.assertEquals(rev, get_revisions(self.repodir)[0])
+        self.assertEquals(sorted(get_revisions(self.wc)),
+                          sorted(get_revisions(self.repodir)))
+        self.assertEquals(pulls, [self.repodir])
+        self.assertEquals(m.get_output_from_command(HG + ['paths', 'default'],
+                                                    cwd=self.wc),
+                          self.repodir)
+        # The bundle is only for vcs_config['repo'].
+        m.clone(self.wc, os.path.join(self.tmpdir, 'wc2'), update_dest=False)
+        self.assertEquals(pulls, [self.repodir])
+
+    def test_clone_from_bundle_url(self):
+        m = get_mercurial_vcs_obj()
+        bundle = self._make_bundle(m, self.revisions[0])
+        url = 'http://bundles.example.com/repo.hg'
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'clone_bundle': url, 'clone_bundle_sha512': 'abc'}
+        downloads = []
+
+        def download_file(url, file_name=None, **kwargs):
+            downloads.append((url, kwargs['expected_sha512']))
+            shutil.copyfile(bundle, file_name)
+            return file_name
+        m.download_file = download_file
+        m.clone(self.repodir, self.wc, update_dest=False)
+        self.assertEquals(downloads, [(url, 'abc')])
+        self.assertEquals(sorted(get_revisions(self.wc)), sorted(self.revisions))
+        self.assertEquals(sorted(os.listdir(self.tmpdir)),
+                          ['repo', 'repo.hg', 'wc'])
+
+    def test_clone_from_bad_bundle(self):
+        m = get_mercurial_vcs_obj()
+        bundle = os.path.join(self.tmpdir, 'repo.hg')
+        open(bundle, 'w').write('not a bundle')
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'clone_bundle': bundle}
+        m.config = {'log_to_console': False}
+        rev = m.clone(self.repodir, self.wc)
+        self.assertEquals(rev, self.revisions[0])
+        self.assertEquals(get_revisions(self.wc), self.revisions)
+
+    def test_shared_repo_lock(self):
+        path = os.path.join(self.tmpdir, 'share', 'repo')
+        lock1 = SharedRepoLock(path)
+        lock2 = SharedRepoLock(path)
+        self.assertTrue(lock1.try_acquire())
+        self.assertFalse(lock2.try_acquire())
+        self.assertTrue(str(os.getpid()) in lock2.query_holder())
+        lock1.release()
+        self.assertTrue(lock2.try_acquire())
+        lock2.release()
+
+    def test_mercurial_share_lock_timeout(self):
+        m = get_mercurial_vcs_obj()
+        share_base = os.path.join(self.tmpdir, 'share')
+        sharerepo = os.path.join(share_base, self.repodir.lstrip("/"))
+        m.vcs_config = {'repo': self.repodir, 'dest': self.wc,
+                        'vcs_share_base': share_base,
+                        'vcs_share_lock_timeout': 0}
+        lock = SharedRepoLock(sharerepo)
+        self.assertTrue(lock.try_acquire())
+        try:
+            self.assertRaises(errors.VCSException, m.ensure_repo_and_revision)
+        finally:
+            lock.release()
+        self.assertFalse(os.path.exists(sharerepo))
+        m.ensure_repo_and_revision()
+        self.assertEquals(get_revisions(sharerepo), self.revisions)
+
     def test_mercurial_relative_dir(self):
         m = get_mercurial_vcs_obj()
         repo = os.path.basename(self.repodir)
@@ -413,6 +610,59 @@ class TestHg(unittest.TestCase):
             os.environ.clear()
             os.environ.update(old_env)
 
+    def test_command_server(self):
+        server = HgCommandServer(HG, self.repodir)
+        server.start()
+        try:
+            status, output, error = server.runcommand(
+                ['log', '-r', '0', '--template', '{node|short}'])
+            self.assertEquals((status, output), (0, self.revisions[-1]))
+            status, output, error = server.runcommand(['id', '-r', 'nosuchrev'])
+            self.assertNotEquals(status, 0)
+            self.assertTrue(error)
+        finally:
+            server.close()
+
+    def test_command_server_queries(self):
+        m = get_mercurial_vcs_obj()
+        m.clone(self.repodir, self.wc)
+        m.config = {'hg_command_server': True}
+        m.command_servers = HgCommandServerPool()
+        try:
+            self.assertEquals(m.get_revision_from_path(self.wc),
+                              self.revisions[0])
+            self.assertEquals(sorted(m.get_branches_from_path(self.wc)),
+                              ['branch2', 'default'])
+            self.assertEquals(m.query_revision_id(self.wc, 'tip'),
+                              self.revisions[0])
+            # Failing commands are run again without the server, to
+            # report the error.
+            self.assertEquals(m.query_revision_id(self.wc, 'nosuchrev'),
+                              None)
+            server = m.command_servers.servers.values()[0]
+            self.assertEquals(len(m.command_servers.servers), 1)
+
+            # A clobbered and cloned again repo gets a new server.
+            m.clone(self.repodir, self.wc, revision=self.revisions[-1])
+            self.assertEquals(m.get_revision_from_path(self.wc),
+                              self.revisions[-1])
+            self.assertFalse(m.command_servers.servers.values()[0] is server)
+        finally:
+            m.command_servers.close()
+
+    def test_command_server_unavailable(self):
+        m = get_mercurial_vcs_obj()
+        m.clone(self.repodir, self.wc)
+        m.config = {'hg_command_server': True}
+        m.command_servers = HgCommandServerPool()
+        m.command_servers.unavailable.add(tuple(m.hg))
+        self.assertEquals(m.get_revision_from_path(self.wc),
+                          self.revisions[0])
+        self.assertEquals(m.command_servers.servers, {})
+        pool = HgCommandServerPool()
+        self.assertEquals(pool.run(['false'], self.wc, ['id']), None)
+        self.assertTrue(('false',) in pool.unavailable)
+
     def test_make_hg_url(self):
         #construct an hg url specific to revision, branch and filename and try to pull it down
         file_url = mercurial.make_hg_url(
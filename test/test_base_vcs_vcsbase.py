@@ -0,0 +1,99 @@
+import gc
+import os
+import shutil
+import threading
+import unittest
+
+from mozharness.base.errors import VCSException
+from mozharness.base.vcs import vcsbase
+
+tmp_dir = "test_vcsbase_dir"
+
+
+def cleanup():
+    gc.collect()
+    for path in (tmp_dir, 'test_logs'):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+
+class FakeVCS(object):
+    """Checks out by writing the repo into dest/repo.txt.  Checkouts of
+    repos named 'block' wait until two are running at once.
+    """
+    running = []
+    both_running = threading.Event()
+
+    def __init__(self, log_obj=None, config=None, vcs_config=None,
+                 script_obj=None):
+        self.vcs_config = vcs_config
+
+    def ensure_repo_and_revision(self):
+        c = self.vcs_config
+        if c['repo'].endswith('fail'):
+            raise VCSException("Can't check out %s" % c['repo'])
+        if c['repo'].endswith('block'):
+            self.running.append(c['dest'])
+            if len(self.running) >= 2:
+                self.both_running.set()
+            self.both_running.wait(10)
+        os.makedirs(c['dest'])
+        fh = open(os.path.join(c['dest'], 'repo.txt'), 'w')
+        fh.write(c['repo'])
+        fh.close()
+        return c.get('revision') or 'tip'
+
+
+class TestCheckoutRepos(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        vcsbase.VCS_DICT['fake'] = FakeVCS
+        FakeVCS.running = []
+        FakeVCS.both_running.clear()
+        self.s = vcsbase.VCSScript(initial_config_file='test/test.json',
+                                   config={'global_retries': 1})
+        self.parent_dir = os.path.abspath(os.path.join(tmp_dir, 'repos'))
+
+    def tearDown(self):
+        del vcsbase.VCS_DICT['fake']
+        del self.s
+        cleanup()
+
+    def checkout(self, repos, **kwargs):
+        return self.s.vcs_checkout_repos(
+            [{'repo': 'http://hg.example.com/%s' % r, 'vcs': 'fake'}
+             for r in repos],
+            parent_dir=self.parent_dir, **kwargs)
+
+    def test_serial(self):
+        cwd = os.getcwd()
+        revisions = self.checkout(['a', 'b'], tag_override='v1')
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(revisions, {
+            'a': {'repo': 'http://hg.example.com/a', 'revision': 'v1'},
+            'b': {'repo': 'http://hg.example.com/b', 'revision': 'v1'},
+        })
+        fh = open(os.path.join(self.parent_dir, 'b', 'repo.txt'))
+        self.assertEqual(fh.read(), 'http://hg.example.com/b')
+        fh.close()
+
+    def test_concurrent(self):
+        cwd = os.getcwd()
+        revisions = self.checkout(['a', 'x-block', 'y-block', 'b'],
+                                  max_workers=2)
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertTrue(FakeVCS.both_running.is_set())
+        self.assertEqual(sorted(revisions.keys()),
+                         ['a', 'b', 'x-block', 'y-block'])
+        self.assertEqual(revisions['y-block']['revision'], 'tip')
+        for dest in revisions:
+            self.assertTrue(os.path.exists(
+                os.path.join(self.parent_dir, dest, 'repo.txt')))
+
+    def test_concurrent_failure(self):
+        self.assertRaises(SystemExit, self.checkout, ['a', 'fail', 'b'],
+                          max_workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
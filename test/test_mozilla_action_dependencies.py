@@ -0,0 +1,62 @@
+import glob
+import imp
+import inspect
+import os
+import unittest
+
+from mozharness.base.script import BaseScript
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scripts')
+
+
+def load_script_classes():
+    """Return every BaseScript subclass the scripts define or use."""
+    classes = set()
+    for path in sorted(glob.glob(os.path.join(SCRIPTS_DIR, '*.py'))):
+        name = 'script_%s' % os.path.basename(path)[:-3]
+        module = imp.load_source(name, path)
+        for value in vars(module).values():
+            if inspect.isclass(value) and issubclass(value, BaseScript):
+                classes.add(value)
+    return classes
+
+
+def query_all_dependencies(cls, action):
+    """Return everything action transitively depends on, as declared."""
+    dependencies = set()
+    pending = list(cls.action_dependencies.get(action, []))
+    while pending:
+        dependency = pending.pop()
+        if dependency not in dependencies:
+            dependencies.add(dependency)
+            pending.extend(cls.action_dependencies.get(dependency, []))
+    return dependencies
+
+
+class TestScriptActionDependencies(unittest.TestCase):
+    def test_buildbot_config(self):
+        """An action that reads buildbot_config mustn't start before
+        read-buildbot-config has finished."""
+        checked = set()
+        for cls in load_script_classes():
+            if not hasattr(cls, 'read_buildbot_config'):
+                continue
+            for action in cls.action_dependencies:
+                method = getattr(cls, action.replace('-', '_'), None)
+                if method is None:
+                    continue
+                if 'buildbot_config' in inspect.getsource(method):
+                    checked.add((cls.__name__, action))
+                    self.assertTrue(
+                        'read-buildbot-config' in
+                        query_all_dependencies(cls, action),
+                        "%s's %s reads buildbot_config, but can run before "
+                        "read-buildbot-config" % (cls.__name__, action))
+        # The pulls that pick gaia's revision from buildbot_config.
+        self.assertTrue(('MarionetteTest', 'pull') in checked)
+        self.assertTrue(('GaiaUnitTest', 'pull') in checked)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import gc
+import os
+import shutil
+import unittest
+import urllib2
+from StringIO import StringIO
+
+import mozharness.base.script as script
+from mozharness.base.retry import classify_mapper_error, RETRY, GIVE_UP
+from mozharness.mozilla.mapper import MapperMixin
+
+MAPPER_URL = 'http://mapper.example.com/{project}/{vcs}/{rev}'
+
+
+def cleanup():
+    gc.collect()
+    if os.path.exists('test_logs'):
+        shutil.rmtree('test_logs')
+
+
+def http_error(code):
+    return urllib2.HTTPError('http://mapper.example.com', code, 'msg', {}, None)
+
+
+class MapperScript(script.BaseScript, MapperMixin):
+    def __init__(self):
+        super(MapperScript, self).__init__(initial_config_file='test/test.json')
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestQueryMapper(unittest.TestCase):
+    def setUp(self):
+        cleanup()
+        self.s = MapperScript()
+        self.clock = FakeClock()
+        self.orig_time = script.time
+        script.time = self.clock
+        self.orig_urlopen = urllib2.urlopen
+        self.answers = []
+        self.queries = []
+        urllib2.urlopen = self.urlopen
+
+    def tearDown(self):
+        urllib2.urlopen = self.orig_urlopen
+        script.time = self.orig_time
+        del self.s
+        cleanup()
+
+    def urlopen(self, url, timeout=None):
+        self.queries.append(url)
+        answer = self.answers.pop(0) if self.answers else http_error(404)
+        if isinstance(answer, Exception):
+            raise answer
+        return StringIO(answer)
+
+    def test_classify(self):
+        self.assertEqual(classify_mapper_error(http_error(404)), RETRY)
+        self.assertEqual(classify_mapper_error(http_error(503)), RETRY)
+        self.assertEqual(classify_mapper_error(http_error(403)), GIVE_UP)
+
+    def test_waits_for_mapping(self):
+        self.answers = [http_error(404)] * 10 + ['{"git_rev": "abcdef"}']
+        self.assertEqual(self.s.query_mapper_git_revision(
+            MAPPER_URL, 'gecko', '123456'), 'abcdef')
+        self.assertEqual(len(self.queries), 11)
+
+    def test_404_until_budget(self):
+        # attempts * sleeptime is a 15 minute budget.
+        self.assertRaises(SystemExit, self.s.query_mapper_git_revision,
+                          MAPPER_URL, 'gecko', '123456', attempts=30,
+                          sleeptime=30)
+        self.assertTrue(len(self.queries) > 30)
+        elapsed = self.clock.now - 1000.0
+        self.assertTrue(15 * 60 - 30 <= elapsed <= 15 * 60, elapsed)
+
+
+if __name__ == '__main__':
+    unittest.main()